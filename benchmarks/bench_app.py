@@ -0,0 +1,20 @@
+"""
+URLs, user serializer and custom claim getters of the benchmarked project.
+"""
+from django.contrib.auth import get_user_model
+from django.urls import include, path
+from rest_framework import serializers
+
+urlpatterns = [
+    path("auth/", include("rest_framework_microservice.urls")),
+]
+
+
+class UserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = get_user_model()
+        fields = ["id", "username", "email", "first_name", "last_name", "is_staff", "date_joined"]
+
+
+def get_claim(user):
+    return f"{user.username}:{user.pk}"
@@ -0,0 +1,90 @@
+"""
+Local stand-in of an AWS Cognito user pool: an RSA signing key generated at startup, its JWKS document served over
+HTTP from a background thread, and id tokens signed with it.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+
+class FakeCognito:
+
+    def __init__(self, region="us-west-2", user_pool="us-west-2_benchmark", client_id="benchmark", kid="benchmark"):
+        self.region = region
+        self.user_pool = user_pool
+        self.client_id = client_id
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.jwks_requests = 0
+        self.server = None
+
+        jwk = json.loads(RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        jwk.update(kid=kid, alg="RS256", use="sig")
+        self.jwks = json.dumps({"keys": [jwk]}).encode()
+
+    @property
+    def issuer(self):
+        return f"https://cognito-idp.{self.region}.amazonaws.com/{self.user_pool}"
+
+    @property
+    def jwks_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/.well-known/jwks.json"
+
+    def get_idp_setting(self):
+        return {"PROVIDER": "aws", "REGION": self.region, "USER_POOL": self.user_pool, "CLIENT_ID": self.client_id,
+                "JWKS_URL": self.jwks_url}
+
+    def start(self):
+        cognito = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/.well-known/jwks.json":
+                    self.send_error(404)
+                    return
+                cognito.jwks_requests += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Cache-Control", "max-age=3600")
+                self.send_header("Content-Length", str(len(cognito.jwks)))
+                self.end_headers()
+                self.wfile.write(cognito.jwks)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def id_token(self, sub, email, lifetime=3600):
+        """Sign an id token, unique per call like the ones issued by Cognito."""
+        now = int(time.time())
+        payload = {
+            "sub": sub,
+            "aud": self.client_id,
+            "iss": self.issuer,
+            "token_use": "id",
+            "email": email,
+            "email_verified": True,
+            "cognito:username": email.split("@")[0],
+            "given_name": "Bench",
+            "family_name": "Mark",
+            "auth_time": now,
+            "iat": now,
+            "exp": now + lifetime,
+            "jti": str(uuid.uuid4()),
+        }
+        return jwt.encode(payload, self.private_key, algorithm="RS256", headers={"kid": self.kid})
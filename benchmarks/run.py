@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the authentication endpoints, run in-process against a temporary SQLite database and a local stand-in
+of AWS Cognito. Each scenario is run for every combination of number of custom claims, USER_SERIALIZER_CLASS and
+size of the user table, reporting operations per second, p50/p99 latency and database queries per request.
+
+    python benchmarks/run.py --save benchmarks/baseline.json
+    python benchmarks/run.py --compare benchmarks/baseline.json
+
+Comparing with a baseline exits with status 1 if any result lost more than `--threshold` percent of its throughput,
+or makes more queries per request.
+"""
+import argparse
+import asyncio
+import gc
+import io
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIR)
+sys.path.insert(1, os.path.dirname(BENCHMARKS_DIR))
+
+from fake_cognito import FakeCognito  # noqa: E402
+
+SCENARIOS = ["sign-in", "refresh", "refresh-rotate", "refresh-rotate-blacklist", "social-exchange", "verify",
+             "logoff"]
+PASSWORD = "benchmark-password"
+PASSWORD_HASHERS = {
+    "pbkdf2": ["django.contrib.auth.hashers.PBKDF2PasswordHasher"],
+    "md5": ["django.contrib.auth.hashers.MD5PasswordHasher"],
+}
+USER_SERIALIZERS = {"none": None, "model": "bench_app.UserSerializer"}
+SIMPLE_JWT_SETTINGS = {
+    "refresh": {"ROTATE_REFRESH_TOKENS": False, "BLACKLIST_AFTER_ROTATION": False},
+    "refresh-rotate": {"ROTATE_REFRESH_TOKENS": True, "BLACKLIST_AFTER_ROTATION": False},
+    "refresh-rotate-blacklist": {"ROTATE_REFRESH_TOKENS": True, "BLACKLIST_AFTER_ROTATION": True},
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--claims", nargs="+", type=int, default=[0, 10],
+                        help="numbers of custom token claims (CUSTOM_TOKEN_CALLABLE_ATTRIBUTES)")
+    parser.add_argument("--user-serializers", nargs="+", choices=USER_SERIALIZERS, default=["none", "model"],
+                        help="USER_SERIALIZER_CLASS: none, or a ModelSerializer of the user")
+    parser.add_argument("--users", nargs="+", type=int, default=[1, 10000], help="sizes of the user table")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--password-hasher", choices=PASSWORD_HASHERS, default="pbkdf2")
+    parser.add_argument("--async-views", action="store_true", help="benchmark the views enabled by ASYNC_VIEWS")
+    parser.add_argument("--save", metavar="PATH", help="save results as JSON, ie: as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare results with a baseline saved using --save")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percentage of lost throughput reported as a regression when comparing, defaults to 10")
+    return parser.parse_args(argv)
+
+
+def configure(args, database_path, cognito):
+    from django.conf import settings
+
+    settings.configure(
+        DEBUG=False,
+        SECRET_KEY="benchmark-secret-key-which-is-long-enough-for-hs256-signing",
+        ALLOWED_HOSTS=["testserver"],
+        ROOT_URLCONF="bench_app",
+        INSTALLED_APPS=[
+            "django.contrib.contenttypes",
+            "django.contrib.auth",
+            "rest_framework",
+            "rest_framework_simplejwt.token_blacklist",
+            "rest_framework_microservice",
+        ],
+        MIDDLEWARE=[],
+        DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": database_path}},
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+        PASSWORD_HASHERS=PASSWORD_HASHERS[args.password_hasher],
+        USE_TZ=True,
+        LOGGING_CONFIG=None,
+        REST_FRAMEWORK_MICROSERVICE=get_microservice_settings(args, cognito),
+    )
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def get_microservice_settings(args, cognito, claims=0, user_serializer="none"):
+    return {
+        "IDP": cognito.get_idp_setting(),
+        "ASYNC_VIEWS": args.async_views,
+        "CUSTOM_TOKEN_CALLABLE_ATTRIBUTES": [{"attr_name": f"claim_{i}", "attr_getter": "bench_app.get_claim"}
+                                             for i in range(claims)],
+        "USER_SERIALIZER_CLASS": USER_SERIALIZERS[user_serializer],
+    }
+
+
+def set_simple_jwt_settings(values):
+    """
+    Reinitialize simplejwt `api_settings` in place, as overriding SIMPLE_JWT replaces the `api_settings` global of
+    simplejwt but not the `api_settings` already imported by other modules.
+    """
+    from rest_framework_simplejwt.settings import api_settings
+
+    api_settings.reload()
+    api_settings.__init__(values, api_settings.defaults, api_settings.import_strings)
+
+
+class QueryCounter:
+    """Counts queries made by all threads, including the ones of sync_to_async and password hashing workers."""
+
+    def __init__(self):
+        from django.db import connection
+        from django.db.backends.signals import connection_created
+
+        self.count = 0
+        self._lock = threading.Lock()
+        connection_created.connect(self.on_connection_created)
+        connection.ensure_connection()
+        self.install(connection)
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def on_connection_created(self, sender, connection, **kwargs):
+        self.install(connection)
+
+
+class Client:
+    """Posts to the endpoints using Django test client, or its async counterpart for async views."""
+
+    def __init__(self, use_async):
+        from django.test import AsyncClient, Client as SyncClient
+
+        self.loop = asyncio.new_event_loop() if use_async else None
+        self.client = AsyncClient() if use_async else SyncClient()
+
+    def post(self, path, data=None, cookies=None):
+        self.client.cookies.clear()
+        for key, value in (cookies or {}).items():
+            self.client.cookies[key] = value
+
+        response = self.client.post(path, data or {}, content_type="application/json")
+        if self.loop is not None:
+            response = self.loop.run_until_complete(response)
+        return response
+
+
+class Fixtures:
+    """Users of the benchmarked project, and the tokens, cookies and id tokens sent to the endpoints."""
+
+    def __init__(self, cognito):
+        from django.contrib.auth import get_user_model
+
+        self.cognito = cognito
+        self.user = get_user_model().objects.create_user("bench", "bench@example.com", PASSWORD,
+                                                         first_name="Bench", last_name="Mark")
+        self.social_sub = str(uuid.uuid4())
+        self.social_email = "social-bench@example.com"
+        self.user_count = get_user_model().objects.count()
+
+    def grow_users(self, count, batch_size=5000):
+        """Add users, linked to an IDP uuid like users who signed in with Cognito, until the table has count rows."""
+        from django.contrib.auth import get_user_model
+        from rest_framework_microservice.models import Idp
+
+        user_model = get_user_model()
+        while self.user_count < count:
+            size = min(batch_size, count - self.user_count)
+            users = user_model.objects.bulk_create([
+                user_model(username=f"user{i}", email=f"user{i}@example.com", password="!")
+                for i in range(self.user_count, self.user_count + size)])
+            if users[0].pk is None:
+                users = user_model.objects.filter(username__in=[user.username for user in users])
+            Idp.objects.bulk_create([Idp(user=user, uuid=uuid.uuid4()) for user in users])
+            self.user_count += size
+
+    def get_refresh_token(self):
+        from rest_framework_microservice.serializers import LogInTokenObtainPairSerializer
+
+        return LogInTokenObtainPairSerializer.get_token(self.user)
+
+    def get_refresh_cookie(self):
+        from django.core.signing import get_cookie_signer
+        from rest_framework_microservice.settings import rest_microservice_settings
+
+        name = rest_microservice_settings.REFRESH_COOKIE_NAME
+        signer = get_cookie_signer(salt=name + rest_microservice_settings.COOKIE_SALT)
+        return {name: signer.sign(str(self.get_refresh_token()))}
+
+    def make_request(self, scenario):
+        """Get (path, data, cookies) of a request of the scenario, prepared before the request is timed."""
+        if scenario == "sign-in":
+            return "/auth/sign-in/", {"username": self.user.username, "password": PASSWORD}, None
+        if scenario.startswith("refresh"):
+            return "/auth/refresh/", None, self.get_refresh_cookie()
+        if scenario == "social-exchange":
+            id_token = self.cognito.id_token(self.social_sub, self.social_email)
+            return "/auth/social-exchange/", {"id_token": id_token, "access_token": "a", "refresh_token": "r"}, None
+        if scenario == "verify":
+            return "/auth/verify/", {"token": str(self.get_refresh_token().access_token)}, None
+        if scenario == "logoff":
+            return "/auth/logoff/", None, self.get_refresh_cookie()
+        raise ValueError(scenario)
+
+
+def run_scenario(client, fixtures, query_counter, scenario, iterations, warmup):
+    latencies = []
+    queries = 0
+
+    for i in range(warmup + iterations):
+        path, data, cookies = fixtures.make_request(scenario)
+        if i == warmup:
+            gc.collect()
+
+        query_count = query_counter.count
+        started_at = time.perf_counter()
+        response = client.post(path, data, cookies)
+        elapsed = time.perf_counter() - started_at
+
+        if response.status_code != 200:
+            raise RuntimeError(f"{scenario}: unexpected response {response.status_code} {response.content[:200]!r}")
+        if i >= warmup:
+            latencies.append(elapsed)
+            queries += query_counter.count - query_count
+
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "ops_per_sec": len(latencies) / sum(latencies),
+        "p50_ms": quantiles[49] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "queries": queries / len(latencies),
+    }
+
+
+def run(args, cognito):
+    from django.test import override_settings
+
+    query_counter = QueryCounter()
+    fixtures = Fixtures(cognito)
+    client = Client(args.async_views)
+    results = []
+
+    for users in sorted(args.users):
+        fixtures.grow_users(users)
+        for claims, user_serializer, scenario in itertools.product(args.claims, args.user_serializers,
+                                                                   args.scenarios):
+            overridden_settings = override_settings(
+                REST_FRAMEWORK_MICROSERVICE=get_microservice_settings(args, cognito, claims, user_serializer))
+            set_simple_jwt_settings(SIMPLE_JWT_SETTINGS.get(scenario, {}))
+            with redirect_stdout(io.StringIO()):  # settings reloads are printed
+                overridden_settings.enable()
+            try:
+                result = {"scenario": scenario, "claims": claims, "user_serializer": user_serializer,
+                          "users": users, "async_views": args.async_views}
+                result.update(run_scenario(client, fixtures, query_counter, scenario, args.iterations, args.warmup))
+            finally:
+                with redirect_stdout(io.StringIO()):
+                    overridden_settings.disable()
+            results.append(result)
+            print_result(result)
+
+    return results
+
+
+def get_key(result):
+    return result["scenario"], result["claims"], result["user_serializer"], result["users"], result["async_views"]
+
+
+def print_header():
+    print(f"{'scenario':<26}{'claims':>7}{'serializer':>11}{'users':>8}{'ops/s':>10}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'queries':>9}")
+
+
+def print_result(result):
+    print(f"{result['scenario']:<26}{result['claims']:>7}{result['user_serializer']:>11}{result['users']:>8}"
+          f"{result['ops_per_sec']:>10.1f}{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['queries']:>9.1f}")
+
+
+def compare(results, baseline, threshold):
+    """Print changes from baseline, returns the number of results which lost more than threshold % throughput."""
+    baseline_results = {get_key(result): result for result in baseline["results"]}
+    regressions = 0
+
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'} ({baseline['meta']['created_at']}):")
+    print(f"{'scenario':<26}{'claims':>7}{'serializer':>11}{'users':>8}{'ops/s':>10}{'p99':>10}{'queries':>9}")
+    for result in results:
+        before = baseline_results.get(get_key(result))
+        if before is None:
+            continue
+
+        throughput = (result["ops_per_sec"] / before["ops_per_sec"] - 1) * 100
+        p99 = (result["p99_ms"] / before["p99_ms"] - 1) * 100
+        queries = result["queries"] - before["queries"]
+        regressed = throughput < -threshold or queries > 0
+        regressions += regressed
+        print(f"{result['scenario']:<26}{result['claims']:>7}{result['user_serializer']:>11}{result['users']:>8}"
+              f"{throughput:>+9.1f}%{p99:>+9.1f}%{queries:>+9.1f}{'  REGRESSION' if regressed else ''}")
+
+    return regressions
+
+
+def get_meta(args):
+    import django
+    import rest_framework
+    import rest_framework_simplejwt
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "django": django.get_version(),
+        "djangorestframework": rest_framework.VERSION,
+        "djangorestframework-simplejwt": getattr(rest_framework_simplejwt, "__version__", None),
+        "iterations": args.iterations,
+        "warmup": args.warmup,
+        "password_hasher": args.password_hasher,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    directory = tempfile.mkdtemp(prefix="rest_framework_microservice_benchmarks")
+    cognito = FakeCognito().start()
+
+    try:
+        configure(args, os.path.join(directory, "db.sqlite3"), cognito)
+        print_header()
+        results = run(args, cognito)
+    finally:
+        cognito.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    report = {"meta": get_meta(args), "results": results}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.save}.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{regressions} regression(s) found.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+Admission control of the sign-in endpoints, whose password hashing is the most CPU-expensive operation of the
+package. Sign-ins are limited per username and per client IP by token buckets, the number of sign-ins checking
+passwords at the same time is bounded, and password hashing can run in a dedicated thread pool. Rejected sign-ins
+fail fast with a 429 response instead of queuing for workers shared with other endpoints.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.contrib.auth import authenticate
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
+from django.test.signals import setting_changed
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+from .cache import ExpiringLRUCache
+from .settings import rest_microservice_settings
+from .timing import timed
+
+CACHE_KEY_PREFIX = "rest_framework_microservice:sign_in:"
+RATE_PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """Parse rate as used by Django REST framework throttles, ie: "5/min", into number of requests and seconds."""
+    try:
+        num, period = rate.split("/")
+        return int(num), RATE_PERIODS[period[0]]
+    except (AttributeError, ValueError, KeyError, IndexError):
+        raise ImproperlyConfigured(f"Invalid SIGN_IN_RATE '{rate}', expected ie: '5/min'.")
+
+
+class TokenBucket:
+    """
+    Token buckets of `capacity` sign-ins refilled at `capacity` per `period` seconds, keyed by username or IP.
+    Buckets are kept in memory of the process, or in the Django cache specified by `cache_alias` to share them between
+    processes, in which case concurrent updates of the same bucket may let a few extra sign-ins through.
+    """
+
+    def __init__(self, capacity, period, cache_alias=None, local_size=10000):
+        self.capacity = capacity
+        self.refill_rate = capacity / period
+        self.cache_alias = cache_alias
+        self.local = ExpiringLRUCache(local_size)
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    def take(self, state, now):
+        """Take a token from bucket state, returns the new state and the seconds to wait if the bucket is empty."""
+        tokens, updated_at = state or (self.capacity, now)
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+        if tokens < 1:
+            return (tokens, now), (1 - tokens) / self.refill_rate
+        return (tokens - 1, now), None
+
+    def get_timeout(self):
+        """Number of seconds after which an unused bucket is full again, and can be forgotten."""
+        return self.capacity / self.refill_rate
+
+    def consume(self, key):
+        """Take a token from bucket of key, returns the seconds to wait if the bucket is empty, otherwise None."""
+        now = time.time()
+        if self.shared is None:
+            with self._lock:
+                state, wait = self.take(self.local.get(key), now)
+                self.local.set(key, state, expires_at=now + self.get_timeout())
+            return wait
+
+        cache_key = f"{CACHE_KEY_PREFIX}{key}"
+        state, wait = self.take(self.shared.get(cache_key), now)
+        self.shared.set(cache_key, state, self.get_timeout())
+        return wait
+
+    async def aconsume(self, key):
+        if self.shared is None:
+            return self.consume(key)
+
+        now = time.time()
+        cache_key = f"{CACHE_KEY_PREFIX}{key}"
+        state, wait = self.take(await self.shared.aget(cache_key), now)
+        await self.shared.aset(cache_key, state, self.get_timeout())
+        return wait
+
+
+class SignInAdmissionController:
+    """
+    Admits sign-ins according to SIGN_IN_RATE and SIGN_IN_MAX_CONCURRENCY settings, raising `Throttled` otherwise.
+    """
+
+    def __init__(self, rate=None, max_concurrency=0, cache_alias=None):
+        self.bucket = TokenBucket(*parse_rate(rate), cache_alias=cache_alias) if rate else None
+        self.semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+
+    @staticmethod
+    def get_keys(request, username):
+        return [f"user:{username}", f"ip:{BaseThrottle().get_ident(request)}"]
+
+    @staticmethod
+    def check_wait(waits):
+        waits = [wait for wait in waits if wait is not None]
+        if waits:
+            raise Throttled(wait=max(waits))
+
+    def check_rate(self, request, username):
+        if self.bucket is not None:
+            self.check_wait([self.bucket.consume(key) for key in self.get_keys(request, username)])
+
+    async def acheck_rate(self, request, username):
+        if self.bucket is not None:
+            self.check_wait([await self.bucket.aconsume(key) for key in self.get_keys(request, username)])
+
+    @contextmanager
+    def limit_concurrency(self):
+        if self.semaphore is None:
+            yield
+            return
+
+        if not self.semaphore.acquire(blocking=False):
+            raise Throttled(wait=1)
+        try:
+            yield
+        finally:
+            self.semaphore.release()
+
+    @contextmanager
+    def admit(self, request, username):
+        self.check_rate(request, username)
+        with self.limit_concurrency():
+            yield
+
+
+_admission_controller = None
+_password_hashing_executor = None
+
+
+def get_admission_controller():
+    global _admission_controller
+    if _admission_controller is None:
+        _admission_controller = SignInAdmissionController(
+            rate=rest_microservice_settings.SIGN_IN_RATE,
+            max_concurrency=rest_microservice_settings.SIGN_IN_MAX_CONCURRENCY,
+            cache_alias=rest_microservice_settings.SIGN_IN_RATE_CACHE_ALIAS)
+    return _admission_controller
+
+
+def get_password_hashing_executor():
+    """Get the bounded thread pool running password checks, sized by PASSWORD_HASHING_WORKERS."""
+    global _password_hashing_executor
+    if _password_hashing_executor is None:
+        _password_hashing_executor = ThreadPoolExecutor(
+            max_workers=rest_microservice_settings.PASSWORD_HASHING_WORKERS,
+            thread_name_prefix="rest_framework_microservice_hashing")
+    return _password_hashing_executor
+
+
+def reset_admission(*args, **kwargs):
+    global _admission_controller, _password_hashing_executor
+    if kwargs.get("setting", "REST_FRAMEWORK_MICROSERVICE") == "REST_FRAMEWORK_MICROSERVICE":
+        _admission_controller = None
+        if _password_hashing_executor is not None:
+            _password_hashing_executor.shutdown(wait=False)
+            _password_hashing_executor = None
+
+
+setting_changed.connect(reset_admission)
+
+
+def authenticate_in_worker(request, **credentials):
+    """Authenticate user from a password hashing worker thread, releasing the thread's database connection."""
+    try:
+        return authenticate(request, **credentials)
+    finally:
+        close_old_connections()
+
+
+@timed("password_check")
+def authenticate_user(request, **credentials):
+    """Authenticate user, in the password hashing thread pool if PASSWORD_HASHING_POOL setting is enabled."""
+    if not rest_microservice_settings.PASSWORD_HASHING_POOL:
+        return authenticate(request, **credentials)
+    return get_password_hashing_executor().submit(authenticate_in_worker, request, **credentials).result()
@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class RestFrameworkMicroserviceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rest_framework_microservice'
+
+    def ready(self):
+        from .claims import connect_signals
+        from .payloads import connect_signals as connect_payload_signals
+        from .settings import rest_microservice_settings
+
+        # compiling claims builder on start up surfaces configuration errors early
+        rest_microservice_settings.claims_builder
+        connect_signals()
+        connect_payload_signals()
+
+        if rest_microservice_settings.JWKS_SNAPSHOT_PATH:
+            from .social_auth.snapshot import load_jwks_snapshot
+            load_jwks_snapshot()
+        if rest_microservice_settings.JWKS_WARM_UP:
+            from .social_auth.snapshot import warm_up_key_stores
+            warm_up_key_stores()
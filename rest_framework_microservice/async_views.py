@@ -0,0 +1,299 @@
+"""
+Async counterparts of the views in `views.py`, for projects served by an ASGI server.
+Database queries use Django async ORM, IDP public keys are fetched without blocking the event loop, and password
+hashing runs in a bounded thread pool. Requires Django 4.2 or newer, enable using the ASYNC_VIEWS setting.
+"""
+import asyncio
+import json
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from jwt import ExpiredSignatureError, PyJWTError
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, ParseError
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from .admission import authenticate_in_worker, get_admission_controller, get_password_hashing_executor
+from .exceptions import InvalidToken as InvalidUserToken, TokenExpired
+from .serializers import LogInTokenObtainPairSerializer, SocialLogInTokenExchangeSerializer, \
+    SerializerResponseMixin, blacklists_rotated_tokens, get_custom_token_claims, make_rotated_token, make_token_data
+from .claims import get_claims_cache
+from .coalescing import aforget_coalesced_refresh, get_refresh_coalescer
+from .db_routers import apin_user, areplica_reads
+from .payloads import aget_user_payload, ais_user_needed
+from .renderers import render_json
+from .revocation import arevoke_user_tokens
+from .settings import rest_microservice_settings
+from .social_auth.providers import get_provider_registry
+from .timing import finish_timing, stage, start_timing
+from .tokens import DeferredBlacklistCheckRefreshToken, blacklist_installed
+from .views import RefreshTokenUsingCookieMixin
+from .write_behind import ablacklist_token, arecord_last_login, arecord_outstanding_token
+
+async def aget_custom_token_claims(user):
+    """Custom claims may be read from related objects or callables querying the database, out of the event loop."""
+    if rest_microservice_settings.CUSTOM_TOKEN_USER_ATTRIBUTES or \
+            rest_microservice_settings.CUSTOM_TOKEN_CALLABLE_ATTRIBUTES:
+        return await sync_to_async(get_custom_token_claims)(user)
+    return {}
+
+
+class AsyncAuthView(View, RefreshTokenUsingCookieMixin):
+    """
+    Base class of async authentication views, renders errors the same way as Django REST framework does.
+    """
+    http_method_names = ['post', 'options']
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def post(self, request, *args, **kwargs):
+        start_timing()
+        try:
+            response = await self.handle(request, *args, **kwargs)
+        except TokenError as e:
+            response = self.make_error_response(InvalidToken(e.args[0]))
+        except APIException as e:
+            response = self.make_error_response(e)
+        return finish_timing(response, type(self).__name__)
+
+    async def handle(self, request, *args, **kwargs):
+        raise NotImplementedError()
+
+    @staticmethod
+    def get_request_data(request):
+        if request.content_type == 'application/json':
+            try:
+                return json.loads(request.body or b'{}')
+            except ValueError as e:
+                raise ParseError(f'JSON parse error - {e}')
+        return request.POST
+
+    @staticmethod
+    def make_error_response(exc):
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        response = JsonResponse(data, status=exc.status_code, safe=False)
+        if getattr(exc, 'wait', None) is not None:
+            response['Retry-After'] = '%d' % exc.wait
+        return response
+
+    @staticmethod
+    async def make_auth_response(validated_data):
+        with stage("serialize"):
+            user_payload = None
+            if rest_microservice_settings.USER_SERIALIZER_CLASS:
+                user_payload = await aget_user_payload(validated_data['user'], validated_data.get('user_id'))
+            response_data = SerializerResponseMixin.get_auth_response_data(validated_data, user_payload)
+
+            if rest_microservice_settings.FAST_JSON_RENDERER:
+                return HttpResponse(render_json(response_data), content_type='application/json',
+                                    status=status.HTTP_200_OK)
+            return JsonResponse(response_data, encoder=JSONEncoder, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def get_delete_cookie_response(status_code=status.HTTP_401_UNAUTHORIZED):
+        response = HttpResponse(status=status_code)
+        response.delete_cookie(key=rest_microservice_settings.REFRESH_COOKIE_NAME,
+                               path=rest_microservice_settings.REFRESH_COOKIE_PATH)
+        return response
+
+
+class AsyncTokenLogIn(AsyncAuthView):
+    """
+    Async counterpart of `TokenLogIn`.
+    """
+    serializer_class = LogInTokenObtainPairSerializer
+
+    async def handle(self, request, *args, **kwargs):
+        data = self.get_request_data(request)
+        serializer = self.serializer_class(data=data, context={'request': request})
+        attrs = serializer.to_internal_value(data)
+
+        credentials = {serializer.username_field: attrs[serializer.username_field], 'password': attrs['password']}
+        admission_controller = get_admission_controller()
+        await admission_controller.acheck_rate(request, credentials[serializer.username_field])
+        with admission_controller.limit_concurrency(), stage("password_check"):
+            user = await asyncio.get_running_loop().run_in_executor(
+                get_password_hashing_executor(), partial(authenticate_in_worker, request, **credentials))
+
+        if not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(serializer.error_messages['no_active_account'], 'no_active_account')
+
+        with stage("token_issue"):
+            refresh = await sync_to_async(serializer.get_token)(user)
+            validated_data = make_token_data(refresh, user)
+        with stage("last_login"):
+            await arecord_last_login(user)
+
+        response = await self.make_auth_response(validated_data)
+        return await self.aset_cookie_header_in_response(response, validated_data['refresh'],
+                                                         validated_data['refresh_expiry'])
+
+
+class AsyncRefreshTokenUsingCookie(AsyncAuthView):
+    """
+    Async counterpart of `RefreshTokenUsingCookie`.
+    """
+
+    async def handle(self, request, *args, **kwargs):
+        jwt = await self.aget_token_from_cookie(request)
+        coalescer = get_refresh_coalescer()
+
+        try:
+            refresh = DeferredBlacklistCheckRefreshToken(jwt)
+            async with areplica_reads(refresh.get("user_id")):
+                if coalescer is None:
+                    await refresh.acheck_blacklist()
+                    validated_data = await self.aget_refresh_data(refresh)
+                else:
+                    async with coalescer.alock(refresh[api_settings.JTI_CLAIM]):
+                        validated_data = await self.aget_coalesced_refresh_data(refresh, coalescer)
+        except ExpiredSignatureError:
+            raise TokenExpired()
+        except ObjectDoesNotExist:
+            raise InvalidUserToken()
+        except TokenError:
+            return self.get_delete_cookie_response()
+
+        response = await self.make_auth_response(validated_data)
+        if 'refresh_token' in validated_data:
+            # the rotated refresh token, also given to the refreshes coalesced with this one
+            return await self.aset_cookie_header_in_response(response, validated_data['refresh_token'],
+                                                             validated_data['refresh_expiry'])
+        return response
+
+    async def aget_refresh_data(self, refresh, coalescer=None):
+        """Async counterpart of `CustomTokenRefreshSerializer.get_refresh_data`."""
+        with stage("user_claims"):
+            user, claims = await self.aget_user_claims(refresh)
+        # copying custom attributes from user instance to TokenUser in case any attributes have been changed
+        refresh.payload.update(claims)
+
+        with stage("token_issue"):
+            access = refresh.access_token
+            data = {'access': str(access), 'access_expiry': access['exp']}
+
+            if api_settings.ROTATE_REFRESH_TOKENS:
+                rotated = make_rotated_token(refresh)
+                data['refresh_token'], data['refresh_expiry'] = str(rotated), rotated['exp']
+                await arecord_outstanding_token(rotated)
+
+        if coalescer is not None:
+            await coalescer.aset(refresh[api_settings.JTI_CLAIM], data)
+
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION and blacklist_installed():
+            with stage("blacklist"):
+                await ablacklist_token(refresh)
+
+        return {**data, 'user': user, 'user_id': refresh.get("user_id")}
+
+    async def aget_coalesced_refresh_data(self, refresh, coalescer):
+        """Async counterpart of `CustomTokenRefreshSerializer.get_coalesced_refresh_data`."""
+        data = await coalescer.aget(refresh[api_settings.JTI_CLAIM])
+        if data is None or not blacklists_rotated_tokens():
+            try:
+                await refresh.acheck_blacklist()
+            except TokenError:
+                data = await coalescer.aget(refresh[api_settings.JTI_CLAIM]) if blacklists_rotated_tokens() else None
+                if data is None:
+                    raise
+
+        if data is None:
+            return await self.aget_refresh_data(refresh, coalescer)
+
+        if 'refresh_token' in data:
+            await DeferredBlacklistCheckRefreshToken(data['refresh_token']).acheck_blacklist()
+
+        user = None
+        if await ais_user_needed(refresh.get("user_id")):
+            user = await get_user_model().objects.aget(id=refresh.get("user_id"))
+        return {**data, 'user': user, 'user_id': refresh.get("user_id")}
+
+    @staticmethod
+    async def aget_user_claims(refresh_token):
+        """Async counterpart of `CustomTokenRefreshSerializer.get_user_claims`."""
+        claims_cache = get_claims_cache()
+        user_id = refresh_token.get("user_id")
+
+        if claims_cache is not None and not await ais_user_needed(user_id):
+            claims = await claims_cache.aget(user_id)
+            if claims is not None:
+                return None, claims
+
+        user = await get_user_model().objects.aget(id=user_id)
+        claims = await aget_custom_token_claims(user)
+        if claims_cache is not None:
+            await sync_to_async(claims_cache.set)(user_id, claims)
+
+        return user, claims
+
+
+class AsyncBlacklistRefreshToken(AsyncAuthView):
+    """
+    Async counterpart of `BlacklistRefreshToken`.
+    """
+
+    async def handle(self, request, *args, **kwargs):
+        jwt = await self.aget_token_from_cookie(request)
+        token = DeferredBlacklistCheckRefreshToken(jwt)
+        with stage("blacklist"):
+            await ablacklist_token(token)
+            await aforget_coalesced_refresh(token[api_settings.JTI_CLAIM])
+            await self.adelete_refresh_handle(request)
+        return self.get_delete_cookie_response(status_code=status.HTTP_200_OK)
+
+
+class AsyncRevokeAllRefreshTokens(AsyncAuthView):
+    """
+    Async counterpart of `RevokeAllRefreshTokens`.
+    """
+
+    async def handle(self, request, *args, **kwargs):
+        jwt = await self.aget_token_from_cookie(request)
+        token = DeferredBlacklistCheckRefreshToken(jwt)
+        await token.acheck_blacklist()
+        with stage("blacklist"):
+            await arevoke_user_tokens(token.get("user_id"))
+            await self.adelete_refresh_handle(request)
+        return self.get_delete_cookie_response(status_code=status.HTTP_200_OK)
+
+
+class AsyncSocialLogInExchangeTokens(AsyncAuthView):
+    """
+    Async counterpart of `SocialLogInExchangeTokens`.
+    """
+    serializer_class = SocialLogInTokenExchangeSerializer
+
+    async def handle(self, request, *args, **kwargs):
+        data = self.get_request_data(request)
+        serializer = self.serializer_class(data=data)
+        attrs = serializer.to_internal_value(data)
+
+        try:
+            id_token = await get_provider_registry().adecode_token(attrs['id_token'])
+        except ExpiredSignatureError:
+            raise TokenExpired()
+        except PyJWTError:
+            raise InvalidUserToken()
+
+        serializer.check_id_token(id_token)
+        with stage("user_provision"):
+            async with areplica_reads():
+                user = await serializer.get_provisioner().aprovision(id_token)
+        await apin_user(user.pk)
+
+        with stage("token_issue"):
+            refresh = await sync_to_async(serializer.get_token)(user)
+            validated_data = make_token_data(refresh, user)
+
+        response = await self.make_auth_response(validated_data)
+        return await self.aset_cookie_header_in_response(response, validated_data['refresh'],
+                                                         validated_data['refresh_expiry'])
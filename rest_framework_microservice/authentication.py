@@ -0,0 +1,86 @@
+"""
+Authentication of API requests with access tokens, without querying the user. Verified access tokens and their users
+are kept in memory of each process until the token expires, see ACCESS_TOKEN_CACHE_SIZE setting, so the signature
+of an access token is verified once per process rather than on every request.
+"""
+import copy
+from django.test.signals import setting_changed
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from .cache import ExpiringLRUCache
+from .models import CustomTokenUser, SlottedTokenUser, make_token_user_class
+from .settings import rest_microservice_settings
+
+_access_token_cache = None
+
+
+def get_access_token_cache():
+    """
+    Get the process-local cache of verified access tokens, keyed by their signature segment.
+    Its `stats()` report hits, misses and evictions which can be used to tune ACCESS_TOKEN_CACHE_SIZE.
+    """
+    global _access_token_cache
+    if _access_token_cache is None:
+        _access_token_cache = ExpiringLRUCache(rest_microservice_settings.ACCESS_TOKEN_CACHE_SIZE)
+    return _access_token_cache
+
+
+def reset_access_token_cache(*args, **kwargs):
+    global _access_token_cache
+    if kwargs.get("setting", "REST_FRAMEWORK_MICROSERVICE") in ("REST_FRAMEWORK_MICROSERVICE", "SIMPLE_JWT"):
+        _access_token_cache = None
+
+
+setting_changed.connect(reset_access_token_cache)
+
+
+def get_token_user_class():
+    """
+    Get SIMPLE_JWT TOKEN_USER_CLASS, or a `SlottedTokenUser` with the custom token claims specified using settings
+    when it is simplejwt `TokenUser` or `CustomTokenUser`.
+    """
+    if api_settings.TOKEN_USER_CLASS in (TokenUser, CustomTokenUser):
+        return make_token_user_class(rest_microservice_settings.claims_builder.claim_names)
+    return api_settings.TOKEN_USER_CLASS
+
+
+class CachedJWTTokenUserAuthentication(JWTStatelessUserAuthentication):
+    """
+    Same as simplejwt `JWTTokenUserAuthentication`, reusing the verification of the access token when the same token
+    was verified before by the process. Each request is given its own copy of the validated token, whose claims can be
+    set without affecting other requests. Only the immutable `SlottedTokenUser` is shared by the requests made with the
+    same token, users of other classes are made for each request from its copy of the token.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        cache = get_access_token_cache()
+        key = raw_token.rpartition(b".")[2]
+        cached = cache.get(key)
+        # the whole token is compared, so that a token with another header or payload is verified
+        if cached is None or cached[0] != raw_token:
+            validated_token = self.get_validated_token(raw_token)
+            cached = (raw_token, self.get_user(validated_token), validated_token)
+            cache.set(key, cached, expires_at=validated_token.get("exp"))
+
+        user, validated_token = cached[1], copy.copy(cached[2])
+        validated_token.payload = dict(validated_token.payload)
+        if not isinstance(user, SlottedTokenUser):
+            user = self.get_user(validated_token)
+        return user, validated_token
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        return get_token_user_class()(validated_token)
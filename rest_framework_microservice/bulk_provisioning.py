@@ -0,0 +1,207 @@
+"""
+Provisioning of the users of an IDP ahead of their first social exchange, from an export of the IDP users streamed
+in batches, so that memory use does not depend on the size of the export. Users are resolved the same way as by
+`UuidUserProvisioner`: by their IDP uuid, then by email, and created otherwise, so provisioning can be run again.
+"""
+import csv
+import json
+import time
+from uuid import UUID
+from itertools import islice
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
+from .claims import invalidate_user_claims
+from .models import Idp
+from .payloads import invalidate_user_payload
+from .provisioning import UserProvisioner, relinks_idp_users
+from .settings import rest_microservice_settings
+
+UPDATED_FIELDS = ("first_name", "last_name")
+
+
+def read_idp_users(file, format="jsonl"):
+    """
+    Yield the users of an IDP export, one dictionary of id token claims (`sub`, `email`, `given_name`, ...) per line
+    of a JSONL file or per row of a CSV file with a header.
+    """
+    if format == "csv":
+        yield from csv.DictReader(file)
+        return
+
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def provision_idp_users(users, batch_size=1000, sleep=0, issuer=None, progress=None):
+    """
+    Create or link the Django user of each IDP user (dictionary of id token claims) by batches of `batch_size` users,
+    each in a transaction, with `sleep` seconds between batches. When `issuer` is given, claims are first mapped by the
+    provider of this issuer in IDPS setting, ie: the `sub` of an OIDC provider is mapped to a UUID. `progress` is called
+    after each batch with the number of users read so far and the counts.
+
+    Returns a dictionary counting users created, linked (existing user linked to its IDP uuid), updated, unchanged, and
+    skipped (missing `sub` or `email`, or username already used by another user).
+    """
+    if issuer is not None:
+        from .social_auth.providers import get_provider_registry
+        provider = get_provider_registry().by_issuer.get(issuer.rstrip("/"))
+        if provider is None:
+            raise ValueError(f"Issuer '{issuer}' is not specified in IDPS setting.")
+        users = (provider.get_claims(user) for user in users)
+
+    counts = {"created": 0, "linked": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+    users = iter(users)
+    read = 0
+
+    while True:
+        batch = list(islice(users, batch_size))
+        if not batch:
+            break
+        read += len(batch)
+        for key, count in provision_batch(batch).items():
+            counts[key] += count
+
+        if progress is not None:
+            progress(read, counts)
+        if sleep:
+            time.sleep(sleep)
+
+    return counts
+
+
+def provision_batch(id_tokens):
+    user_model = get_user_model()
+    uuid_field = rest_microservice_settings.USER_MODEL_UUID_FIELD
+    db = router.db_for_write(user_model)
+    counts = {"created": 0, "linked": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+    relink = uuid_field is None and relinks_idp_users()
+
+    # the last row of a user wins, as it would if the rows were exchanged one after another
+    by_uuid = {}
+    for id_token in id_tokens:
+        uuid = get_uuid(id_token, uuid_field)
+        if uuid is not None and id_token.get("email"):
+            by_uuid[uuid] = id_token
+        else:
+            counts["skipped"] += 1
+
+    with transaction.atomic(using=db):
+        users = user_model.objects.using(db)
+        if uuid_field is not None:
+            linked = {str(getattr(user, uuid_field)): user
+                      for user in users.filter(**{f"{uuid_field}__in": by_uuid.keys()})}
+        else:
+            linked = {str(user.idp.uuid): user
+                      for user in users.filter(idp__uuid__in=by_uuid.keys()).select_related("idp")}
+
+        # the lowest primary key wins when several users have the same email
+        by_email = users.order_by("-pk").filter(
+            email__in=[id_token["email"] for uuid, id_token in by_uuid.items() if uuid not in linked])
+        if uuid_field is None:
+            by_email = by_email.select_related("idp")
+        by_email = {user.email: user for user in by_email}
+
+        to_create, to_update, idp_uuids = {}, [], {}
+        for uuid, id_token in by_uuid.items():
+            defaults = UserProvisioner.get_user_defaults(id_token)
+            user = linked.get(uuid) or by_email.get(id_token["email"])
+
+            if user is None:
+                if id_token["email"] in to_create:
+                    counts["skipped"] += 1
+                else:
+                    to_create[id_token["email"]] = (user_model(email=id_token["email"], **defaults), uuid)
+                continue
+
+            changed = [field for field in UPDATED_FIELDS if getattr(user, field) != defaults[field]]
+            for field in changed:
+                setattr(user, field, defaults[field])
+
+            if uuid not in linked and (not is_linked(user, uuid_field) or relink):
+                # existing user, ie: created before signing in with IDP, or whose uuid changed at IDP
+                if uuid_field is not None:
+                    setattr(user, uuid_field, uuid)
+                    changed.append(uuid_field)
+                else:
+                    idp_uuids[user.pk] = uuid
+                counts["linked"] += 1
+            else:
+                counts["updated" if changed else "unchanged"] += 1
+
+            if changed:
+                to_update.append(user)
+
+        created = skip_used_usernames(users, list(to_create.values()))
+        counts["skipped"] += len(to_create) - len(created)
+        counts["created"] += len(created)
+
+        users.bulk_create([user for user, uuid in created])
+        users.bulk_update(to_update, [*UPDATED_FIELDS, *([uuid_field] if uuid_field is not None else [])])
+
+        if uuid_field is None:
+            if any(user.pk is None for user, uuid in created):
+                # backends which do not return the primary keys of created rows
+                pks = dict(users.filter(email__in=[user.email for user, uuid in created]).values_list("email", "pk"))
+                for user, uuid in created:
+                    user.pk = pks[user.email]
+            idp_uuids.update({user.pk: uuid for user, uuid in created})
+            link_idps(db, idp_uuids, relink)
+
+    # bulk updates do not send the signals discarding cached claims and payloads
+    for user in to_update:
+        invalidate_user_claims(user)
+        invalidate_user_payload(user)
+
+    return counts
+
+
+def get_uuid(id_token, uuid_field):
+    """IDP uuid of id token, or None if it is missing or not a UUID while stored in `Idp.uuid`."""
+    if not id_token.get("sub"):
+        return None
+    if uuid_field is not None:
+        return str(id_token["sub"])
+    try:
+        return str(UUID(str(id_token["sub"])))
+    except ValueError:
+        return None
+
+
+def is_linked(user, uuid_field):
+    if uuid_field is not None:
+        return getattr(user, uuid_field) is not None
+    return hasattr(user, "idp")
+
+
+def skip_used_usernames(users, created):
+    """Leave out the users to create whose username is used by an existing user or by another user of the batch."""
+    username_field = get_user_model().USERNAME_FIELD
+    used = set(users.filter(**{f"{username_field}__in": [getattr(user, username_field) for user, uuid in created]})
+               .values_list(username_field, flat=True))
+
+    kept = []
+    for user, uuid in created:
+        username = getattr(user, username_field)
+        if username not in used:
+            used.add(username)
+            kept.append((user, uuid))
+    return kept
+
+
+def link_idps(db, idp_uuids, relink):
+    idps = [Idp(user_id=user_pk, uuid=uuid) for user_pk, uuid in idp_uuids.items()]
+
+    if not relink:
+        Idp.objects.using(db).bulk_create(idps, ignore_conflicts=True)
+        return
+
+    if getattr(connections[db].features, "supports_update_conflicts_with_target", False):
+        Idp.objects.using(db).bulk_create(idps, update_conflicts=True, unique_fields=["user"], update_fields=["uuid"])
+        return
+
+    existing = Idp.objects.using(db).in_bulk(idp_uuids.keys(), field_name="user_id")
+    for idp in existing.values():
+        idp.uuid = idp_uuids[idp.user_id]
+    Idp.objects.using(db).bulk_update(existing.values(), ["uuid"])
+    Idp.objects.using(db).bulk_create([idp for idp in idps if idp.user_id not in existing])
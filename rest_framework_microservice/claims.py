@@ -0,0 +1,156 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import prefetch_related_objects
+from django.db.models.signals import post_delete, post_save
+from django.test.signals import setting_changed
+from .cache import ExpiringLRUCache
+from .settings import import_from_string, rest_microservice_settings
+
+CACHE_KEY_PREFIX = "rest_framework_microservice:claims:"
+
+
+class ClaimsBuilder:
+    """
+    Builds custom token claims of a user according to CUSTOM_TOKEN_USER_ATTRIBUTES and
+    CUSTOM_TOKEN_CALLABLE_ATTRIBUTES settings, with callable getters imported once when the builder is compiled.
+    Related objects listed in `prefetch_related` of callable attributes are prefetched in a single pass before
+    calling the getters, so several getters can share them.
+    """
+
+    def __init__(self, user_attributes, callable_attributes):
+        self.user_attributes = tuple(user_attributes)
+        self.getters = []
+        prefetch_related = []
+
+        for attr in callable_attributes:
+            try:
+                attr_name, attr_getter = attr["attr_name"], attr["attr_getter"]
+            except (KeyError, TypeError):
+                raise ImproperlyConfigured(
+                    f"CUSTOM_TOKEN_CALLABLE_ATTRIBUTES items must contain 'attr_name' and 'attr_getter': {attr!r}")
+
+            if not callable(attr_getter):
+                attr_getter = import_from_string(attr_getter, "CUSTOM_TOKEN_CALLABLE_ATTRIBUTES")
+            self.getters.append((attr_name, attr_getter))
+
+            for lookup in attr.get("prefetch_related", ()):
+                if lookup not in prefetch_related:
+                    prefetch_related.append(lookup)
+
+        self.getters = tuple(self.getters)
+        self.prefetch_related = tuple(prefetch_related)
+
+    @property
+    def claim_names(self):
+        return (*self.user_attributes, *(attr_name for attr_name, _ in self.getters))
+
+    def build(self, user):
+        """Get dictionary of custom token claims of user."""
+        if self.prefetch_related:
+            prefetch_related_objects([user], *self.prefetch_related)
+
+        claims = {attr: getattr(user, attr, None) for attr in self.user_attributes}
+        for attr_name, attr_getter in self.getters:
+            claims[attr_name] = attr_getter(user)
+
+        return claims
+
+
+class UserClaimsCache:
+    """
+    Two-tier cache of the custom token claims computed for each user, used by the refresh endpoint so that
+    refreshing a token does not need to query the user. The first tier is an in-process LRU cache whose entries
+    expire after `local_timeout` seconds, the optional second tier is a Django cache shared by all processes.
+    """
+
+    def __init__(self, local_size, local_timeout, cache_alias=None, cache_timeout=None):
+        self.local = ExpiringLRUCache(local_size)
+        self.local_timeout = local_timeout
+        self.cache_alias = cache_alias
+        self.cache_timeout = cache_timeout
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    @staticmethod
+    def make_key(user_id):
+        return f"{CACHE_KEY_PREFIX}{user_id}"
+
+    def get(self, user_id):
+        user_id = str(user_id)
+        claims = self.local.get(user_id)
+        if claims is None and self.shared is not None:
+            claims = self.shared.get(self.make_key(user_id))
+            if claims is not None:
+                self.local.set(user_id, claims, expires_at=time.time() + self.local_timeout)
+        return claims
+
+    async def aget(self, user_id):
+        user_id = str(user_id)
+        claims = self.local.get(user_id)
+        if claims is None and self.shared is not None:
+            claims = await self.shared.aget(self.make_key(user_id))
+            if claims is not None:
+                self.local.set(user_id, claims, expires_at=time.time() + self.local_timeout)
+        return claims
+
+    def set(self, user_id, claims):
+        user_id = str(user_id)
+        self.local.set(user_id, claims, expires_at=time.time() + self.local_timeout)
+        if self.shared is not None:
+            self.shared.set(self.make_key(user_id), claims, self.cache_timeout)
+
+    def delete(self, user_id):
+        user_id = str(user_id)
+        self.local.delete(user_id)
+        if self.shared is not None:
+            self.shared.delete(self.make_key(user_id))
+
+
+_claims_cache = None
+
+
+def get_claims_cache():
+    """Get the user claims cache, or None if it is disabled by setting CLAIMS_CACHE_SIZE to 0."""
+    global _claims_cache
+    if _claims_cache is None and rest_microservice_settings.CLAIMS_CACHE_SIZE > 0:
+        _claims_cache = UserClaimsCache(local_size=rest_microservice_settings.CLAIMS_CACHE_SIZE,
+                                        local_timeout=rest_microservice_settings.CLAIMS_CACHE_TIMEOUT,
+                                        cache_alias=rest_microservice_settings.CLAIMS_CACHE_ALIAS,
+                                        cache_timeout=rest_microservice_settings.CLAIMS_CACHE_SHARED_TIMEOUT)
+    return _claims_cache
+
+
+def reset_claims_cache(*args, **kwargs):
+    global _claims_cache
+    if kwargs.get("setting", "REST_FRAMEWORK_MICROSERVICE") == "REST_FRAMEWORK_MICROSERVICE":
+        _claims_cache = None
+
+
+setting_changed.connect(reset_claims_cache)
+
+
+def invalidate_user_claims(user):
+    """
+    Discard the cached claims of a user, given a user instance or id. This is called when a user is saved or
+    deleted, and should also be called when data read by callable claim getters (CUSTOM_TOKEN_CALLABLE_ATTRIBUTES)
+    changes, ie: from a signal receiver of the related model.
+    """
+    claims_cache = get_claims_cache()
+    if claims_cache is not None:
+        claims_cache.delete(getattr(user, "pk", user))
+
+
+def invalidate_user_claims_receiver(sender, instance, **kwargs):
+    invalidate_user_claims(instance)
+
+
+def connect_signals():
+    user_model = get_user_model()
+    post_save.connect(invalidate_user_claims_receiver, sender=user_model,
+                      dispatch_uid="rest_framework_microservice_claims_post_save")
+    post_delete.connect(invalidate_user_claims_receiver, sender=user_model,
+                        dispatch_uid="rest_framework_microservice_claims_post_delete")
@@ -0,0 +1,139 @@
+"""
+Coalescing of concurrent refreshes of the same refresh token, ie: by several browser tabs sharing the refresh cookie.
+When REFRESH_COALESCING_WINDOW setting is specified, the tokens minted by a refresh are kept for that many seconds
+under the jti of the refresh token, and returned to the other refreshes of the same token instead of minting new
+ones, which would fail once the token has been blacklisted by rotation. The tokens kept for a refresh token are
+discarded when it is logged off, so they are not returned to a replayed refresh.
+"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from django.core.cache import caches
+from django.test.signals import setting_changed
+from .cache import ExpiringLRUCache
+from .settings import rest_microservice_settings
+
+CACHE_KEY_PREFIX = "rest_framework_microservice:refresh:"
+
+
+class RefreshCoalescer:
+    """
+    Keeps the result of the refresh of each jti for `window` seconds in the Django cache specified by `cache_alias`,
+    so that refreshes handled by other processes can use it, or in memory of the process when no cache is specified.
+    Refreshes of the same jti handled by this process are serialized, so that only the first one mints tokens.
+    """
+
+    def __init__(self, window, cache_alias=None, local_size=1024):
+        self.window = window
+        self.cache_alias = cache_alias
+        self.local = ExpiringLRUCache(local_size)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._async_locks = {}
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    @staticmethod
+    def make_key(jti):
+        return f"{CACHE_KEY_PREFIX}{jti}"
+
+    # results are only read from the shared cache when there is one, so that discarding them in any process, ie: on
+    # log off, is seen by all processes
+
+    def get(self, jti):
+        if self.shared is not None:
+            return self.shared.get(self.make_key(jti))
+        return self.local.get(jti)
+
+    async def aget(self, jti):
+        if self.shared is not None:
+            return await self.shared.aget(self.make_key(jti))
+        return self.local.get(jti)
+
+    def set(self, jti, data):
+        if self.shared is not None:
+            self.shared.set(self.make_key(jti), data, self.window)
+        else:
+            self.local.set(jti, data, expires_at=time.time() + self.window)
+
+    async def aset(self, jti, data):
+        if self.shared is not None:
+            await self.shared.aset(self.make_key(jti), data, self.window)
+        else:
+            self.local.set(jti, data, expires_at=time.time() + self.window)
+
+    def delete_many(self, jtis):
+        """Discard the results of the refreshes of jtis, ie: of revoked tokens."""
+        for jti in jtis:
+            self.local.delete(jti)
+        if self.shared is not None:
+            self.shared.delete_many([self.make_key(jti) for jti in jtis])
+
+    async def adelete_many(self, jtis):
+        for jti in jtis:
+            self.local.delete(jti)
+        if self.shared is not None:
+            await self.shared.adelete_many([self.make_key(jti) for jti in jtis])
+
+    @contextmanager
+    def lock(self, jti):
+        with self._locks_lock:
+            entry = self._locks.setdefault(jti, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[jti]
+
+    @asynccontextmanager
+    async def alock(self, jti):
+        entry = self._async_locks.setdefault(jti, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._async_locks[jti]
+
+
+_refresh_coalescer = None
+
+
+def get_refresh_coalescer():
+    """Get the refresh coalescer, or None if it is disabled by setting REFRESH_COALESCING_WINDOW to 0."""
+    global _refresh_coalescer
+    if _refresh_coalescer is None and rest_microservice_settings.REFRESH_COALESCING_WINDOW > 0:
+        _refresh_coalescer = RefreshCoalescer(window=rest_microservice_settings.REFRESH_COALESCING_WINDOW,
+                                              cache_alias=rest_microservice_settings.REFRESH_COALESCING_CACHE_ALIAS)
+    return _refresh_coalescer
+
+
+def reset_refresh_coalescer(*args, **kwargs):
+    global _refresh_coalescer
+    if kwargs.get("setting", "REST_FRAMEWORK_MICROSERVICE") == "REST_FRAMEWORK_MICROSERVICE":
+        _refresh_coalescer = None
+
+
+setting_changed.connect(reset_refresh_coalescer)
+
+
+def forget_coalesced_refresh(jti):
+    """Discard the tokens minted by the refresh of a refresh token being logged off."""
+    coalescer = get_refresh_coalescer()
+    if coalescer is not None:
+        coalescer.delete_many([jti])
+
+
+async def aforget_coalesced_refresh(jti):
+    coalescer = get_refresh_coalescer()
+    if coalescer is not None:
+        await coalescer.adelete_many([jti])
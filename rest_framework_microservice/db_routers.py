@@ -0,0 +1,100 @@
+"""
+Routing of the reads of the authentication endpoints to database replicas, enabled by adding `ReplicaRouter` to
+Django DATABASE_ROUTERS setting and listing replica aliases in DB_REPLICAS setting. Only reads made while handling
+refreshes, social exchanges, sign-ins and token verifications go to replicas, other queries of the project are left to
+the next routers.
+
+Replicas may lag behind the primary, ie: a token blacklisted on log off may not be blacklisted on replicas yet. So
+after a user logs in, logs off or rotates a refresh token, the user is pinned to the primary for DB_REPLICA_PIN_WINDOW
+seconds, and a request reads from the primary as soon as it writes.
+"""
+import random
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from django.core.cache import caches
+from .settings import rest_microservice_settings
+
+CACHE_KEY_PREFIX = "rest_framework_microservice:pinned:"
+REPLICA = "replica"
+PRIMARY = "primary"
+
+_routing = ContextVar("rest_framework_microservice_db_routing", default=None)
+
+
+def get_pin_cache():
+    return caches[rest_microservice_settings.DB_REPLICA_PIN_CACHE_ALIAS]
+
+
+def make_key(user_id):
+    return f"{CACHE_KEY_PREFIX}{user_id}"
+
+
+def pin_user(user_id):
+    """Route reads of the user's requests to the primary for DB_REPLICA_PIN_WINDOW seconds."""
+    if rest_microservice_settings.DB_REPLICAS and user_id is not None:
+        get_pin_cache().set(make_key(user_id), True, rest_microservice_settings.DB_REPLICA_PIN_WINDOW)
+
+
+def pin_users(user_ids):
+    if rest_microservice_settings.DB_REPLICAS:
+        get_pin_cache().set_many({make_key(user_id): True for user_id in user_ids},
+                                 rest_microservice_settings.DB_REPLICA_PIN_WINDOW)
+
+
+async def apin_user(user_id):
+    if rest_microservice_settings.DB_REPLICAS and user_id is not None:
+        await get_pin_cache().aset(make_key(user_id), True, rest_microservice_settings.DB_REPLICA_PIN_WINDOW)
+
+
+@contextmanager
+def replica_reads(*user_ids):
+    """Send the reads of the enclosed block to replicas, unless one of the users is pinned to the primary."""
+    if not rest_microservice_settings.DB_REPLICAS:
+        yield
+        return
+
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    pinned = bool(user_ids) and bool(get_pin_cache().get_many([make_key(user_id) for user_id in user_ids]))
+    token = _routing.set(PRIMARY if pinned else REPLICA)
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+@asynccontextmanager
+async def areplica_reads(*user_ids):
+    if not rest_microservice_settings.DB_REPLICAS:
+        yield
+        return
+
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    pinned = bool(user_ids) and bool(await get_pin_cache().aget_many([make_key(user_id) for user_id in user_ids]))
+    token = _routing.set(PRIMARY if pinned else REPLICA)
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Database router sending reads made within `replica_reads` to a random replica listed in DB_REPLICAS setting.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _routing.get() == REPLICA and rest_microservice_settings.DB_REPLICAS:
+            return random.choice(rest_microservice_settings.DB_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        if _routing.get() == REPLICA:
+            # reads following a write of the request see the write
+            _routing.set(PRIMARY)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        replicas = rest_microservice_settings.DB_REPLICAS
+        if obj1._state.db in replicas or obj2._state.db in replicas:
+            return True
+        return None
@@ -0,0 +1,141 @@
+"""
+Server-side storage of refresh tokens under short random handles. When REFRESH_HANDLE_STORE_CLASS setting is
+specified, the refresh cookie only contains the handle, which is neither signed nor decoded, and the refresh token
+is looked up by the handle in the store.
+"""
+import secrets
+from datetime import datetime, timezone as dt_timezone
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.test.signals import setting_changed
+from django.utils import timezone
+from .settings import rest_microservice_settings
+
+
+class RefreshHandleStore:
+    """
+    Base class of refresh handle stores, which should be specified in setting REFRESH_HANDLE_STORE_CLASS.
+    """
+    handle_bytes = 24
+
+    def make_handle(self):
+        return secrets.token_urlsafe(self.handle_bytes)
+
+    def save(self, refresh_token, expires_at):
+        """Store refresh token until `expires_at` unix timestamp, returns its handle."""
+        raise NotImplementedError()
+
+    def get(self, handle):
+        """Get refresh token stored under handle, or None if it does not exist or has expired."""
+        raise NotImplementedError()
+
+    def delete(self, handle):
+        raise NotImplementedError()
+
+    async def asave(self, refresh_token, expires_at):
+        return await sync_to_async(self.save)(refresh_token, expires_at)
+
+    async def aget(self, handle):
+        return await sync_to_async(self.get)(handle)
+
+    async def adelete(self, handle):
+        return await sync_to_async(self.delete)(handle)
+
+
+class CacheRefreshHandleStore(RefreshHandleStore):
+    """
+    Stores refresh tokens in the Django cache specified by REFRESH_HANDLE_CACHE_ALIAS setting, expiring with them.
+    The cache should be persistent and shared by all processes, ie: Redis.
+    """
+    key_prefix = "rest_framework_microservice:refresh_handle:"
+
+    @property
+    def cache(self):
+        return caches[rest_microservice_settings.REFRESH_HANDLE_CACHE_ALIAS]
+
+    def make_key(self, handle):
+        return f"{self.key_prefix}{handle}"
+
+    @staticmethod
+    def get_timeout(expires_at):
+        return max(int(expires_at - timezone.now().timestamp()), 1)
+
+    def save(self, refresh_token, expires_at):
+        handle = self.make_handle()
+        self.cache.set(self.make_key(handle), refresh_token, self.get_timeout(expires_at))
+        return handle
+
+    def get(self, handle):
+        return self.cache.get(self.make_key(handle))
+
+    def delete(self, handle):
+        self.cache.delete(self.make_key(handle))
+
+    async def asave(self, refresh_token, expires_at):
+        handle = self.make_handle()
+        await self.cache.aset(self.make_key(handle), refresh_token, self.get_timeout(expires_at))
+        return handle
+
+    async def aget(self, handle):
+        return await self.cache.aget(self.make_key(handle))
+
+    async def adelete(self, handle):
+        await self.cache.adelete(self.make_key(handle))
+
+
+class DatabaseRefreshHandleStore(RefreshHandleStore):
+    """
+    Stores refresh tokens in the `RefreshHandle` table, keyed by handle. Expired rows are ignored, and deleted by
+    the `prune_tokens` management command.
+    """
+
+    @staticmethod
+    def get_model():
+        from .models import RefreshHandle
+        return RefreshHandle
+
+    def save(self, refresh_token, expires_at):
+        handle = self.make_handle()
+        self.get_model().objects.create(handle=handle, token=refresh_token,
+                                        expires_at=datetime.fromtimestamp(expires_at, tz=dt_timezone.utc))
+        return handle
+
+    def get(self, handle):
+        return self.get_model().objects.filter(handle=handle, expires_at__gt=timezone.now()) \
+            .values_list("token", flat=True).first()
+
+    def delete(self, handle):
+        self.get_model().objects.filter(handle=handle).delete()
+
+    async def asave(self, refresh_token, expires_at):
+        handle = self.make_handle()
+        await self.get_model().objects.acreate(handle=handle, token=refresh_token,
+                                               expires_at=datetime.fromtimestamp(expires_at, tz=dt_timezone.utc))
+        return handle
+
+    async def aget(self, handle):
+        return await self.get_model().objects.filter(handle=handle, expires_at__gt=timezone.now()) \
+            .values_list("token", flat=True).afirst()
+
+    async def adelete(self, handle):
+        await self.get_model().objects.filter(handle=handle).adelete()
+
+
+_refresh_handle_store = None
+
+
+def get_refresh_handle_store():
+    """Get the refresh handle store, or None if refresh tokens are stored in cookies."""
+    global _refresh_handle_store
+    if _refresh_handle_store is None and rest_microservice_settings.REFRESH_HANDLE_STORE_CLASS is not None:
+        _refresh_handle_store = rest_microservice_settings.REFRESH_HANDLE_STORE_CLASS()
+    return _refresh_handle_store
+
+
+def reset_refresh_handle_store(*args, **kwargs):
+    global _refresh_handle_store
+    if kwargs.get("setting", "REST_FRAMEWORK_MICROSERVICE") == "REST_FRAMEWORK_MICROSERVICE":
+        _refresh_handle_store = None
+
+
+setting_changed.connect(reset_refresh_handle_store)
@@ -0,0 +1,45 @@
+import sys
+from contextlib import ExitStack
+from django.core.management.base import BaseCommand, CommandError
+from ...bulk_provisioning import provision_idp_users, read_idp_users
+
+
+class Command(BaseCommand):
+    help = "Creates or links the users of an IDP export (JSONL or CSV) in batches, ahead of their first log in. " \
+           "Users already provisioned are left unchanged, so the command can be run again."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Export of the IDP users, or - to read from standard input.")
+        parser.add_argument("--format", choices=["jsonl", "csv"], default=None,
+                            help="Format of the export, defaults to the extension of the file, or jsonl.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of users provisioned per batch.")
+        parser.add_argument("--sleep", type=float, default=0, help="Number of seconds to wait between batches.")
+        parser.add_argument("--issuer", default=None,
+                            help="Issuer of the users in IDPS setting, whose provider maps their claims.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or ("csv" if path.lower().endswith(".csv") else "jsonl")
+
+        def progress(read, counts):
+            self.stdout.write(f"Read {read} users: {self.format_counts(counts)}.")
+
+        with ExitStack() as stack:
+            try:
+                # standard input is left open for the caller
+                export = sys.stdin if path == "-" else \
+                    stack.enter_context(open(path, newline="", encoding="utf-8"))
+            except OSError as e:
+                raise CommandError(f"Cannot read {path}: {e}")
+
+            try:
+                counts = provision_idp_users(read_idp_users(export, file_format), batch_size=options["batch_size"],
+                                             sleep=options["sleep"], issuer=options["issuer"], progress=progress)
+            except ValueError as e:
+                # users of the batches reported before are provisioned, and left unchanged by running again
+                raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Provisioned users: {self.format_counts(counts)}."))
+
+    @staticmethod
+    def format_counts(counts):
+        return ", ".join(f"{count} {key}" for key, count in counts.items())
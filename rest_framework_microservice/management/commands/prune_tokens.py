@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import router
+from django.utils import timezone
+from ...pruning import prune_expired_refresh_handles, prune_expired_tokens
+from ...tokens import blacklist_installed
+
+
+class Command(BaseCommand):
+    help = "Deletes expired outstanding tokens, blacklisted tokens and refresh handles in batches, " \
+           "can be resumed using --start-id."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of rows deleted per batch.")
+        parser.add_argument("--sleep", type=float, default=0.1, help="Number of seconds to wait between batches.")
+        parser.add_argument("--start-id", type=int, default=0, help="Resume after this outstanding token id.")
+        parser.add_argument("--max-batches", type=int, default=None, help="Stop after this number of batches.")
+
+    def handle(self, *args, **options):
+        if blacklist_installed():
+            batches = 0
+
+            def progress(deleted, last_id):
+                nonlocal batches
+                batches += 1
+                self.stdout.write(f"Deleted {deleted} expired tokens, last id {last_id}.")
+
+            expired_before = timezone.now()
+            deleted, last_id = prune_expired_tokens(batch_size=options["batch_size"], sleep=options["sleep"],
+                                                    start_id=options["start_id"], max_batches=options["max_batches"],
+                                                    expired_before=expired_before, progress=progress)
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired tokens."))
+            if batches == options["max_batches"] and self.has_expired_tokens(last_id, expired_before):
+                self.stdout.write(f"Stopped after {batches} batches, resume with --start-id {last_id}.")
+
+        deleted = prune_expired_refresh_handles(
+            batch_size=options["batch_size"], sleep=options["sleep"], max_batches=options["max_batches"],
+            progress=lambda deleted: self.stdout.write(f"Deleted {deleted} expired refresh handles."))
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired refresh handles."))
+
+    @staticmethod
+    def has_expired_tokens(last_id, expired_before):
+        from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+        return OutstandingToken.objects.using(router.db_for_write(OutstandingToken)) \
+            .filter(id__gt=last_id, expires_at__lt=expired_before).exists()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from ...settings import rest_microservice_settings
+from ...social_auth.snapshot import write_jwks_snapshot
+
+
+class Command(BaseCommand):
+    help = "Fetches the JWKS of the identity providers and writes them to the snapshot file loaded at start up."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default=None, help="Snapshot file, defaults to JWKS_SNAPSHOT_PATH setting.")
+
+    def handle(self, *args, **options):
+        path = options["path"] or rest_microservice_settings.JWKS_SNAPSHOT_PATH
+        if not path:
+            raise CommandError("Specify the snapshot file using --path or JWKS_SNAPSHOT_PATH setting.")
+
+        count = write_jwks_snapshot(path)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} keys to {path}."))
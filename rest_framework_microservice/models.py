@@ -1,5 +1,9 @@
+from functools import lru_cache
 from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from django.contrib.auth.models import Group, Permission
 from django.db import models
+from django.db.models.manager import EmptyManager
 from django.contrib.auth import get_user_model
 
 
@@ -15,9 +19,110 @@ class CustomTokenUser(TokenUser):
         return self.token.get(attr_name, None)
 
 
+class SlottedTokenUser:
+    """
+    Immutable counterpart of simplejwt `TokenUser`, whose id and custom claims listed in `claims` are read from the
+    token once, when the user is made, and stored in slots, so that the user can be shared by the requests made with
+    the same access token. Other claims remain available through `__getattr__`. See `make_token_user_class`.
+    """
+    __slots__ = ("token", "id", "pk", "username", "is_staff", "is_superuser")
+    claims = ()
+
+    # user is always active since simplejwt never issues a token for an inactive user
+    is_active = True
+    is_anonymous = False
+    is_authenticated = True
+    groups = EmptyManager(Group)
+    user_permissions = EmptyManager(Permission)
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        attributes = {"token": token, "id": user_id, "pk": user_id, "username": token.get("username", ""),
+                      "is_staff": token.get("is_staff", False), "is_superuser": token.get("is_superuser", False)}
+        attributes.update((claim, token.get(claim)) for claim in self.claims)
+        for name, value in attributes.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable.")
+
+    def __reduce__(self):
+        return type(self), (self.token,)
+
+    def __getattr__(self, attr_name):
+        # special attributes are not claims, ie: `__dict__` which users do not have
+        if attr_name == "token" or attr_name.startswith("__"):
+            raise AttributeError(attr_name)
+        return self.token.get(attr_name, None)
+
+    def __str__(self):
+        return f"TokenUser {self.id}"
+
+    def __eq__(self, other):
+        if not isinstance(other, (SlottedTokenUser, TokenUser)):
+            return NotImplemented
+        return self.id == other.id
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def save(self):
+        raise NotImplementedError("Token users have no DB representation")
+
+    def delete(self):
+        raise NotImplementedError("Token users have no DB representation")
+
+    def set_password(self, raw_password):
+        raise NotImplementedError("Token users have no DB representation")
+
+    def check_password(self, raw_password):
+        raise NotImplementedError("Token users have no DB representation")
+
+    def get_group_permissions(self, obj=None):
+        return set()
+
+    def get_all_permissions(self, obj=None):
+        return set()
+
+    def has_perm(self, perm, obj=None):
+        return False
+
+    def has_perms(self, perm_list, obj=None):
+        return False
+
+    def has_module_perms(self, module):
+        return False
+
+    def get_username(self):
+        return self.username
+
+
+@lru_cache(maxsize=None)
+def make_token_user_class(claims):
+    """Make a subclass of `SlottedTokenUser` with a slot for each of the given claims."""
+    claims = tuple(claim for claim in claims if not hasattr(SlottedTokenUser, claim))
+    return type("SlottedTokenUser", (SlottedTokenUser,), {"__slots__": claims, "claims": claims})
+
+
 class Idp(models.Model):
     user = models.OneToOneField(get_user_model(), on_delete=models.CASCADE, related_name="idp")
     uuid = models.UUIDField()
 
     class Meta:
-        indexes = [models.Index(fields=['uuid'])]
\ No newline at end of file
+        indexes = [models.Index(fields=['uuid'])]
+
+
+class RefreshHandle(models.Model):
+    """
+    Refresh token stored server-side under the opaque handle set in the refresh cookie,
+    see REFRESH_HANDLE_STORE_CLASS setting.
+    """
+    handle = models.CharField(max_length=64, primary_key=True)
+    token = models.TextField()
+    expires_at = models.DateTimeField(db_index=True)
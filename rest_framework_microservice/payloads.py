@@ -0,0 +1,129 @@
+"""
+Cache of the user dictionaries returned by the authentication endpoints when USER_SERIALIZER_CLASS is specified.
+When USER_PAYLOAD_CACHE_SIZE setting is specified, the serialized user is cached by user id and reused by sign-ins,
+social exchanges and refreshes until the user is saved or deleted, so the serializer only runs once per user change.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.test.signals import setting_changed
+from .claims import UserClaimsCache
+from .settings import rest_microservice_settings
+
+CACHE_KEY_PREFIX = "rest_framework_microservice:user_payload:"
+
+
+class UserPayloadCache(UserClaimsCache):
+    """
+    Two-tier cache of serialized users, see `UserClaimsCache`. Shared cache keys are versioned by the serializer class
+    and USER_PAYLOAD_CACHE_VERSION setting, so that payloads cached by processes running a different serializer are
+    not served.
+    """
+
+    def __init__(self, serializer_class, version, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.serializer_class = serializer_class
+        self.version = f"{serializer_class.__module__}.{serializer_class.__qualname__}:{version}"
+        self.fields = frozenset(field.source for field in serializer_class().fields.values())
+
+    def make_key(self, user_id):
+        return f"{CACHE_KEY_PREFIX}{self.version}:{user_id}"
+
+    def depends_on(self, update_fields):
+        """Whether saving the given fields of a user, or all of them if None, may change its payload."""
+        return update_fields is None or "*" in self.fields or not self.fields.isdisjoint(update_fields)
+
+
+_user_payload_cache = None
+
+
+def get_user_payload_cache():
+    """Get the user payload cache, or None if it is disabled by setting USER_PAYLOAD_CACHE_SIZE to 0."""
+    global _user_payload_cache
+    if _user_payload_cache is None and rest_microservice_settings.USER_PAYLOAD_CACHE_SIZE > 0 \
+            and rest_microservice_settings.USER_SERIALIZER_CLASS:
+        _user_payload_cache = UserPayloadCache(
+            serializer_class=rest_microservice_settings.USER_SERIALIZER_CLASS,
+            version=rest_microservice_settings.USER_PAYLOAD_CACHE_VERSION,
+            local_size=rest_microservice_settings.USER_PAYLOAD_CACHE_SIZE,
+            local_timeout=rest_microservice_settings.USER_PAYLOAD_CACHE_TIMEOUT,
+            cache_alias=rest_microservice_settings.USER_PAYLOAD_CACHE_ALIAS,
+            cache_timeout=rest_microservice_settings.USER_PAYLOAD_CACHE_SHARED_TIMEOUT)
+    return _user_payload_cache
+
+
+def reset_user_payload_cache(*args, **kwargs):
+    global _user_payload_cache
+    if kwargs.get("setting", "REST_FRAMEWORK_MICROSERVICE") == "REST_FRAMEWORK_MICROSERVICE":
+        _user_payload_cache = None
+
+
+setting_changed.connect(reset_user_payload_cache)
+
+
+def get_user_payload(user=None, user_id=None):
+    """
+    Serialize user using USER_SERIALIZER_CLASS, or get its cached payload. If only `user_id` is given, the user is
+    queried when its payload is not cached.
+    """
+    user_payload_cache = get_user_payload_cache()
+    if user_payload_cache is None:
+        user = user if user is not None else get_user_model().objects.get(pk=user_id)
+        return rest_microservice_settings.USER_SERIALIZER_CLASS(user).data
+
+    user_id = user.pk if user is not None else user_id
+    payload = user_payload_cache.get(user_id)
+    if payload is None:
+        user = user if user is not None else get_user_model().objects.get(pk=user_id)
+        payload = dict(user_payload_cache.serializer_class(user).data)
+        user_payload_cache.set(user_id, payload)
+    return payload
+
+
+async def aget_user_payload(user=None, user_id=None):
+    user_payload_cache = get_user_payload_cache()
+    if user_payload_cache is not None:
+        payload = await user_payload_cache.aget(user.pk if user is not None else user_id)
+        if payload is not None:
+            return payload
+    return await sync_to_async(get_user_payload)(user, user_id)
+
+
+def is_user_needed(user_id):
+    """Whether the user has to be queried to make an auth response, ie: its payload is not cached."""
+    if not rest_microservice_settings.USER_SERIALIZER_CLASS:
+        return False
+    user_payload_cache = get_user_payload_cache()
+    return user_payload_cache is None or user_payload_cache.get(user_id) is None
+
+
+async def ais_user_needed(user_id):
+    if not rest_microservice_settings.USER_SERIALIZER_CLASS:
+        return False
+    user_payload_cache = get_user_payload_cache()
+    return user_payload_cache is None or await user_payload_cache.aget(user_id) is None
+
+
+def invalidate_user_payload(user):
+    """
+    Discard the cached payload of a user, given a user instance or id. This is called when a user is saved or deleted,
+    and should also be called when related objects included by USER_SERIALIZER_CLASS change.
+    """
+    user_payload_cache = get_user_payload_cache()
+    if user_payload_cache is not None:
+        user_payload_cache.delete(getattr(user, "pk", user))
+
+
+def invalidate_user_payload_receiver(sender, instance, update_fields=None, **kwargs):
+    user_payload_cache = get_user_payload_cache()
+    # saving last login on sign-in does not invalidate payloads which do not include it
+    if user_payload_cache is not None and user_payload_cache.depends_on(update_fields):
+        user_payload_cache.delete(instance.pk)
+
+
+def connect_signals():
+    user_model = get_user_model()
+    post_save.connect(invalidate_user_payload_receiver, sender=user_model,
+                      dispatch_uid="rest_framework_microservice_user_payload_post_save")
+    post_delete.connect(invalidate_user_payload_receiver, sender=user_model,
+                        dispatch_uid="rest_framework_microservice_user_payload_post_delete")
@@ -0,0 +1,143 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
+from django.utils import timezone
+from .models import Idp
+from .settings import rest_microservice_settings
+from .write_behind import get_write_behind_queue, record_idp_uuid, record_last_login
+
+
+class UserProvisioner:
+    """
+    Resolves the Django user for the verified id token claims of a user logging in with IDP, creating the user
+    if needed, and records the log in. This class should be specified in setting USER_PROVISIONER_CLASS.
+    """
+
+    def provision(self, id_token):
+        raise NotImplementedError()
+
+    async def aprovision(self, id_token):
+        return await sync_to_async(self.provision)(id_token)
+
+    @staticmethod
+    def get_user_defaults(id_token):
+        """Attributes of user to be created from IDP id token claims."""
+        user_defaults = {
+            "username": id_token.get("cognito:username") or id_token.get("preferred_username") or id_token["email"],
+            "first_name": id_token.get("given_name") or "",
+            "last_name": id_token.get("family_name") or "",
+        }
+
+        if rest_microservice_settings.USER_MODEL_UUID_FIELD is not None:
+            user_defaults[rest_microservice_settings.USER_MODEL_UUID_FIELD] = id_token['sub']
+
+        return user_defaults
+
+
+class EmailUserProvisioner(UserProvisioner):
+    """
+    Resolves user by email, then updates the IDP uuid of the user and its last login in separate queries.
+    """
+
+    def provision(self, id_token):
+        user, created = get_user_model().objects.get_or_create(email=id_token["email"],
+                                                               defaults=self.get_user_defaults(id_token))
+
+        if rest_microservice_settings.USER_MODEL_UUID_FIELD is None:
+            record_idp_uuid(user, id_token['sub'])
+
+        record_last_login(user)
+        return user
+
+
+class UuidUserProvisioner(UserProvisioner):
+    """
+    Resolves user by the IDP uuid (`sub` claim) first, using the indexed `Idp.uuid` or USER_MODEL_UUID_FIELD.
+    A returning user takes one SELECT and one UPDATE of last login. Only when no user is linked to the uuid, the user
+    is resolved by email or created with its last login set in the same INSERT, and linked to the uuid in the same
+    transaction, see `relinks_idp_users`.
+    """
+
+    def provision(self, id_token):
+        now = timezone.now()
+        user = self.get_user_queryset(id_token['sub']).first()
+
+        if user is None:
+            return self.create_or_link_user(id_token, now)
+
+        self.update_last_login(user, now)
+        return user
+
+    async def aprovision(self, id_token):
+        now = timezone.now()
+        user = await self.get_user_queryset(id_token['sub']).afirst()
+
+        if user is None:
+            return await sync_to_async(self.create_or_link_user)(id_token, now)
+
+        if rest_microservice_settings.WRITE_BEHIND:
+            self.update_last_login(user, now)
+        else:
+            await get_user_model().objects.filter(pk=user.pk).aupdate(last_login=now)
+            user.last_login = now
+        return user
+
+    @staticmethod
+    def get_user_queryset(uuid):
+        uuid_field = rest_microservice_settings.USER_MODEL_UUID_FIELD
+        lookup = {uuid_field: uuid} if uuid_field is not None else {"idp__uuid": uuid}
+        return get_user_model().objects.filter(**lookup)
+
+    @staticmethod
+    def update_last_login(user, now):
+        if rest_microservice_settings.WRITE_BEHIND:
+            get_write_behind_queue().add_last_login(user.pk, now)
+        else:
+            get_user_model().objects.filter(pk=user.pk).update(last_login=now)
+        user.last_login = now
+
+    def create_or_link_user(self, id_token, now):
+        uuid_field = rest_microservice_settings.USER_MODEL_UUID_FIELD
+        defaults = {**self.get_user_defaults(id_token), "last_login": now}
+
+        with transaction.atomic(using=router.db_for_write(get_user_model())):
+            user, created = get_user_model().objects.get_or_create(email=id_token["email"], defaults=defaults)
+
+            if created:
+                if uuid_field is None:
+                    Idp.objects.create(user=user, uuid=id_token['sub'])
+                return user
+
+            # existing user, ie: created before signing in with IDP, or signing in with another IDP
+            update_fields = {"last_login": now}
+            if uuid_field is not None and getattr(user, uuid_field) is None:
+                update_fields[uuid_field] = id_token['sub']
+            get_user_model().objects.filter(pk=user.pk).update(**update_fields)
+            for field, value in update_fields.items():
+                setattr(user, field, value)
+
+            if uuid_field is None:
+                self.link_idp(user, id_token['sub'])
+
+        return user
+
+    @staticmethod
+    def link_idp(user, uuid):
+        db = router.db_for_write(Idp)
+        if not relinks_idp_users():
+            Idp.objects.using(db).bulk_create([Idp(user=user, uuid=uuid)], ignore_conflicts=True)
+        elif getattr(connections[db].features, "supports_update_conflicts_with_target", False):
+            Idp.objects.using(db).bulk_create([Idp(user=user, uuid=uuid)], update_conflicts=True,
+                                              unique_fields=["user"], update_fields=["uuid"])
+        else:
+            Idp.objects.using(db).update_or_create(user=user, defaults={"uuid": uuid})
+
+
+def relinks_idp_users():
+    """
+    Whether a user found by email is linked to its new IDP uuid when already linked to another one, ie: after its `sub`
+    changed at IDP. Only with a single provider: with several providers in IDPS setting, users keep the link of the
+    first provider they logged in with, which would otherwise flip-flop between providers on every log in.
+    """
+    from .social_auth.providers import get_provider_registry
+    return len(get_provider_registry().providers) == 1
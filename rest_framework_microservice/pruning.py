@@ -0,0 +1,78 @@
+"""
+Deletion of expired rows of the simplejwt `OutstandingToken` and `BlacklistedToken` tables and of the `RefreshHandle`
+table in small batches, so that each batch is a short, index-friendly transaction.
+"""
+import time
+from django.db import router, transaction
+from django.utils import timezone
+
+
+def prune_expired_tokens(batch_size=1000, sleep=0.1, start_id=0, max_batches=None, expired_before=None,
+                         progress=None):
+    """
+    Delete outstanding tokens expired before `expired_before` (defaults to now) and their blacklist entries, by
+    batches of `batch_size` tokens with `sleep` seconds between batches. Tokens are visited by increasing id from
+    `start_id`, so an interrupted run can be resumed from the last id reported. `progress` is called after each
+    batch with the number of tokens deleted so far and the last id visited.
+
+    Returns a tuple of the number of tokens deleted and the last id visited.
+    """
+    from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+    expired_before = expired_before or timezone.now()
+    db = router.db_for_write(OutstandingToken)
+    last_id, deleted, batches = start_id, 0, 0
+
+    while max_batches is None or batches < max_batches:
+        ids = list(OutstandingToken.objects.using(db)
+                   .filter(id__gt=last_id, expires_at__lt=expired_before)
+                   .order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+
+        with transaction.atomic(using=db):
+            # blacklist entries are cascade deleted in a single statement, as they have no signal receivers
+            _, deleted_by_model = OutstandingToken.objects.using(db).filter(id__in=ids).delete()
+        deleted += deleted_by_model.get(OutstandingToken._meta.label, 0)
+
+        last_id, batches = ids[-1], batches + 1
+        if progress is not None:
+            progress(deleted, last_id)
+        if len(ids) < batch_size:
+            break
+        if sleep:
+            time.sleep(sleep)
+
+    return deleted, last_id
+
+
+def prune_expired_refresh_handles(batch_size=1000, sleep=0.1, max_batches=None, progress=None):
+    """
+    Delete refresh handles (see REFRESH_HANDLE_STORE_CLASS setting) which have expired, by batches of `batch_size`
+    handles selected using the index on their expiry, with `sleep` seconds between batches. `progress` is called after
+    each batch with the number of handles deleted so far.
+
+    Returns the number of handles deleted.
+    """
+    from .models import RefreshHandle
+
+    expired_before = timezone.now()
+    db = router.db_for_write(RefreshHandle)
+    deleted, batches = 0, 0
+
+    while max_batches is None or batches < max_batches:
+        handles = list(RefreshHandle.objects.using(db).filter(expires_at__lt=expired_before)
+                       .values_list("handle", flat=True)[:batch_size])
+        if not handles:
+            break
+
+        deleted += RefreshHandle.objects.using(db).filter(handle__in=handles).delete()[0]
+        batches += 1
+        if progress is not None:
+            progress(deleted)
+        if len(handles) < batch_size:
+            break
+        if sleep:
+            time.sleep(sleep)
+
+    return deleted
@@ -0,0 +1,49 @@
+"""
+Fast JSON rendering of the authentication responses, enabled by FAST_JSON_RENDERER setting. Responses of the
+authentication views are always rendered as compact JSON, skipping content negotiation, and using `orjson` when it is
+installed.
+"""
+import json
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from .settings import rest_microservice_settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_default = JSONEncoder().default
+
+
+def render_json(data):
+    """Render data as compact JSON bytes, falling back to Django REST framework encoder for other types."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return render_json(data)
+
+
+class FastJSONRenderingMixin:
+    """
+    Renders responses of Django REST framework views using `FastJSONRenderer` when FAST_JSON_RENDERER is enabled,
+    regardless of the `Accept` header of the request.
+    """
+
+    def get_renderers(self):
+        if rest_microservice_settings.FAST_JSON_RENDERER:
+            return [FastJSONRenderer()]
+        return super().get_renderers()
+
+    def perform_content_negotiation(self, request, force=False):
+        if rest_microservice_settings.FAST_JSON_RENDERER:
+            renderer = FastJSONRenderer()
+            return renderer, renderer.media_type
+        return super().perform_content_negotiation(request, force)
@@ -0,0 +1,340 @@
+"""
+In-process index of revoked refresh tokens, checked before the simplejwt blacklist tables. A Bloom filter of the
+jtis of blacklisted tokens is kept in memory and synced from the database every REVOCATION_FILTER_SYNC_INTERVAL
+seconds, so checking a token which is definitely not revoked does not query the database, and only possible hits
+fall through to a blacklist query. Enable using the REVOCATION_FILTER setting.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import timedelta
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.db import connections, router, transaction
+from django.db.models import DateTimeField, QuerySet, Value
+from django.test.signals import setting_changed
+from django.utils import timezone
+from .coalescing import get_refresh_coalescer
+from .db_routers import pin_users
+from .settings import rest_microservice_settings
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Bloom filter of strings sized for `capacity` items at the given false positive rate.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.size = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+
+class RevokedTokenFilter:
+    """
+    Bloom filter of revoked jtis synced from `BlacklistedToken` table. Each sync reads the tokens blacklisted since
+    the previous sync (overlapping by one interval so late committed rows are not missed), and the filter is rebuilt
+    from the unexpired blacklisted tokens once it holds more than its capacity. A rebuilt filter is sized for twice
+    the unexpired blacklisted tokens, and at least `capacity`, so it is only rebuilt again once the blacklist has
+    grown. Tokens blacklisted by this process are added immediately, tokens blacklisted by other processes are seen
+    after the next sync.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001, sync_interval=10):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.last_synced_at = None
+        self._last_sync_started_at = None
+        self._added_during_rebuild = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._background_lock = threading.Lock()
+        self._background_sync_running = False
+
+        self.checks = 0
+        self.negatives = 0
+        self.false_positives = 0
+        self.true_positives = 0
+        self.syncs = 0
+
+    def add(self, jti):
+        with self._lock:
+            if jti not in self.bloom:
+                self.bloom.add(jti)
+            if self._added_during_rebuild is not None:
+                self._added_during_rebuild.append(jti)
+
+    def might_be_revoked(self, jti):
+        """Check if jti may be revoked. False is definite, True has to be confirmed using the blacklist."""
+        self.checks += 1
+        if jti in self.bloom:
+            return True
+        self.negatives += 1
+        return False
+
+    def record_result(self, revoked):
+        """Record whether a possible hit was confirmed by the blacklist, for false positive rate metrics."""
+        if revoked:
+            self.true_positives += 1
+        else:
+            self.false_positives += 1
+
+    def is_stale(self):
+        return self.last_synced_at is None or time.monotonic() - self.last_synced_at >= self.sync_interval
+
+    def sync(self, force=False):
+        """Add the jtis blacklisted since the previous sync, rebuilding the filter when it is full."""
+        if not self._sync_lock.acquire(blocking=self.last_synced_at is None):
+            return  # another thread is syncing, keep using the current filter meanwhile
+
+        try:
+            if not force and not self.is_stale():
+                return
+
+            from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+            started_at, now = time.monotonic(), timezone.now()
+            queryset = BlacklistedToken.objects.filter(token__expires_at__gt=now)
+            rebuild = self.last_synced_at is None or len(self.bloom) > self.bloom.capacity
+            if not rebuild:
+                # tokens blacklisted since the previous sync started, with the lag as margin for late commits
+                lag = started_at - self.last_synced_at
+                queryset = queryset.filter(blacklisted_at__gte=self._last_sync_started_at - timedelta(seconds=lag))
+
+            jtis = queryset.values_list("token__jti", flat=True).iterator()
+            if rebuild:
+                self._added_during_rebuild = []
+                bloom = BloomFilter(max(self.capacity, 2 * queryset.count()), self.error_rate)
+                for jti in jtis:
+                    bloom.add(jti)
+                with self._lock:
+                    for jti in self._added_during_rebuild:
+                        bloom.add(jti)
+                    self.bloom, self._added_during_rebuild = bloom, None
+            else:
+                for jti in jtis:
+                    self.add(jti)
+
+            self.last_synced_at, self._last_sync_started_at = started_at, now
+            self.syncs += 1
+        finally:
+            self._sync_lock.release()
+
+    def sync_if_stale(self):
+        """
+        Sync the filter when it is stale. Only the first sync blocks the caller, later syncs run in a background
+        thread while the current filter keeps being used.
+        """
+        if self.last_synced_at is None:
+            self.sync()
+        elif self.is_stale():
+            self._start_background_sync()
+
+    def _start_background_sync(self):
+        with self._background_lock:
+            if self._background_sync_running:
+                return
+            self._background_sync_running = True
+
+        threading.Thread(target=self._background_sync, name="rest_framework_microservice_revocation_sync",
+                         daemon=True).start()
+
+    def _background_sync(self):
+        try:
+            self.sync()
+        except Exception:
+            logger.exception("Background sync of revoked token filter failed.")
+        finally:
+            self._background_sync_running = False
+            connections.close_all()
+
+    def stats(self):
+        confirmations = self.false_positives + self.negatives
+        return {
+            "checks": self.checks,
+            "negatives": self.negatives,
+            "true_positives": self.true_positives,
+            "false_positives": self.false_positives,
+            "false_positive_rate": self.false_positives / confirmations if confirmations else 0.0,
+            "size": len(self.bloom),
+            "capacity": self.bloom.capacity,
+            "syncs": self.syncs,
+            "sync_lag": time.monotonic() - self.last_synced_at if self.last_synced_at is not None else None,
+        }
+
+
+_revoked_token_filter = None
+
+
+def get_revoked_token_filter():
+    """Get the revoked token filter, or None if it is disabled by REVOCATION_FILTER setting."""
+    global _revoked_token_filter
+    if _revoked_token_filter is None and rest_microservice_settings.REVOCATION_FILTER:
+        _revoked_token_filter = RevokedTokenFilter(
+            capacity=rest_microservice_settings.REVOCATION_FILTER_CAPACITY,
+            error_rate=rest_microservice_settings.REVOCATION_FILTER_ERROR_RATE,
+            sync_interval=rest_microservice_settings.REVOCATION_FILTER_SYNC_INTERVAL)
+    return _revoked_token_filter
+
+
+def reset_revoked_token_filter(*args, **kwargs):
+    global _revoked_token_filter
+    if kwargs.get("setting", "REST_FRAMEWORK_MICROSERVICE") == "REST_FRAMEWORK_MICROSERVICE":
+        _revoked_token_filter = None
+
+
+setting_changed.connect(reset_revoked_token_filter)
+
+
+def query_blacklisted_jtis(jtis):
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+    return set(BlacklistedToken.objects.filter(token__jti__in=jtis).values_list("token__jti", flat=True))
+
+
+def get_revoked_jtis(jtis):
+    """Get the subset of jtis which are blacklisted, only querying the blacklist for possible hits of the filter."""
+    jtis = [jti for jti in jtis if jti is not None]
+    revoked_token_filter = get_revoked_token_filter()
+    if revoked_token_filter is None:
+        return query_blacklisted_jtis(jtis)
+
+    revoked_token_filter.sync_if_stale()
+
+    candidates = [jti for jti in jtis if revoked_token_filter.might_be_revoked(jti)]
+    revoked = query_blacklisted_jtis(candidates) if candidates else set()
+    for jti in candidates:
+        revoked_token_filter.record_result(jti in revoked)
+    return revoked
+
+
+def is_token_revoked(jti):
+    return jti in get_revoked_jtis([jti])
+
+
+async def ais_token_revoked(jti):
+    revoked_token_filter = get_revoked_token_filter()
+    if revoked_token_filter is None or revoked_token_filter.last_synced_at is None:
+        return await sync_to_async(is_token_revoked)(jti)
+
+    revoked_token_filter.sync_if_stale()
+
+    if not revoked_token_filter.might_be_revoked(jti):
+        return False
+
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+    revoked = await BlacklistedToken.objects.filter(token__jti=jti).aexists()
+    revoked_token_filter.record_result(revoked)
+    return revoked
+
+
+def record_revoked_jti(jti):
+    """Add jti of a token blacklisted by this process to the filter."""
+    revoked_token_filter = get_revoked_token_filter()
+    if revoked_token_filter is not None:
+        revoked_token_filter.add(jti)
+
+
+def get_user_tokens(users):
+    """Unexpired outstanding tokens of `users`, a user, a user id or a queryset of users."""
+    from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+    if isinstance(users, QuerySet):
+        user_filter = {"user__in": users.values("pk")}
+    else:
+        user_filter = {"user": getattr(users, "pk", users)}
+    return OutstandingToken.objects.filter(**user_filter, expires_at__gt=timezone.now()).order_by()
+
+
+def revoke_user_tokens(users, batch_size=1000):
+    """
+    Blacklist every unexpired refresh token issued to `users`, a user, a user id or a queryset of users, using a
+    single INSERT ... SELECT statement instead of a query per token, ie: to log a user off every device, or every user
+    after an incident. With WRITE_BEHIND, tokens rotated by other processes are only revoked once their write-behind
+    queue has been flushed. The tokens are then added to the revoked token filter of this process and their coalesced
+    refreshes are discarded, by batches of `batch_size` jtis, and their users are pinned to the primary database
+    when reads are routed to replicas.
+
+    Returns the number of tokens blacklisted.
+    """
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+    from .write_behind import flush_write_behind_queue
+
+    # rotated tokens pending in the write-behind queue of this process are written first, so they are revoked too
+    flush_write_behind_queue()
+
+    db = router.db_for_write(BlacklistedToken)
+    tokens = get_user_tokens(users).using(db)
+    select = tokens.filter(blacklistedtoken__isnull=True) \
+        .annotate(revoked_at=Value(timezone.now(), output_field=DateTimeField())) \
+        .values_list("pk", "revoked_at")
+    select_sql, params = select.query.get_compiler(db).as_sql()
+
+    connection = connections[db]
+    table = connection.ops.quote_name(BlacklistedToken._meta.db_table)
+    columns = ", ".join(connection.ops.quote_name(BlacklistedToken._meta.get_field(field).column)
+                        for field in ("token", "blacklisted_at"))
+
+    with transaction.atomic(using=db), connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table} ({columns}) {select_sql}", params)
+        revoked = cursor.rowcount
+
+    forget_revoked_tokens(tokens, batch_size)
+    return revoked
+
+
+async def arevoke_user_tokens(users, batch_size=1000):
+    return await sync_to_async(revoke_user_tokens)(users, batch_size)
+
+
+def forget_revoked_tokens(tokens, batch_size=1000):
+    """Update the in-process state depending on the revoked tokens."""
+    revoked_token_filter = get_revoked_token_filter()
+    coalescer = get_refresh_coalescer()
+
+    if revoked_token_filter is not None or coalescer is not None:
+        jtis = tokens.values_list("jti", flat=True).iterator(chunk_size=batch_size)
+        while True:
+            batch = list(islice(jtis, batch_size))
+            if not batch:
+                break
+            if revoked_token_filter is not None:
+                for jti in batch:
+                    revoked_token_filter.add(jti)
+            if coalescer is not None:
+                coalescer.delete_many(batch)
+
+    if rest_microservice_settings.DB_REPLICAS:
+        user_ids = tokens.values_list("user", flat=True).distinct().iterator(chunk_size=batch_size)
+        while True:
+            batch = list(islice(user_ids, batch_size))
+            if not batch:
+                break
+            pin_users(batch)
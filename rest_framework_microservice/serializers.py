@@ -1,47 +1,83 @@
+import copy
 from operator import attrgetter
 from django.conf import settings
 from .settings import rest_microservice_settings
 from rest_framework import serializers
 from rest_framework import status
-from rest_framework.exceptions import APIException
-from rest_framework_simplejwt.serializers import TokenObtainSerializer, TokenRefreshSerializer
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainSerializer, TokenRefreshSerializer, TokenVerifySerializer
+from rest_framework_simplejwt.exceptions import ExpiredTokenError, TokenError
 from rest_framework_simplejwt.settings import api_settings
-from django.utils.module_loading import import_string
 from .exceptions import InvalidToken, TokenExpired
-from django.contrib.auth.models import update_last_login
 from django.contrib.auth import get_user_model
-from jwt import ExpiredSignatureError
+from jwt import ExpiredSignatureError, PyJWTError
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework.response import Response
-from .social_auth.aws_cognito import decode_token
-from .models import Idp
+from .admission import authenticate_user, get_admission_controller
+from .claims import get_claims_cache
+from .coalescing import get_refresh_coalescer
+from .db_routers import pin_user, replica_reads
+from .payloads import get_user_payload, is_user_needed
+from .social_auth.providers import get_provider_registry
+from .timing import stage
+from .revocation import get_revoked_jtis, is_token_revoked
+from .tokens import DeferredBlacklistCheckRefreshToken, RefreshToken, UntypedToken, blacklist_installed
+from .write_behind import blacklist_token, record_last_login, record_outstanding_token
+
+def get_custom_token_claims(user):
+    """Get dictionary of custom token claims specified using settings."""
+    return rest_microservice_settings.claims_builder.build(user)
+
 
 def add_custom_token_claims(token, user):
     """Append custom token claims specified using settings."""
-    for attr in rest_microservice_settings.CUSTOM_TOKEN_USER_ATTRIBUTES:
-        token[attr] = getattr(user, attr, None)
+    token.payload.update(get_custom_token_claims(user))
+    return token
 
-    for attr in rest_microservice_settings.CUSTOM_TOKEN_CALLABLE_ATTRIBUTES:
-        attr_name = attr["attr_name"]
-        attr_getter = import_string(attr["attr_getter"])
-        token[attr_name] = attr_getter(user)
 
-    return token
+def make_token_data(refresh, user):
+    """Make validated data containing the tokens issued to user, as returned by log in serializers."""
+    access = refresh.access_token
+    return {
+        'refresh': str(refresh),
+        'access': str(access),
+        'refresh_expiry': refresh.payload['exp'],
+        'access_expiry': access['exp'],
+        'user': user
+    }
+
+
+def make_rotated_token(refresh):
+    """Make a copy of refresh token with a new jti and expiry, leaving the given token unchanged."""
+    rotated = copy.copy(refresh)
+    rotated.payload = refresh.payload.copy()
+    rotated.set_jti()
+    rotated.set_exp()
+    return rotated
+
+
+def blacklists_rotated_tokens():
+    """Whether refreshes blacklist the refresh token they rotate, so that its blacklisting is not a log off."""
+    return api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION and blacklist_installed()
 
 
 class SerializerResponseMixin:
-    def make_auth_response(self):
-        access_token = self.validated_data['access']
-        access_expiry = self.validated_data['access_expiry']
+    @staticmethod
+    def get_auth_response_data(validated_data, user_payload=None):
+        access_token = validated_data['access']
+        access_expiry = validated_data['access_expiry']
         response_data = {'access_token': access_token, 'expires': access_expiry}
 
-        user_serializer = rest_microservice_settings.USER_SERIALIZER_CLASS
-        if user_serializer:
-            user = self.validated_data['user']
-            response_data['user'] = user_serializer(user).data
+        if rest_microservice_settings.USER_SERIALIZER_CLASS:
+            if user_payload is None:
+                user_payload = get_user_payload(validated_data['user'], validated_data.get('user_id'))
+            response_data['user'] = user_payload
+
+        return response_data
 
-        return Response(response_data, status=status.HTTP_200_OK)
+    def make_auth_response(self):
+        with stage("serialize"):
+            return Response(self.get_auth_response_data(self.validated_data), status=status.HTTP_200_OK)
 
 
 class LogInTokenObtainPairSerializer(TokenObtainSerializer, SerializerResponseMixin):
@@ -49,6 +85,7 @@ class LogInTokenObtainPairSerializer(TokenObtainSerializer, SerializerResponseMi
     Validates user, returns dictionary containing refresh token, access token,
     expiry time of access token, user dictionary.
     This is similar to the rest_framework_simplejwt.serializers.TokenObtainPairSerializer.
+    Sign-ins are admitted according to SIGN_IN_RATE and SIGN_IN_MAX_CONCURRENCY settings before checking password.
     """
 
     @classmethod
@@ -61,9 +98,18 @@ class LogInTokenObtainPairSerializer(TokenObtainSerializer, SerializerResponseMi
         return token
 
     def validate(self, attrs):
-        data = super().validate(attrs)
+        request = self.context.get('request')
+        credentials = {self.username_field: attrs[self.username_field], 'password': attrs['password']}
+
+        with get_admission_controller().admit(request, attrs[self.username_field]):
+            self.user = authenticate_user(request, **credentials)
 
-        refresh = self.get_token(self.user)
+        if not api_settings.USER_AUTHENTICATION_RULE(self.user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        data = {}
+        with stage("token_issue"):
+            refresh = self.get_token(self.user)
 
         data['refresh'] = str(refresh)
         data['access'] = str(refresh.access_token)
@@ -73,7 +119,8 @@ class LogInTokenObtainPairSerializer(TokenObtainSerializer, SerializerResponseMi
         data['access_expiry'] = refresh.access_token['exp']
         data['user'] = self.user
 
-        update_last_login(None, self.user)
+        with stage("last_login"):
+            record_last_login(self.user)
 
         return data
 
@@ -82,14 +129,22 @@ class CustomTokenRefreshSerializer(TokenRefreshSerializer, SerializerResponseMix
     """
     Validates refresh token string, returns dictionary containing access token,
     expiry time of access token, user dictionary.
+    When refreshes are coalesced (see REFRESH_COALESCING_WINDOW setting), the tokens minted by the first refresh of
+    a refresh token are returned to the refreshes of the same token which follow within the window.
     """
 
     def validate(self, attrs):
+        coalescer = get_refresh_coalescer()
+
         try:
-            refresh = RefreshToken(attrs['refresh'])
-            user = self.get_user(refresh)
-            # copying custom attributes from user instance to TokenUser in case any attributes have been changed
-            add_custom_token_claims(refresh, user)
+            refresh = DeferredBlacklistCheckRefreshToken(attrs['refresh'])
+            with replica_reads(refresh.get("user_id")):
+                if coalescer is None:
+                    refresh.check_blacklist()
+                    return self.get_refresh_data(refresh)
+
+                with coalescer.lock(refresh[api_settings.JTI_CLAIM]):
+                    return self.get_coalesced_refresh_data(refresh, coalescer)
 
         # only intercept errors that we do not want to see in Django error reporting here
         except ExpiredSignatureError:
@@ -97,33 +152,150 @@ class CustomTokenRefreshSerializer(TokenRefreshSerializer, SerializerResponseMix
         except ObjectDoesNotExist:
             raise InvalidToken()
 
-        data = {'access': str(refresh.access_token), 'access_expiry': refresh.access_token['exp'], 'user': user}
+    def get_refresh_data(self, refresh, coalescer=None):
+        with stage("user_claims"):
+            user, claims = self.get_user_claims(refresh)
+        # copying custom attributes from user instance to TokenUser in case any attributes have been changed
+        refresh.payload.update(claims)
+
+        with stage("token_issue"):
+            access = refresh.access_token
+            data = {'access': str(access), 'access_expiry': access['exp']}
+
+            if api_settings.ROTATE_REFRESH_TOKENS:
+                rotated = make_rotated_token(refresh)
+                data['refresh_token'], data['refresh_expiry'] = str(rotated), rotated['exp']
+                record_outstanding_token(rotated)
+
+        # tokens are shared before the refresh token is blacklisted, so concurrent refreshes see one or the other
+        if coalescer is not None:
+            coalescer.set(refresh[api_settings.JTI_CLAIM], data)
+
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            try:
+                # Attempt to blacklist the given refresh token
+                with stage("blacklist"):
+                    blacklist_token(refresh)
+            except AttributeError:
+                # If blacklist app not installed, `blacklist` method will not be present
+                pass
+
+        return {**data, 'user': user, 'user_id': refresh.get("user_id")}
+
+    def get_coalesced_refresh_data(self, refresh, coalescer):
+        data = coalescer.get(refresh[api_settings.JTI_CLAIM])
+        # the coalesced tokens are only returned for a blacklisted token when the refresh which minted them blacklisted
+        # it, log off discards them
+        if data is None or not blacklists_rotated_tokens():
+            try:
+                refresh.check_blacklist()
+            except TokenError:
+                # the token may have been blacklisted by a refresh handled by another process
+                data = coalescer.get(refresh[api_settings.JTI_CLAIM]) if blacklists_rotated_tokens() else None
+                if data is None:
+                    raise
+
+        if data is None:
+            return self.get_refresh_data(refresh, coalescer)
+
+        if 'refresh_token' in data:
+            # the rotated token set in cookie may have been logged off since, the tokens minted with it are not returned
+            DeferredBlacklistCheckRefreshToken(data['refresh_token']).check_blacklist()
+
+        user = self.get_user(refresh) if is_user_needed(refresh.get("user_id")) else None
+        return {**data, 'user': user, 'user_id': refresh.get("user_id")}
 
-        if api_settings.ROTATE_REFRESH_TOKENS:
-            if api_settings.BLACKLIST_AFTER_ROTATION:
-                try:
-                    # Attempt to blacklist the given refresh token
-                    refresh.blacklist()
-                except AttributeError:
-                    # If blacklist app not installed, `blacklist` method will not be present
-                    pass
+    @staticmethod
+    def get_user(refresh_token):
+        user_model = get_user_model()
+        return user_model.objects.get(id=refresh_token.get("user_id"))
 
-            refresh.set_jti()
-            refresh.set_exp()
+    def get_user_claims(self, refresh_token):
+        """
+        Get user and its custom token claims. If the claims are cached (see CLAIMS_CACHE_SIZE setting) and the user
+        is not needed to make the response (see USER_PAYLOAD_CACHE_SIZE setting), the user is not queried and None
+        is returned in its place.
+        """
+        claims_cache = get_claims_cache()
+        user_id = refresh_token.get("user_id")
 
-            data['refresh_token'] = str(refresh)
+        if claims_cache is not None and not is_user_needed(user_id):
+            claims = claims_cache.get(user_id)
+            if claims is not None:
+                return None, claims
 
-        return data
+        user = self.get_user(refresh_token)
+        claims = get_custom_token_claims(user)
+        if claims_cache is not None:
+            claims_cache.set(user_id, claims)
+
+        return user, claims
+
+
+class CustomTokenVerifySerializer(TokenVerifySerializer):
+    """
+    Validates token string, verifying its signature with the key matching its `kid` when SIGNING_KEYS are specified.
+    """
+
+    def validate(self, attrs):
+        token = UntypedToken(attrs['token'])
+
+        if api_settings.BLACKLIST_AFTER_ROTATION and blacklist_installed():
+            with replica_reads(token.get("user_id")):
+                revoked = is_token_revoked(token.get(api_settings.JTI_CLAIM))
+            if revoked:
+                raise serializers.ValidationError("Token is blacklisted")
+
+        return {}
+
+
+class BatchTokenVerifySerializer(serializers.Serializer):
+    """
+    Validates a list of token strings, returns dictionary containing the verification result of each token in the
+    same order: its status (valid, expired, invalid or blacklisted) and its claims when valid. Duplicate tokens are
+    verified once, and the blacklist is checked for all tokens in a single query.
+    """
+    tokens = serializers.ListField(child=serializers.CharField(), allow_empty=False)
+
+    def validate_tokens(self, tokens):
+        max_size = rest_microservice_settings.VERIFY_BATCH_MAX_SIZE
+        if len(tokens) > max_size:
+            raise serializers.ValidationError(f"Ensure this field has no more than {max_size} elements.")
+        return tokens
+
+    def validate(self, attrs):
+        results = {token: self.verify_token(token) for token in dict.fromkeys(attrs['tokens'])}
+
+        if api_settings.BLACKLIST_AFTER_ROTATION and blacklist_installed():
+            self.check_blacklist(results.values())
+
+        return {'results': [results[token] for token in attrs['tokens']]}
 
     @staticmethod
-    def get_user(refresh_token):
-        user_model = get_user_model()
-        return user_model.objects.get(id=refresh_token.get("user_id"))
+    def verify_token(token):
+        try:
+            payload = UntypedToken(token).payload
+        except ExpiredTokenError:
+            return {'status': 'expired', 'valid': False}
+        except TokenError:
+            return {'status': 'invalid', 'valid': False}
+        return {'status': 'valid', 'valid': True, 'claims': payload}
+
+    @staticmethod
+    def check_blacklist(results):
+        results = [result for result in results if result['valid']]
+        with replica_reads(*{result['claims'].get("user_id") for result in results}):
+            blacklisted = get_revoked_jtis({result['claims'].get(api_settings.JTI_CLAIM) for result in results})
+
+        for result in results:
+            if result['claims'].get(api_settings.JTI_CLAIM) in blacklisted:
+                result.update(status='blacklisted', valid=False)
+                del result['claims']
 
 
 class SocialLogInTokenExchangeSerializer(serializers.Serializer, SerializerResponseMixin):
     """
-    Validates AWS Cognito id token, returns dictionary containing internally-signed
+    Validates id token of an IDP specified in IDPS setting, returns dictionary containing internally-signed
     refresh token, access token, expiry time of access token, and user dictionary.
     """
     id_token = serializers.CharField()
@@ -136,38 +308,29 @@ class SocialLogInTokenExchangeSerializer(serializers.Serializer, SerializerRespo
 
     def validate(self, attrs):
         try:
-            id_token = decode_token(attrs['id_token'], rest_microservice_settings.IDP['CLIENT_ID'])
+            id_token = get_provider_registry().decode_token(attrs['id_token'])
 
         # only intercept errors that we do not want to see in Django error report here
         except ExpiredSignatureError:
             raise TokenExpired()
+        except PyJWTError:
+            # ie: malformed token, unknown issuer or key, invalid signature or audience
+            raise InvalidToken()
 
-        if id_token.get('email_verified') is False:
-            raise APIException("Email not verified.")
-
-        user_defaults = {
-            "username": id_token["cognito:username"],
-            "first_name": id_token.get("given_name"),
-            "last_name": id_token.get("family_name"),
-        }
-
-        if rest_microservice_settings.USER_MODEL_UUID_FIELD is not None:
-            user_defaults[rest_microservice_settings.USER_MODEL_UUID_FIELD] = id_token['sub']
-
-        user, created = get_user_model().objects.get_or_create(email=id_token["email"], defaults=user_defaults)
-
-        if rest_microservice_settings.USER_MODEL_UUID_FIELD is None:
-            Idp.objects.update_or_create(user=user, defaults={"uuid": id_token['sub']})
+        self.check_id_token(id_token)
+        with stage("user_provision"), replica_reads():
+            user = self.get_provisioner().provision(id_token)
+        pin_user(user.pk)
 
-        refresh = self.get_token(user)
-        data = {
-            'refresh': str(refresh),
-            'access': str(refresh.access_token),
-            'refresh_expiry': refresh.payload['exp'],
-            'access_expiry': refresh.access_token['exp'],
-            'user': user
-        }
+        with stage("token_issue"):
+            refresh = self.get_token(user)
+            return make_token_data(refresh, user)
 
-        update_last_login(None, user)
+    @staticmethod
+    def check_id_token(id_token):
+        if id_token.get('email_verified') is False:
+            raise APIException("Email not verified.")
 
-        return data
+    @staticmethod
+    def get_provisioner():
+        return rest_microservice_settings.USER_PROVISIONER_CLASS()
@@ -1,4 +1,6 @@
+import django
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.test.signals import setting_changed
 from django.utils.module_loading import import_string
 
@@ -18,10 +20,62 @@ DEFAULTS = {
     "COOKIE_SALT": "extra",
     "USER_SERIALIZER_CLASS": None,
     "USER_MODEL_UUID_FIELD": None,
+    "USER_PROVISIONER_CLASS": "rest_framework_microservice.provisioning.UuidUserProvisioner",
+    "JWKS_CACHE_TIMEOUT": 86000,
+    "JWKS_LOCAL_TIMEOUT": 3600,
+    "JWKS_REFRESH_AHEAD": 300,
+    "JWKS_MIN_REFETCH_INTERVAL": 60,
+    "ID_TOKEN_CACHE_SIZE": 1024,
+    "IDP_HTTP_TIMEOUT": (3.05, 5),
+    "IDP_HTTP_POOL_SIZE": 10,
+    "ASYNC_VIEWS": False,
+    "PASSWORD_HASHING_WORKERS": 4,
+    "WRITE_BEHIND": False,
+    "WRITE_BEHIND_MAX_BATCH_SIZE": 500,
+    "WRITE_BEHIND_FLUSH_INTERVAL": 5,
+    "WRITE_BEHIND_SYNCHRONOUS": False,
+    "CLAIMS_CACHE_SIZE": 0,
+    "CLAIMS_CACHE_TIMEOUT": 30,
+    "CLAIMS_CACHE_ALIAS": None,
+    "CLAIMS_CACHE_SHARED_TIMEOUT": 300,
+    "SIGNING_KEYS": [],
+    "SIGNING_JWKS_MAX_AGE": 3600,
+    "VERIFY_BATCH_MAX_SIZE": 100,
+    "REVOCATION_FILTER": False,
+    "REVOCATION_FILTER_CAPACITY": 100000,
+    "REVOCATION_FILTER_ERROR_RATE": 0.001,
+    "REVOCATION_FILTER_SYNC_INTERVAL": 10,
+    "REFRESH_HANDLE_STORE_CLASS": None,
+    "REFRESH_HANDLE_CACHE_ALIAS": "default",
+    "REFRESH_COALESCING_WINDOW": 0,
+    "REFRESH_COALESCING_CACHE_ALIAS": None,
+    "PASSWORD_HASHING_POOL": False,
+    "SIGN_IN_RATE": None,
+    "SIGN_IN_RATE_CACHE_ALIAS": None,
+    "SIGN_IN_MAX_CONCURRENCY": 0,
+    "TIMING": False,
+    "SERVER_TIMING_HEADER": True,
+    "METRICS_CLASS": "rest_framework_microservice.timing.InMemoryMetrics",
+    "USER_PAYLOAD_CACHE_SIZE": 0,
+    "USER_PAYLOAD_CACHE_TIMEOUT": 30,
+    "USER_PAYLOAD_CACHE_ALIAS": None,
+    "USER_PAYLOAD_CACHE_SHARED_TIMEOUT": 300,
+    "USER_PAYLOAD_CACHE_VERSION": 1,
+    "FAST_JSON_RENDERER": False,
+    "IDPS": [],
+    "JWKS_SNAPSHOT_PATH": None,
+    "JWKS_WARM_UP": False,
+    "DB_REPLICAS": [],
+    "DB_REPLICA_PIN_WINDOW": 10,
+    "DB_REPLICA_PIN_CACHE_ALIAS": "default",
+    "ACCESS_TOKEN_CACHE_SIZE": 1024,
 }
 
 IMPORT_STRINGS = [
-    'USER_SERIALIZER_CLASS'
+    'USER_SERIALIZER_CLASS',
+    'USER_PROVISIONER_CLASS',
+    'REFRESH_HANDLE_STORE_CLASS',
+    'METRICS_CLASS',
 ]
 
 
@@ -56,6 +110,7 @@ class RestFrameworkMicroserviceSettings:
         self.defaults = defaults or DEFAULTS
         self.import_strings = import_strings or IMPORT_STRINGS
         self._cached_attrs = set()
+        self._claims_builder = None
 
     @property
     def user_settings(self):
@@ -79,14 +134,30 @@ class RestFrameworkMicroserviceSettings:
         if attr in self.import_strings:
             val = perform_import(val, attr)
 
+        # async views use the async ORM methods added in Django 4.1 and 4.2
+        if attr == "ASYNC_VIEWS" and val and django.VERSION < (4, 2):
+            raise ImproperlyConfigured("ASYNC_VIEWS setting requires Django 4.2 or newer.")
+
         self._cached_attrs.add(attr)
         setattr(self, attr, val)
         return val
 
+    @property
+    def claims_builder(self):
+        """
+        Custom token claims builder compiled from CUSTOM_TOKEN_USER_ATTRIBUTES and CUSTOM_TOKEN_CALLABLE_ATTRIBUTES.
+        """
+        if self._claims_builder is None:
+            from .claims import ClaimsBuilder
+            self._claims_builder = ClaimsBuilder(self.CUSTOM_TOKEN_USER_ATTRIBUTES,
+                                                 self.CUSTOM_TOKEN_CALLABLE_ATTRIBUTES)
+        return self._claims_builder
+
     def reload(self):
         for attr in self._cached_attrs:
             delattr(self, attr)
         self._cached_attrs.clear()
+        self._claims_builder = None
         if hasattr(self, "_user_settings"):
             delattr(self, "_user_settings")
 
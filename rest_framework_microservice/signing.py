@@ -0,0 +1,143 @@
+"""
+Signing of tokens with asymmetric keys identified by key id (`kid`), allowing signing keys to be rotated and
+published as a JWKS document, so that other services can verify tokens locally.
+"""
+import json
+import jwt
+from django.core.exceptions import ImproperlyConfigured
+from django.test.signals import setting_changed
+from django.utils.translation import gettext_lazy as _
+from jwt import ExpiredSignatureError, InvalidAlgorithmError, InvalidTokenError
+from jwt.algorithms import get_default_algorithms
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError, TokenBackendExpiredToken
+from rest_framework_simplejwt.settings import api_settings
+from .settings import rest_microservice_settings
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "RS384", "RS512", "PS256", "PS384", "PS512", "ES256", "ES384", "ES512", "EdDSA")
+
+
+class SigningKey:
+    """
+    A key pair in SIGNING_KEYS setting. Keys without private key can only be used to verify tokens, ie: a retired
+    signing key which remains published until the tokens it signed have expired.
+    """
+
+    def __init__(self, kid, algorithm, private_key=None, public_key=None):
+        self.kid = kid
+        self.algorithm = algorithm
+
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise ImproperlyConfigured(f"Unsupported algorithm '{algorithm}' for signing key '{kid}'.")
+        jws_algorithm = get_default_algorithms()[algorithm]
+
+        self.private_key = jws_algorithm.prepare_key(private_key) if private_key else None
+        if public_key:
+            self.public_key = jws_algorithm.prepare_key(public_key)
+        elif self.private_key is not None:
+            self.public_key = self.private_key.public_key()
+        else:
+            raise ImproperlyConfigured(f"Signing key '{kid}' has neither private nor public key.")
+
+        self.jwk = json.loads(jws_algorithm.to_jwk(self.public_key))
+        self.jwk.update({"kid": kid, "alg": algorithm, "use": "sig"})
+
+    @classmethod
+    def from_setting(cls, key):
+        try:
+            return cls(key["KID"], key["ALGORITHM"], key.get("PRIVATE_KEY"), key.get("PUBLIC_KEY"))
+        except KeyError as e:
+            raise ImproperlyConfigured(f"SIGNING_KEYS items must contain 'KID' and 'ALGORITHM', missing {e}.")
+
+
+class KeyRingTokenBackend(TokenBackend):
+    """
+    Token backend signing tokens with the first key having a private key, with its `kid` in token header,
+    and verifying tokens with the key matching the `kid` of their header.
+    """
+
+    def __init__(self, signing_keys, audience=None, issuer=None, leeway=None, json_encoder=None):
+        self.keys = {key.kid: key for key in signing_keys}
+        self.active_key = next((key for key in signing_keys if key.private_key is not None), None)
+
+        if self.active_key is None:
+            raise ImproperlyConfigured("SIGNING_KEYS must contain at least one key with a private key.")
+
+        super().__init__(self.active_key.algorithm, audience=audience, issuer=issuer, leeway=leeway,
+                         json_encoder=json_encoder)
+        self.jwks = {"keys": [key.jwk for key in signing_keys]}
+
+    def encode(self, payload):
+        jwt_payload = payload.copy()
+        if self.audience is not None:
+            jwt_payload["aud"] = self.audience
+        if self.issuer is not None:
+            jwt_payload["iss"] = self.issuer
+
+        return jwt.encode(jwt_payload, self.active_key.private_key, algorithm=self.active_key.algorithm,
+                          headers={"kid": self.active_key.kid}, json_encoder=self.json_encoder)
+
+    def decode(self, token, verify=True):
+        try:
+            key = self.keys[jwt.get_unverified_header(token).get("kid")]
+        except (KeyError, InvalidTokenError) as e:
+            raise TokenBackendError(_("Token is invalid")) from e
+
+        try:
+            return jwt.decode(
+                token,
+                key.public_key,
+                algorithms=[key.algorithm],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.get_leeway(),
+                options={
+                    "verify_aud": self.audience is not None,
+                    "verify_signature": verify,
+                },
+            )
+        except InvalidAlgorithmError as e:
+            raise TokenBackendError(_("Invalid algorithm specified")) from e
+        except ExpiredSignatureError as e:
+            raise TokenBackendExpiredToken(_("Token is expired")) from e
+        except InvalidTokenError as e:
+            raise TokenBackendError(_("Token is invalid")) from e
+
+
+_token_backend = None
+
+
+def get_token_backend():
+    """
+    Get backend signing and verifying tokens issued by this package, which uses SIGNING_KEYS setting if specified,
+    otherwise the token backend configured by simplejwt settings.
+    """
+    global _token_backend
+    if _token_backend is None:
+        if rest_microservice_settings.SIGNING_KEYS:
+            _token_backend = KeyRingTokenBackend(
+                [SigningKey.from_setting(key) for key in rest_microservice_settings.SIGNING_KEYS],
+                audience=api_settings.AUDIENCE,
+                issuer=api_settings.ISSUER,
+                leeway=api_settings.LEEWAY,
+                json_encoder=getattr(api_settings, "JSON_ENCODER", None),
+            )
+        else:
+            from rest_framework_simplejwt.state import token_backend
+            _token_backend = token_backend
+    return _token_backend
+
+
+def reset_token_backend(*args, **kwargs):
+    global _token_backend
+    if kwargs.get("setting") in ("REST_FRAMEWORK_MICROSERVICE", "SIMPLE_JWT"):
+        _token_backend = None
+
+
+setting_changed.connect(reset_token_backend)
+
+
+def get_jwks():
+    """Get JWKS document publishing the public keys of SIGNING_KEYS setting."""
+    token_backend = get_token_backend()
+    return getattr(token_backend, "jwks", {"keys": []})
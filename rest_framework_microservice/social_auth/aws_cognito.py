@@ -1,11 +1,7 @@
-import jwt
-from jwt import DecodeError
-from jwt.algorithms import RSAAlgorithm
-from ..settings import rest_microservice_settings
-from django.core.cache import caches
+import warnings
 from django.contrib.auth import authenticate
-import requests
-import json
+from ..settings import rest_microservice_settings
+from .providers import ProviderRegistry, get_provider_registry
 
 
 def get_username_from_payload_handler(payload):
@@ -14,42 +10,21 @@ def get_username_from_payload_handler(payload):
     return username
 
 
-def get_pub_keys():
-    """Get cognito public keys from cache or retrieve from AWS."""
-    cache = caches['default']
-    pub_keys = cache.get('cognito_pub_keys')
-
-    if pub_keys is None:
-        pub_keys = {key['kid']: json.dumps(key) for key in requests.get(
-        f"https://cognito-idp.{rest_microservice_settings.IDP['REGION']}.amazonaws.com/{rest_microservice_settings.IDP['USER_POOL']}/.well-known/jwks.json").json().get('keys')}
-        cache.set('cognito_pub_keys', pub_keys, 86000)
-
-    return pub_keys
+def get_pub_keys(force=False):
+    """
+    Deprecated, get the public keys of the Cognito user pool of IDP setting, from cache or retrieved from AWS.
+    """
+    warnings.warn("get_pub_keys() is deprecated, the keys are held by the providers of IDPS setting.",
+                  DeprecationWarning, stacklevel=2)
+    return ProviderRegistry.make_provider(rest_microservice_settings.IDP).fetch_keys(force=force)
 
 
 def decode_token(token, audience=None):
     """
-    Verify AWS Cognito JWT token.
+    Deprecated, use `get_provider_registry().decode_token()`. Verify id token with the keys of its provider, the
+    audience being the CLIENT_ID of the provider rather than `audience`.
     """
-    unverified_header = jwt.get_unverified_header(token)
-
-    if 'kid' not in unverified_header:
-        raise DecodeError('Incorrect authentication credentials.')
-
-    kid = unverified_header['kid']
-    alg = unverified_header['alg']
-
-    try:
-        # pick a proper public key according to `kid` from token header
-        public_key = RSAAlgorithm.from_jwk(get_pub_keys()[kid])
-    except KeyError:
-        # in this place we could refresh cached jwks and try again
-        raise DecodeError('Can\'t find proper public key in jwks')
-    else:
-        return jwt.decode(
-            jwt=token,
-            key=public_key,
-            verify=True,
-            audience=audience,
-            algorithms=alg
-        )
+    warnings.warn("decode_token() is deprecated, use "
+                  "rest_framework_microservice.social_auth.providers.get_provider_registry().decode_token().",
+                  DeprecationWarning, stacklevel=2)
+    return get_provider_registry().decode_token(token)
@@ -0,0 +1,118 @@
+import re
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from django.test.signals import setting_changed
+from ..settings import rest_microservice_settings
+
+MAX_AGE_RE = re.compile(r"max-age\s*=\s*(\d+)", re.IGNORECASE)
+
+
+def get_max_age(response):
+    """Return freshness lifetime in seconds from Cache-Control header of response, or None if not specified."""
+    cache_control = response.headers.get("Cache-Control", "")
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return 0
+    match = MAX_AGE_RE.search(cache_control)
+    return int(match.group(1)) if match else None
+
+
+class FetchResult:
+    def __init__(self, document, max_age=None, not_modified=False):
+        self.document = document
+        self.max_age = max_age
+        self.not_modified = not_modified
+
+
+class DocumentFetcher:
+    """
+    Fetches JSON documents published by IDP (JWKS, OIDC discovery documents) over a shared keep-alive session
+    with strict connect/read timeouts. Documents are kept along with their validators (`ETag`, `Last-Modified`):
+    within the `Cache-Control` max-age the document is served without any request, after which a conditional
+    request is made and a `304 Not Modified` response simply extends the lifetime of the document already held.
+    If the IDP cannot be reached or errors, the document already held is served stale until the next fetch.
+    """
+
+    def __init__(self, session=None, timeout=None, pool_size=None):
+        self.timeout = timeout or rest_microservice_settings.IDP_HTTP_TIMEOUT
+        self.session = session or self.make_session(pool_size or rest_microservice_settings.IDP_HTTP_POOL_SIZE)
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_session(pool_size):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def fetch(self, url, force=False):
+        """
+        Return `FetchResult` for the JSON document at `url`.
+        If `force` is True, the document is revalidated with the server even if it is still fresh.
+        """
+        with self._lock:
+            entry = self._documents.get(url)
+
+        if entry is not None and not force and entry["expires_at"] > time.monotonic():
+            return FetchResult(entry["document"], max_age=entry["expires_at"] - time.monotonic(), not_modified=True)
+
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and entry is not None:
+                document = entry["document"]
+                etag = response.headers.get("ETag", entry["etag"])
+                last_modified = response.headers.get("Last-Modified", entry["last_modified"])
+            else:
+                response.raise_for_status()
+                document = response.json()
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except (requests.RequestException, ValueError):
+            if entry is None:
+                raise
+            return FetchResult(entry["document"], max_age=0)
+        max_age = get_max_age(response)
+
+        with self._lock:
+            self._documents[url] = {
+                "document": document,
+                "etag": etag,
+                "last_modified": last_modified,
+                "expires_at": time.monotonic() + (max_age or 0),
+            }
+
+        return FetchResult(document, max_age=max_age, not_modified=response.status_code == 304)
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+
+
+_fetcher = None
+
+
+def get_fetcher():
+    """Get the process-wide document fetcher, which holds the shared HTTP connection pool."""
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = DocumentFetcher()
+    return _fetcher
+
+
+def reset_fetcher(*args, **kwargs):
+    global _fetcher
+    if kwargs.get("setting", "REST_FRAMEWORK_MICROSERVICE") == "REST_FRAMEWORK_MICROSERVICE":
+        _fetcher = None
+
+
+setting_changed.connect(reset_fetcher)
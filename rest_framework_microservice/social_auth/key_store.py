@@ -0,0 +1,135 @@
+import json
+import logging
+import threading
+import time
+from asgiref.sync import sync_to_async
+from jwt import PyJWK
+
+logger = logging.getLogger(__name__)
+
+
+def parse_jwk(jwk):
+    """Parse a JWK (dictionary or JSON string) into a public key object usable by `jwt.decode`."""
+    if isinstance(jwk, str):
+        jwk = json.loads(jwk)
+    return PyJWK(jwk).key
+
+
+class JWKSKeyStore:
+    """
+    Process-local store of parsed IDP public keys, indexed by `kid`.
+
+    `fetch_keys` is a callable accepting a `force` keyword argument and returning a mapping of `kid` to JWK.
+    Keys are parsed once per fetch and then served from memory. Shortly before the key set expires it is refreshed
+    in a background thread while the current keys keep being served. When the store is cold, or a token refers to
+    an unknown `kid` (ie: after the IDP rotated its keys), a single caller performs the fetch while concurrent
+    callers wait for its result, and `kid` misses trigger at most one forced fetch per `min_refetch_interval`.
+    """
+
+    def __init__(self, fetch_keys, timeout=3600, refresh_ahead=300, min_refetch_interval=60):
+        self.fetch_keys = fetch_keys
+        self.timeout = timeout
+        self.refresh_ahead = min(refresh_ahead, timeout)
+        self.min_refetch_interval = min_refetch_interval
+
+        self._keys = {}
+        self._expires_at = 0.0
+        self._fetched_at = None
+        self._lock = threading.Lock()
+        self._background_lock = threading.Lock()
+        self._background_refresh_running = False
+
+    def get_key(self, kid):
+        """Return parsed public key for `kid`, or None if the IDP does not publish such key."""
+        now = time.monotonic()
+
+        if now >= self._expires_at:
+            self._refresh(since=self._fetched_at)
+        elif now >= self._expires_at - self.refresh_ahead:
+            self._start_background_refresh()
+
+        key = self._keys.get(kid)
+        if key is None and self._can_refetch():
+            self._refresh(since=self._fetched_at, force=True)
+            key = self._keys.get(kid)
+
+        return key
+
+    async def aget_key(self, kid):
+        """
+        Async counterpart of `get_key`. Keys held in memory are returned without leaving the event loop,
+        fetching keys runs in a worker thread.
+        """
+        now = time.monotonic()
+        key = self._keys.get(kid)
+        if key is not None and now < self._expires_at:
+            if now >= self._expires_at - self.refresh_ahead:
+                self._start_background_refresh()
+            return key
+        return await sync_to_async(self.get_key, thread_sensitive=False)(kid)
+
+    def preload(self, jwks):
+        """
+        Serve the keys of a JWKS snapshot, a mapping of `kid` to JWK, until keys are fetched. The snapshot is treated
+        as due for refresh, so its keys are refreshed in the background on first use.
+        """
+        keys = {kid: parse_jwk(jwk) for kid, jwk in jwks.items()}
+        with self._lock:
+            if self._fetched_at is None:
+                self._keys = keys
+                self._expires_at = time.monotonic() + self.refresh_ahead
+
+    def warm_up(self):
+        """Fetch keys in the background unless fresh keys are already held."""
+        if not self._keys or time.monotonic() >= self._expires_at - self.refresh_ahead:
+            self._start_background_refresh()
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._expires_at = 0.0
+            self._fetched_at = None
+
+    def _can_refetch(self):
+        return self._fetched_at is None or time.monotonic() - self._fetched_at >= self.min_refetch_interval
+
+    def _refresh(self, since, force=False):
+        """
+        Fetch and parse keys unless another caller has already done so after `since`.
+        Keys already in memory keep being served if the fetch fails.
+        """
+        with self._lock:
+            if self._fetched_at != since:
+                # another thread completed a fetch while this one was waiting for the lock
+                return
+
+            try:
+                keys = {kid: parse_jwk(jwk) for kid, jwk in self.fetch_keys(force=force).items()}
+            except Exception:
+                if not self._keys:
+                    raise
+                logger.exception("Failed to refresh IDP public keys, serving previously fetched keys.")
+                # retry once the refetch interval has passed instead of on every call
+                self._fetched_at = time.monotonic()
+                self._expires_at = self._fetched_at + self.refresh_ahead + self.min_refetch_interval
+                return
+
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            self._expires_at = self._fetched_at + self.timeout
+
+    def _start_background_refresh(self):
+        with self._background_lock:
+            if self._background_refresh_running:
+                return
+            self._background_refresh_running = True
+
+        threading.Thread(target=self._background_refresh, args=(self._fetched_at,), daemon=True).start()
+
+    def _background_refresh(self, since):
+        try:
+            self._refresh(since=since)
+        except Exception:
+            logger.exception("Background refresh of IDP public keys failed.")
+        finally:
+            self._background_refresh_running = False
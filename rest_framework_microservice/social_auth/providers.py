@@ -0,0 +1,297 @@
+"""
+Registry of the identity providers whose id tokens can be exchanged, specified using the IDPS setting (or the single
+IDP setting). Tokens are routed to their provider by looking up their unverified `iss` claim in a dictionary, and each
+provider keeps its own OIDC discovery document, JWKS and key store, fetched only once a token of the provider is seen.
+"""
+import hashlib
+import json
+import uuid
+import jwt
+from jwt import DecodeError
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test.signals import setting_changed
+from ..cache import ExpiringLRUCache
+from ..settings import import_from_string, rest_microservice_settings
+from ..timing import stage
+from .http import get_fetcher
+from .key_store import JWKSKeyStore
+
+CACHE_KEY_PREFIX = "rest_framework_microservice:jwks:"
+
+_verified_token_cache = None
+
+
+def get_verified_token_cache():
+    """
+    Get the process-local cache of verified token claims, keyed by a digest of the token.
+    Its `stats()` report hits, misses and evictions which can be used to tune ID_TOKEN_CACHE_SIZE.
+    """
+    global _verified_token_cache
+    if _verified_token_cache is None:
+        _verified_token_cache = ExpiringLRUCache(rest_microservice_settings.ID_TOKEN_CACHE_SIZE)
+    return _verified_token_cache
+
+
+def reset_verified_token_cache(*args, **kwargs):
+    global _verified_token_cache
+    if kwargs.get("setting", "REST_FRAMEWORK_MICROSERVICE") == "REST_FRAMEWORK_MICROSERVICE":
+        _verified_token_cache = None
+
+
+setting_changed.connect(reset_verified_token_cache)
+
+
+def get_token_digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def get_unverified_header(token):
+    unverified_header = jwt.get_unverified_header(token)
+
+    if 'kid' not in unverified_header:
+        raise DecodeError('Incorrect authentication credentials.')
+
+    return unverified_header
+
+
+class IdentityProvider:
+    """
+    Verifies the id tokens issued by `issuer` for `client_id` (a client id or a list of them), using the public keys
+    published by the provider. `options` may override JWKS_CACHE_TIMEOUT, JWKS_LOCAL_TIMEOUT, JWKS_REFRESH_AHEAD and
+    JWKS_MIN_REFETCH_INTERVAL settings for this provider.
+    """
+    issuer_aliases = ()
+    algorithms = ("RS256", "RS384", "RS512", "PS256", "PS384", "PS512", "ES256", "ES384", "ES512")
+
+    def __init__(self, issuer, client_id, **options):
+        self.issuer = issuer.rstrip("/")
+        self.client_id = client_id
+        self.options = options
+        self._key_store = None
+
+    @classmethod
+    def from_setting(cls, setting):
+        """Make provider from an item of IDPS setting."""
+        raise NotImplementedError()
+
+    @property
+    def issuers(self):
+        return (self.issuer, *self.issuer_aliases)
+
+    def get_option(self, name):
+        return self.options.get(name, getattr(rest_microservice_settings, name))
+
+    def get_jwks_url(self):
+        raise NotImplementedError()
+
+    def fetch_keys(self, force=False):
+        """Get the JWKS of the provider from the default Django cache, or fetch it from the provider."""
+        cache = caches["default"]
+        cache_key = f"{CACHE_KEY_PREFIX}{self.issuer}"
+        pub_keys = None if force else cache.get(cache_key)
+
+        if pub_keys is None:
+            with stage("jwks_fetch"):
+                result = get_fetcher().fetch(self.get_jwks_url(), force=force)
+            pub_keys = {key["kid"]: json.dumps(key) for key in result.document.get("keys")}
+
+            timeout = self.get_option("JWKS_CACHE_TIMEOUT")
+            if result.max_age is not None:
+                timeout = min(timeout, result.max_age)
+            cache.set(cache_key, pub_keys, timeout)
+
+        return pub_keys
+
+    def get_key_store(self):
+        if self._key_store is None:
+            self._key_store = JWKSKeyStore(self.fetch_keys,
+                                           timeout=self.get_option("JWKS_LOCAL_TIMEOUT"),
+                                           refresh_ahead=self.get_option("JWKS_REFRESH_AHEAD"),
+                                           min_refetch_interval=self.get_option("JWKS_MIN_REFETCH_INTERVAL"))
+        return self._key_store
+
+    def get_claims(self, claims):
+        """
+        Claims returned for a verified token, used to provision its user. As users are linked to existing users by
+        email, the email is only considered verified when the provider says so.
+        """
+        return {**claims, "email_verified": claims.get("email_verified") is True}
+
+    def get_unverified_header(self, token):
+        """Header of the token, rejected unless signed by one of the asymmetric algorithms providers use."""
+        unverified_header = get_unverified_header(token)
+        if unverified_header.get("alg") not in self.algorithms:
+            raise DecodeError("Unsupported token algorithm.")
+        return unverified_header
+
+    def verify_token(self, token, public_key=None):
+        unverified_header = self.get_unverified_header(token)
+        if public_key is None:
+            public_key = self.get_key_store().get_key(unverified_header["kid"])
+
+        if public_key is None:
+            raise DecodeError("Can't find proper public key in jwks")
+
+        with stage("idp_decode"):
+            claims = jwt.decode(token, key=public_key, audience=self.client_id,
+                                algorithms=[unverified_header["alg"]])
+        return self.get_claims(claims)
+
+    async def averify_token(self, token):
+        unverified_header = self.get_unverified_header(token)
+        public_key = await self.get_key_store().aget_key(unverified_header["kid"])
+        return self.verify_token(token, public_key=public_key)
+
+
+class CognitoProvider(IdentityProvider):
+    """
+    AWS Cognito user pool, specified by REGION, USER_POOL and CLIENT_ID, and optionally JWKS_URL.
+    """
+
+    def __init__(self, region, user_pool, client_id, jwks_url=None, **options):
+        super().__init__(f"https://cognito-idp.{region}.amazonaws.com/{user_pool}", client_id, **options)
+        self.jwks_url = jwks_url
+
+    @classmethod
+    def from_setting(cls, setting):
+        options = {key: value for key, value in setting.items() if key.startswith("JWKS_") and key != "JWKS_URL"}
+        return cls(setting["REGION"], setting["USER_POOL"], setting["CLIENT_ID"], jwks_url=setting.get("JWKS_URL"),
+                   **options)
+
+    def get_jwks_url(self):
+        return self.jwks_url or f"{self.issuer}/.well-known/jwks.json"
+
+    def get_claims(self, claims):
+        # the emails of a user pool are trusted unless marked as not verified, as before IDPS setting
+        return claims
+
+
+class OIDCProvider(IdentityProvider):
+    """
+    OpenID Connect provider, specified by ISSUER and CLIENT_ID. The JWKS URL is read from the discovery document
+    published at DISCOVERY_URL, which defaults to `<ISSUER>/.well-known/openid-configuration`.
+
+    Subjects of OIDC providers are not necessarily UUIDs, so the `sub` claim is replaced by a UUID derived from the
+    issuer and the subject, and the subject is returned in the `idp_sub` claim.
+    """
+    default_issuer = None
+
+    def __init__(self, issuer, client_id, discovery_url=None, **options):
+        super().__init__(issuer, client_id, **options)
+        self.discovery_url = discovery_url or f"{self.issuer}/.well-known/openid-configuration"
+
+    @classmethod
+    def from_setting(cls, setting):
+        options = {key: value for key, value in setting.items() if key.startswith("JWKS_")}
+        return cls(setting.get("ISSUER", cls.default_issuer), setting["CLIENT_ID"],
+                   discovery_url=setting.get("DISCOVERY_URL"), **options)
+
+    def get_jwks_url(self):
+        # the discovery document is cached by the fetcher according to its Cache-Control header
+        return get_fetcher().fetch(self.discovery_url).document["jwks_uri"]
+
+    def get_claims(self, claims):
+        return {**super().get_claims(claims), "idp_sub": claims["sub"],
+                "sub": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.issuer}#{claims['sub']}"))}
+
+
+class GoogleProvider(OIDCProvider):
+    """
+    Google sign-in, specified by CLIENT_ID.
+    """
+    default_issuer = "https://accounts.google.com"
+    issuer_aliases = ("accounts.google.com",)
+
+
+PROVIDER_CLASSES = {
+    "aws": CognitoProvider,
+    "google": GoogleProvider,
+    "oidc": OIDCProvider,
+}
+
+
+class ProviderRegistry:
+    """
+    Identity providers indexed by issuer. Claims of verified tokens are memoized until the token expires, see
+    ID_TOKEN_CACHE_SIZE setting.
+    """
+
+    def __init__(self, providers):
+        self.providers = tuple(providers)
+        self.by_issuer = {}
+        for provider in self.providers:
+            for issuer in provider.issuers:
+                if issuer in self.by_issuer:
+                    raise ImproperlyConfigured(f"Identity provider '{issuer}' is specified more than once, "
+                                               f"specify its client ids as a list in a single item of IDPS.")
+                self.by_issuer[issuer] = provider
+
+    @staticmethod
+    def make_provider(setting):
+        provider_class = setting.get("PROVIDER", "aws")
+        if provider_class in PROVIDER_CLASSES:
+            provider_class = PROVIDER_CLASSES[provider_class]
+        else:
+            provider_class = import_from_string(provider_class, "IDPS")
+        return provider_class.from_setting(setting)
+
+    @classmethod
+    def from_settings(cls):
+        settings = rest_microservice_settings.IDPS or [rest_microservice_settings.IDP]
+        return cls(cls.make_provider(setting) for setting in settings)
+
+    def get_provider(self, token):
+        """Get the provider of token by its unverified issuer."""
+        try:
+            issuer = jwt.decode(token, options={"verify_signature": False}).get("iss")
+        except DecodeError:
+            raise DecodeError("Incorrect authentication credentials.")
+
+        provider = self.by_issuer.get(issuer.rstrip("/") if isinstance(issuer, str) else issuer)
+        if provider is None:
+            raise DecodeError(f"Unknown token issuer '{issuer}'.")
+        return provider
+
+    def decode_token(self, token):
+        """Verify id token with the keys of its provider."""
+        cache = get_verified_token_cache()
+        digest = get_token_digest(token)
+        claims = cache.get(digest)
+        if claims is not None:
+            return dict(claims)
+
+        claims = self.get_provider(token).verify_token(token)
+        cache.set(digest, claims, expires_at=claims.get("exp"))
+        return dict(claims)
+
+    async def adecode_token(self, token):
+        """Async counterpart of `decode_token`, the public keys are fetched without blocking the event loop."""
+        cache = get_verified_token_cache()
+        digest = get_token_digest(token)
+        claims = cache.get(digest)
+        if claims is not None:
+            return dict(claims)
+
+        claims = await self.get_provider(token).averify_token(token)
+        cache.set(digest, claims, expires_at=claims.get("exp"))
+        return dict(claims)
+
+
+_provider_registry = None
+
+
+def get_provider_registry():
+    global _provider_registry
+    if _provider_registry is None:
+        _provider_registry = ProviderRegistry.from_settings()
+    return _provider_registry
+
+
+def reset_provider_registry(*args, **kwargs):
+    global _provider_registry
+    if kwargs.get("setting", "REST_FRAMEWORK_MICROSERVICE") == "REST_FRAMEWORK_MICROSERVICE":
+        _provider_registry = None
+
+
+setting_changed.connect(reset_provider_registry)
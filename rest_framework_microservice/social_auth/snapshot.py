@@ -0,0 +1,62 @@
+"""
+Snapshots of the JWKS of the identity providers, written by the `snapshot_jwks` management command to the file
+specified by JWKS_SNAPSHOT_PATH setting, and loaded by each process at start up. Processes then verify id tokens with
+the snapshot keys right away, without fetching keys from the providers, while fresh keys are fetched in the
+background.
+"""
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime, timezone
+from ..settings import rest_microservice_settings
+from .providers import get_provider_registry
+
+logger = logging.getLogger(__name__)
+
+
+def write_jwks_snapshot(path=None):
+    """Fetch the JWKS of every identity provider and write them to snapshot file, returns the number of keys."""
+    path = path or rest_microservice_settings.JWKS_SNAPSHOT_PATH
+    providers = {provider.issuer: {kid: json.loads(jwk) for kid, jwk in provider.fetch_keys(force=True).items()}
+                 for provider in get_provider_registry().providers}
+    snapshot = {"created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"), "providers": providers}
+
+    # written to a temporary file renamed over the snapshot, so processes starting meanwhile read a whole snapshot
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary_path = tempfile.mkstemp(dir=directory, prefix=".jwks_snapshot")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+    return sum(len(keys) for keys in providers.values())
+
+
+def load_jwks_snapshot(path=None):
+    """Preload key stores of the identity providers with snapshot file, returns the number of keys loaded."""
+    path = path or rest_microservice_settings.JWKS_SNAPSHOT_PATH
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read JWKS snapshot %s (%s), keys will be fetched from identity providers.", path, e)
+        return 0
+
+    registry = get_provider_registry()
+    loaded = 0
+    for issuer, keys in snapshot.get("providers", {}).items():
+        provider = registry.by_issuer.get(issuer)
+        if provider is not None:
+            provider.get_key_store().preload(keys)
+            loaded += len(keys)
+    return loaded
+
+
+def warm_up_key_stores():
+    """Fetch the keys of every identity provider in background threads."""
+    for provider in get_provider_registry().providers:
+        provider.get_key_store().warm_up()
@@ -0,0 +1,134 @@
+"""
+Per-stage timing of the authentication views. When TIMING setting is enabled, the stages of a request (ie: IDP
+token decoding, password check, token issuing, cookie signing, response serialization) are timed with a monotonic
+clock, reported to the metrics backend specified by METRICS_CLASS setting, and optionally returned to the client in a
+`Server-Timing` response header. When TIMING is disabled, timing a stage only costs a setting lookup.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.test.signals import setting_changed
+from .settings import rest_microservice_settings
+
+_timings = ContextVar("rest_framework_microservice_timings", default=None)
+
+
+class Metrics:
+    """
+    Interface of metrics backends, which should be specified in setting METRICS_CLASS, ie: to forward timings to
+    StatsD or Prometheus.
+    """
+
+    def timing(self, name, seconds):
+        """Record the duration of a stage or view, named ie: `TokenLogIn.password_check` or `TokenLogIn.total`."""
+        raise NotImplementedError()
+
+
+class InMemoryMetrics(Metrics):
+    """
+    Keeps the count, total and maximum duration of each name in memory of the process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = {}
+
+    def timing(self, name, seconds):
+        with self._lock:
+            count, total, maximum = self._timings.get(name, (0, 0.0, 0.0))
+            self._timings[name] = (count + 1, total + seconds, max(maximum, seconds))
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {"count": count, "total": total, "max": maximum, "mean": total / count}
+                    for name, (count, total, maximum) in self._timings.items()}
+
+
+_metrics = None
+
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        _metrics = rest_microservice_settings.METRICS_CLASS()
+    return _metrics
+
+
+def reset_metrics(*args, **kwargs):
+    global _metrics
+    if kwargs.get("setting", "REST_FRAMEWORK_MICROSERVICE") == "REST_FRAMEWORK_MICROSERVICE":
+        _metrics = None
+
+
+setting_changed.connect(reset_metrics)
+
+
+def start_timing():
+    """Start collecting stage timings of the current request."""
+    if rest_microservice_settings.TIMING:
+        _timings.set({"total": time.perf_counter()})
+
+
+def record_timing(name, seconds):
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as a stage of the current request."""
+    if not rest_microservice_settings.TIMING or _timings.get() is None:
+        yield
+        return
+
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - started_at)
+
+
+def timed(name):
+    """Decorator timing calls of the function as a stage of the current request."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def finish_timing(response, view_name):
+    """Report the stage timings of the current request to metrics backend, and add them to Server-Timing header."""
+    timings = _timings.get()
+    if timings is None:
+        return response
+
+    _timings.set(None)
+    timings["total"] = time.perf_counter() - timings.pop("total")
+
+    metrics = get_metrics()
+    for name, seconds in timings.items():
+        metrics.timing(f"{view_name}.{name}", seconds)
+
+    if rest_microservice_settings.SERVER_TIMING_HEADER:
+        response["Server-Timing"] = ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items())
+    return response
+
+
+class TimedViewMixin:
+    """
+    Times requests of Django REST framework views.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        start_timing()
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        return finish_timing(response, type(self).__name__)
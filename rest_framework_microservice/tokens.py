@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from .revocation import ais_token_revoked, is_token_revoked, record_revoked_jti
+from .signing import get_token_backend
+
+BLACKLIST_APP = "rest_framework_simplejwt.token_blacklist"
+
+
+def blacklist_installed():
+    return BLACKLIST_APP in settings.INSTALLED_APPS
+
+
+class TokenBackendMixin:
+    """
+    Signs and verifies tokens using the backend of SIGNING_KEYS setting when it is specified.
+    """
+
+    def get_token_backend(self):
+        return get_token_backend()
+
+
+class AccessToken(TokenBackendMixin, tokens.AccessToken):
+    pass
+
+
+class UntypedToken(TokenBackendMixin, tokens.UntypedToken):
+    pass
+
+
+class RefreshToken(TokenBackendMixin, tokens.RefreshToken):
+    """
+    Refresh token which also provides async counterparts of the methods querying the token blacklist tables,
+    so they can be used from async views without blocking the event loop. The blacklist is only queried when the
+    revoked token filter (see REVOCATION_FILTER setting) cannot rule out that the token is revoked.
+    """
+    access_token_class = AccessToken
+
+    def check_blacklist(self):
+        if blacklist_installed() and is_token_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    async def acheck_blacklist(self):
+        if blacklist_installed() and await ais_token_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    async def ablacklist(self):
+        if not blacklist_installed():
+            raise AttributeError("'RefreshToken' object has no attribute 'ablacklist'")
+
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+        jti = self.payload[api_settings.JTI_CLAIM]
+        user_id = self.payload.get(api_settings.USER_ID_CLAIM)
+        user = await get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+
+        token, _ = await OutstandingToken.objects.aget_or_create(
+            jti=jti,
+            defaults={
+                "user": user,
+                "created_at": self.current_time,
+                "token": str(self),
+                "expires_at": datetime_from_epoch(self.payload["exp"]),
+            },
+        )
+
+        blacklisted_token = await BlacklistedToken.objects.aget_or_create(token=token)
+        record_revoked_jti(jti)
+        return blacklisted_token
+
+    def blacklist(self):
+        blacklisted_token = super().blacklist()
+        record_revoked_jti(self.payload[api_settings.JTI_CLAIM])
+        return blacklisted_token
+
+
+class DeferredBlacklistCheckRefreshToken(RefreshToken):
+    """
+    Refresh token which does not query the blacklist when it is verified, used by views which check the
+    blacklist separately using `check_blacklist` or `acheck_blacklist`, or which blacklist the token anyway.
+    """
+
+    def verify(self):
+        tokens.Token.verify(self)
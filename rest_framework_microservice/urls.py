@@ -1,11 +1,29 @@
 from django.urls import path
+from .settings import rest_microservice_settings
 from .views import *
-from rest_framework_simplejwt.views import TokenVerifyView
 
-urlpatterns = [
-    path('sign-in/', TokenLogIn.as_view()),
-    path('social-exchange/', SocialLogInExchangeTokens.as_view()),
-    path('refresh/', RefreshTokenUsingCookie.as_view()),
-    path('verify/', TokenVerifyView.as_view()),
-    path('logoff/', BlacklistRefreshToken.as_view()),
-]
+if rest_microservice_settings.ASYNC_VIEWS:
+    from .async_views import AsyncTokenLogIn, AsyncSocialLogInExchangeTokens, AsyncRefreshTokenUsingCookie, \
+        AsyncBlacklistRefreshToken, AsyncRevokeAllRefreshTokens
+
+    urlpatterns = [
+        path('sign-in/', AsyncTokenLogIn.as_view()),
+        path('social-exchange/', AsyncSocialLogInExchangeTokens.as_view()),
+        path('refresh/', AsyncRefreshTokenUsingCookie.as_view()),
+        path('verify/', TokenVerify.as_view()),
+        path('verify-batch/', BatchTokenVerify.as_view()),
+        path('logoff/', AsyncBlacklistRefreshToken.as_view()),
+        path('logoff-all/', AsyncRevokeAllRefreshTokens.as_view()),
+        path('.well-known/jwks.json', JWKSView.as_view()),
+    ]
+else:
+    urlpatterns = [
+        path('sign-in/', TokenLogIn.as_view()),
+        path('social-exchange/', SocialLogInExchangeTokens.as_view()),
+        path('refresh/', RefreshTokenUsingCookie.as_view()),
+        path('verify/', TokenVerify.as_view()),
+        path('verify-batch/', BatchTokenVerify.as_view()),
+        path('logoff/', BlacklistRefreshToken.as_view()),
+        path('logoff-all/', RevokeAllRefreshTokens.as_view()),
+        path('.well-known/jwks.json', JWKSView.as_view()),
+    ]
@@ -5,31 +5,75 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenViewBase
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenVerifyView, TokenViewBase
 
 from .serializers import LogInTokenObtainPairSerializer, CustomTokenRefreshSerializer, \
-    SocialLogInTokenExchangeSerializer
+    CustomTokenVerifySerializer, BatchTokenVerifySerializer, SocialLogInTokenExchangeSerializer
+from .coalescing import forget_coalesced_refresh
+from .handles import get_refresh_handle_store
+from .renderers import FastJSONRenderingMixin
+from .revocation import revoke_user_tokens
+from .signing import get_jwks
+from .timing import TimedViewMixin, stage, timed
+from .tokens import DeferredBlacklistCheckRefreshToken, RefreshToken
+from .write_behind import blacklist_token
 
 
 class RefreshTokenUsingCookieMixin:
     """
-    Provides function to handle refresh token that comes from cookie
+    Provides function to handle refresh token that comes from cookie. When REFRESH_HANDLE_STORE_CLASS setting is
+    specified, the cookie contains a handle of the refresh token kept in the store instead of the token itself.
     """
 
     def set_cookie_header_in_response(self, response, refresh_token, refresh_expiry):
+        handle_store = get_refresh_handle_store()
+        if handle_store is not None:
+            with stage("cookie"):
+                handle = handle_store.save(refresh_token, refresh_expiry)
+                return self.set_handle_cookie_in_response(response, handle, refresh_expiry)
+
         expires = datetime.fromtimestamp(refresh_expiry)
 
-        response.set_signed_cookie(key=rest_microservice_settings.REFRESH_COOKIE_NAME,
-                                   value=refresh_token,
-                                   salt=rest_microservice_settings.COOKIE_SALT,
-                                   expires=expires,
-                                   httponly=True, samesite='strict', secure=not settings.DEBUG,
-                                   path=rest_microservice_settings.REFRESH_COOKIE_PATH)
+        with stage("cookie"):
+            response.set_signed_cookie(key=rest_microservice_settings.REFRESH_COOKIE_NAME,
+                                       value=refresh_token,
+                                       salt=rest_microservice_settings.COOKIE_SALT,
+                                       expires=expires,
+                                       httponly=True, samesite='strict', secure=not settings.DEBUG,
+                                       path=rest_microservice_settings.REFRESH_COOKIE_PATH)
+        return response
+
+    async def aset_cookie_header_in_response(self, response, refresh_token, refresh_expiry):
+        handle_store = get_refresh_handle_store()
+        if handle_store is None:
+            return self.set_cookie_header_in_response(response, refresh_token, refresh_expiry)
+
+        with stage("cookie"):
+            handle = await handle_store.asave(refresh_token, refresh_expiry)
+            return self.set_handle_cookie_in_response(response, handle, refresh_expiry)
+
+    @staticmethod
+    def set_handle_cookie_in_response(response, handle, refresh_expiry):
+        # the handle is random and only meaningful to the store, so the cookie does not need to be signed
+        response.set_cookie(key=rest_microservice_settings.REFRESH_COOKIE_NAME,
+                            value=handle,
+                            expires=datetime.fromtimestamp(refresh_expiry),
+                            httponly=True, samesite='strict', secure=not settings.DEBUG,
+                            path=rest_microservice_settings.REFRESH_COOKIE_PATH)
         return response
 
     @staticmethod
+    @timed("cookie")
     def get_token_from_cookie(request):
+        handle_store = get_refresh_handle_store()
+        if handle_store is not None:
+            handle = request.COOKIES.get(rest_microservice_settings.REFRESH_COOKIE_NAME)
+            token = handle_store.get(handle) if handle else None
+            if token is None:
+                raise InvalidToken()
+            return token
+
         try:
             token = request.get_signed_cookie(rest_microservice_settings.REFRESH_COOKIE_NAME,
                                               salt=rest_microservice_settings.COOKIE_SALT)
@@ -38,6 +82,34 @@ class RefreshTokenUsingCookieMixin:
 
         return token
 
+    @classmethod
+    async def aget_token_from_cookie(cls, request):
+        handle_store = get_refresh_handle_store()
+        if handle_store is None:
+            return cls.get_token_from_cookie(request)
+
+        handle = request.COOKIES.get(rest_microservice_settings.REFRESH_COOKIE_NAME)
+        with stage("cookie"):
+            token = await handle_store.aget(handle) if handle else None
+        if token is None:
+            raise InvalidToken()
+        return token
+
+    @staticmethod
+    def delete_refresh_handle(request):
+        """Delete the stored refresh token of the handle in cookie, when refresh handles are used."""
+        handle_store = get_refresh_handle_store()
+        handle = request.COOKIES.get(rest_microservice_settings.REFRESH_COOKIE_NAME)
+        if handle_store is not None and handle:
+            handle_store.delete(handle)
+
+    @staticmethod
+    async def adelete_refresh_handle(request):
+        handle_store = get_refresh_handle_store()
+        handle = request.COOKIES.get(rest_microservice_settings.REFRESH_COOKIE_NAME)
+        if handle_store is not None and handle:
+            await handle_store.adelete(handle)
+
     @staticmethod
     def get_delete_cookie_response(status_code=status.HTTP_401_UNAUTHORIZED):
         response = Response(status=status_code)
@@ -46,7 +118,7 @@ class RefreshTokenUsingCookieMixin:
         return response
 
 
-class TokenLogIn(TokenObtainPairView, RefreshTokenUsingCookieMixin):
+class TokenLogIn(TimedViewMixin, FastJSONRenderingMixin, TokenObtainPairView, RefreshTokenUsingCookieMixin):
     """
     Log in using username and password, returns access token in body, refresh token in httpOnly cookie.
     """
@@ -68,7 +140,7 @@ class TokenLogIn(TokenObtainPairView, RefreshTokenUsingCookieMixin):
         return self.set_cookie_header_in_response(response, refresh_token, refresh_expiry)
 
 
-class RefreshTokenUsingCookie(TokenViewBase, RefreshTokenUsingCookieMixin):
+class RefreshTokenUsingCookie(TimedViewMixin, FastJSONRenderingMixin, TokenViewBase, RefreshTokenUsingCookieMixin):
     """
     Provides an access token when called with a refresh token in header cookie.
     """
@@ -78,26 +150,58 @@ class RefreshTokenUsingCookie(TokenViewBase, RefreshTokenUsingCookieMixin):
         jwt = self.get_token_from_cookie(request)
         serializer = self.get_serializer(data={'refresh': jwt})
 
-        if not serializer.is_valid():
+        try:
+            if not serializer.is_valid():
+                return self.get_delete_cookie_response()
+        except TokenError:
+            # ie: the refresh token has been blacklisted, as in the async view
             return self.get_delete_cookie_response()
 
         response = serializer.make_auth_response()
+        if 'refresh_token' in serializer.validated_data:
+            # the rotated refresh token, also given to the refreshes coalesced with this one
+            return self.set_cookie_header_in_response(response, serializer.validated_data['refresh_token'],
+                                                      serializer.validated_data['refresh_expiry'])
         return response
 
 
-class BlacklistRefreshToken(TokenViewBase, RefreshTokenUsingCookieMixin):
+class BlacklistRefreshToken(TimedViewMixin, TokenViewBase, RefreshTokenUsingCookieMixin):
     """
     Blacklist's refresh token received in header cookie. Used for logging off.
     """
 
     def post(self, request, *args, **kwargs):
         jwt = self.get_token_from_cookie(request)
-        token = RefreshToken(jwt)
-        token.blacklist()
+        # a token already blacklisted by rotation is logged off as well, discarding the tokens coalesced for it
+        token = DeferredBlacklistCheckRefreshToken(jwt)
+        with stage("blacklist"):
+            blacklist_token(token)
+            forget_coalesced_refresh(token[api_settings.JTI_CLAIM])
+            self.delete_refresh_handle(request)
         return self.get_delete_cookie_response(status_code=status.HTTP_200_OK)
 
 
-class SocialLogInExchangeTokens(APIView, RefreshTokenUsingCookieMixin):
+class RevokeAllRefreshTokens(TimedViewMixin, TokenViewBase, RefreshTokenUsingCookieMixin):
+    """
+    Blacklists every refresh token of the user of the refresh token received in header cookie. Used for logging off
+    all devices.
+    """
+
+    def post(self, request, *args, **kwargs):
+        jwt = self.get_token_from_cookie(request)
+        try:
+            token = RefreshToken(jwt)
+        except TokenError:
+            # ie: the refresh token is expired or has been blacklisted, as in the async view
+            return self.get_delete_cookie_response()
+
+        with stage("blacklist"):
+            revoke_user_tokens(token.get("user_id"))
+            self.delete_refresh_handle(request)
+        return self.get_delete_cookie_response(status_code=status.HTTP_200_OK)
+
+
+class SocialLogInExchangeTokens(TimedViewMixin, FastJSONRenderingMixin, APIView, RefreshTokenUsingCookieMixin):
     """
     Used when front-end authenticates directly with auth provider using OAuth2 Code grant with PKCE.
     This end point allows frontend to exchange auth provider JWT for backend-signed tokens.
@@ -114,3 +218,31 @@ class SocialLogInExchangeTokens(APIView, RefreshTokenUsingCookieMixin):
         response = serializer.make_auth_response()
 
         return self.set_cookie_header_in_response(response, refresh_token, refresh_expiry)
+
+
+class TokenVerify(TimedViewMixin, TokenVerifyView):
+    """
+    Verifies a token issued by this service.
+    """
+    serializer_class = CustomTokenVerifySerializer
+
+
+class BatchTokenVerify(TimedViewMixin, TokenViewBase):
+    """
+    Verifies a list of tokens issued by this service in one request, ie: for API gateways.
+    """
+    serializer_class = BatchTokenVerifySerializer
+
+
+class JWKSView(APIView):
+    """
+    Publishes the public keys of SIGNING_KEYS setting as a JWKS document, so that other services can verify tokens
+    issued by this service without calling it.
+    """
+    permission_classes = ()
+    authentication_classes = ()
+
+    def get(self, request, *args, **kwargs):
+        response = Response(get_jwks(), status=status.HTTP_200_OK)
+        response['Cache-Control'] = f"public, max-age={rest_microservice_settings.SIGNING_JWKS_MAX_AGE}"
+        return response
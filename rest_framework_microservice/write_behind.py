@@ -0,0 +1,292 @@
+"""
+Write-behind of auth side-effect writes (last login, IDP uuid sync, refresh token blacklisting and recording of
+rotated refresh tokens).
+When WRITE_BEHIND setting is enabled, these writes are buffered in process and flushed in bulk by a background
+thread, once WRITE_BEHIND_MAX_BATCH_SIZE writes are pending or WRITE_BEHIND_FLUSH_INTERVAL seconds have passed, and
+at interpreter shutdown. Otherwise, they are written immediately as part of the request.
+"""
+import atexit
+import logging
+import threading
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.db import close_old_connections, connections, router
+from django.test.signals import setting_changed
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from .db_routers import apin_user, pin_user
+from .models import Idp
+from .revocation import record_revoked_jti
+from .settings import rest_microservice_settings
+from .tokens import blacklist_installed
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    In-process buffer of pending auth writes. Writes to the same row are coalesced, so only the latest last login
+    of a user or the latest uuid of its IDP link is written.
+    """
+
+    def __init__(self, max_batch_size=500, flush_interval=5.0, synchronous=False):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+
+        self._last_logins = {}
+        self._idp_uuids = {}
+        self._blacklisted_tokens = {}
+        self._outstanding_tokens = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake_up = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._last_logins) + len(self._idp_uuids) + len(self._blacklisted_tokens) \
+            + len(self._outstanding_tokens)
+
+    def add_last_login(self, user_pk, last_login):
+        with self._lock:
+            self._last_logins[user_pk] = last_login
+        self._added()
+
+    def add_idp_uuid(self, user_pk, uuid):
+        with self._lock:
+            self._idp_uuids[user_pk] = uuid
+        self._added()
+
+    def add_blacklisted_token(self, token):
+        with self._lock:
+            self._blacklisted_tokens[token.payload[api_settings.JTI_CLAIM]] = get_outstanding_token_data(token)
+        self._added()
+
+    def add_outstanding_token(self, token):
+        with self._lock:
+            self._outstanding_tokens[token.payload[api_settings.JTI_CLAIM]] = get_outstanding_token_data(token)
+        self._added()
+
+    def _added(self):
+        if self.synchronous:
+            self.flush()
+            return
+
+        self._ensure_started()
+        if len(self) >= self.max_batch_size:
+            self._wake_up.set()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="rest_framework_microservice_write_behind",
+                                                    daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake_up.wait(self.flush_interval)
+            self._wake_up.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush write-behind queue.")
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake_up.set()
+        self.flush()
+
+    def flush(self):
+        """Write all pending writes in bulk."""
+        with self._flush_lock:
+            with self._lock:
+                last_logins, self._last_logins = self._last_logins, {}
+                idp_uuids, self._idp_uuids = self._idp_uuids, {}
+                blacklisted_tokens, self._blacklisted_tokens = self._blacklisted_tokens, {}
+                outstanding_tokens, self._outstanding_tokens = self._outstanding_tokens, {}
+
+            if last_logins:
+                self.write_last_logins(last_logins)
+            if idp_uuids:
+                self.write_idp_uuids(idp_uuids)
+            if blacklisted_tokens:
+                self.write_blacklisted_tokens(blacklisted_tokens)
+            if outstanding_tokens:
+                write_outstanding_tokens(outstanding_tokens, batch_size=self.max_batch_size)
+
+    def write_last_logins(self, last_logins):
+        user_model = get_user_model()
+        users = [user_model(pk=pk, last_login=last_login) for pk, last_login in last_logins.items()]
+        user_model.objects.bulk_update(users, ["last_login"], batch_size=self.max_batch_size)
+
+    def write_idp_uuids(self, idp_uuids):
+        db = router.db_for_write(Idp)
+        idps = [Idp(user_id=user_pk, uuid=uuid) for user_pk, uuid in idp_uuids.items()]
+
+        if getattr(connections[db].features, "supports_update_conflicts_with_target", False):
+            Idp.objects.using(db).bulk_create(idps, update_conflicts=True, unique_fields=["user"],
+                                              update_fields=["uuid"], batch_size=self.max_batch_size)
+            return
+
+        existing = Idp.objects.using(db).in_bulk(idp_uuids.keys(), field_name="user_id")
+        for idp in existing.values():
+            idp.uuid = idp_uuids[idp.user_id]
+        Idp.objects.using(db).bulk_update(existing.values(), ["uuid"], batch_size=self.max_batch_size)
+        Idp.objects.using(db).bulk_create([idp for idp in idps if idp.user_id not in existing],
+                                          batch_size=self.max_batch_size)
+
+    def write_blacklisted_tokens(self, blacklisted_tokens):
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+        write_outstanding_tokens(blacklisted_tokens, batch_size=self.max_batch_size)
+
+        outstanding_token_ids = OutstandingToken.objects.filter(jti__in=blacklisted_tokens.keys()) \
+            .values_list("id", flat=True)
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token_id=token_id) for token_id in outstanding_token_ids],
+                                             ignore_conflicts=True, batch_size=self.max_batch_size)
+
+
+def get_outstanding_token_data(token):
+    return {
+        "user_id": token.payload.get(api_settings.USER_ID_CLAIM),
+        "token": str(token),
+        "created_at": token.current_time,
+        "expires_at": datetime_from_epoch(token.payload["exp"]),
+    }
+
+
+def write_outstanding_tokens(outstanding_tokens, batch_size=None):
+    """Add tokens to simplejwt outstanding tokens, given a dictionary of their jti to `get_outstanding_token_data()`."""
+    from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+    user_model = get_user_model()
+    user_id_field = api_settings.USER_ID_FIELD
+    user_ids = {str(token["user_id"]) for token in outstanding_tokens.values() if token["user_id"] is not None}
+    if user_id_field == user_model._meta.pk.name:
+        user_pks = {user_id: user_id for user_id in user_ids}
+    else:
+        user_pks = {
+            str(user_id): pk for user_id, pk in
+            user_model.objects.filter(**{f"{user_id_field}__in": user_ids}).values_list(user_id_field, "pk")
+        }
+
+    OutstandingToken.objects.bulk_create([
+        OutstandingToken(jti=jti, user_id=user_pks.get(str(token["user_id"])), token=token["token"],
+                         created_at=token["created_at"], expires_at=token["expires_at"])
+        for jti, token in outstanding_tokens.items()
+    ], ignore_conflicts=True, batch_size=batch_size)
+
+
+_queue = None
+
+
+def get_write_behind_queue():
+    global _queue
+    if _queue is None:
+        _queue = WriteBehindQueue(max_batch_size=rest_microservice_settings.WRITE_BEHIND_MAX_BATCH_SIZE,
+                                  flush_interval=rest_microservice_settings.WRITE_BEHIND_FLUSH_INTERVAL,
+                                  synchronous=rest_microservice_settings.WRITE_BEHIND_SYNCHRONOUS)
+    return _queue
+
+
+def flush_write_behind_queue():
+    if _queue is not None:
+        _queue.flush()
+
+
+def reset_write_behind_queue(*args, **kwargs):
+    global _queue
+    if kwargs.get("setting", "REST_FRAMEWORK_MICROSERVICE") == "REST_FRAMEWORK_MICROSERVICE" and _queue is not None:
+        _queue.stop()
+        _queue = None
+
+
+setting_changed.connect(reset_write_behind_queue)
+atexit.register(flush_write_behind_queue)
+
+
+def record_last_login(user):
+    """Update last login of user to now."""
+    pin_user(user.pk)
+    if not rest_microservice_settings.WRITE_BEHIND:
+        update_last_login(None, user)
+        return
+
+    user.last_login = timezone.now()
+    get_write_behind_queue().add_last_login(user.pk, user.last_login)
+
+
+async def arecord_last_login(user):
+    if not rest_microservice_settings.WRITE_BEHIND:
+        await apin_user(user.pk)
+        user.last_login = timezone.now()
+        await user.asave(update_fields=['last_login'])
+        return
+
+    record_last_login(user)
+
+
+def record_idp_uuid(user, uuid):
+    """Link user to its IDP uuid."""
+    if not rest_microservice_settings.WRITE_BEHIND:
+        Idp.objects.update_or_create(user=user, defaults={"uuid": uuid})
+        return
+
+    get_write_behind_queue().add_idp_uuid(user.pk, uuid)
+
+
+def blacklist_token(token):
+    """
+    Add refresh token to simplejwt blacklist. With write-behind, the token is only rejected once the queue has been
+    flushed, ie: up to WRITE_BEHIND_FLUSH_INTERVAL seconds later.
+    """
+    if not rest_microservice_settings.WRITE_BEHIND:
+        token.blacklist()
+        pin_user(token.get("user_id"))
+        return
+
+    if not blacklist_installed():
+        raise AttributeError(f"'{type(token).__name__}' object has no attribute 'blacklist'")
+
+    get_write_behind_queue().add_blacklisted_token(token)
+    record_revoked_jti(token.payload[api_settings.JTI_CLAIM])
+    pin_user(token.get("user_id"))
+
+
+def record_outstanding_token(token):
+    """
+    Add refresh token minted by rotation to simplejwt outstanding tokens, so that it is revoked with the other tokens
+    of its user, see `revoke_user_tokens`.
+    """
+    if not blacklist_installed():
+        return
+
+    if not rest_microservice_settings.WRITE_BEHIND:
+        write_outstanding_tokens({token.payload[api_settings.JTI_CLAIM]: get_outstanding_token_data(token)})
+        return
+
+    get_write_behind_queue().add_outstanding_token(token)
+
+
+async def arecord_outstanding_token(token):
+    if blacklist_installed() and not rest_microservice_settings.WRITE_BEHIND:
+        await sync_to_async(record_outstanding_token)(token)
+        return
+
+    record_outstanding_token(token)
+
+
+async def ablacklist_token(token):
+    if not rest_microservice_settings.WRITE_BEHIND:
+        await token.ablacklist()
+        await apin_user(token.get("user_id"))
+        return
+
+    blacklist_token(token)
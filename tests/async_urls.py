@@ -0,0 +1,12 @@
+from django.urls import path
+from rest_framework_microservice.async_views import AsyncBlacklistRefreshToken, AsyncRefreshTokenUsingCookie, \
+    AsyncRevokeAllRefreshTokens, AsyncSocialLogInExchangeTokens, AsyncTokenLogIn
+
+# rest_framework_microservice.urls picks its views once, when ASYNC_VIEWS is read at import
+urlpatterns = [
+    path("auth/sign-in/", AsyncTokenLogIn.as_view()),
+    path("auth/social-exchange/", AsyncSocialLogInExchangeTokens.as_view()),
+    path("auth/refresh/", AsyncRefreshTokenUsingCookie.as_view()),
+    path("auth/logoff/", AsyncBlacklistRefreshToken.as_view()),
+    path("auth/logoff-all/", AsyncRevokeAllRefreshTokens.as_view()),
+]
@@ -0,0 +1,21 @@
+SECRET_KEY = "rest-framework-microservice-tests"
+
+INSTALLED_APPS = [
+    "django.contrib.contenttypes",
+    "django.contrib.auth",
+    "rest_framework",
+    "rest_framework_simplejwt.token_blacklist",
+    "rest_framework_microservice",
+]
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    },
+}
+
+ROOT_URLCONF = "tests.urls"
+USE_TZ = True
+MIDDLEWARE = []
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
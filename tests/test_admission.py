@@ -0,0 +1,77 @@
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework.exceptions import Throttled
+from rest_framework.test import APIClient
+from rest_framework_microservice.admission import SignInAdmissionController, TokenBucket, parse_rate
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("5/min"), (5, 60))
+        self.assertEqual(parse_rate("100/hour"), (100, 3600))
+        with self.assertRaises(ImproperlyConfigured):
+            parse_rate("5 per minute")
+
+    def test_bucket_is_emptied_and_refilled(self):
+        bucket = TokenBucket(2, 60)
+        with mock.patch("rest_framework_microservice.admission.time.time", return_value=1000.0):
+            self.assertIsNone(bucket.consume("key"))
+            self.assertIsNone(bucket.consume("key"))
+            self.assertAlmostEqual(bucket.consume("key"), 30.0)
+            # other keys have their own bucket
+            self.assertIsNone(bucket.consume("other"))
+
+        with mock.patch("rest_framework_microservice.admission.time.time", return_value=1030.0):
+            self.assertIsNone(bucket.consume("key"))
+
+    def test_shared_bucket(self):
+        bucket, other_process = TokenBucket(1, 60, cache_alias="default"), TokenBucket(1, 60, cache_alias="default")
+        self.assertIsNone(bucket.consume("shared"))
+        self.assertIsNotNone(other_process.consume("shared"))
+
+
+class SignInAdmissionControllerTests(SimpleTestCase):
+
+    def test_rate_is_limited_per_username(self):
+        controller = SignInAdmissionController(rate="1/min")
+        request = RequestFactory().post("/auth/sign-in/", REMOTE_ADDR="10.0.0.1")
+
+        with controller.admit(request, "jane"):
+            pass
+        with self.assertRaises(Throttled):
+            with controller.admit(RequestFactory().post("/auth/sign-in/", REMOTE_ADDR="10.0.0.2"), "jane"):
+                pass
+
+    def test_concurrency_is_bounded(self):
+        controller = SignInAdmissionController(max_concurrency=1)
+        request = RequestFactory().post("/auth/sign-in/")
+
+        with controller.admit(request, "jane"):
+            with self.assertRaises(Throttled):
+                with controller.admit(request, "john"):
+                    pass
+
+        with controller.admit(request, "john"):
+            pass
+
+
+@override_settings(REST_FRAMEWORK_MICROSERVICE={"SIGN_IN_RATE": "2/min", "PASSWORD_HASHING_POOL": True})
+class SignInTests(TransactionTestCase):
+    """Transaction test case, as passwords are checked by the password hashing threads."""
+
+    def setUp(self):
+        get_user_model().objects.create_user(username="jane", password="secret")
+
+    def test_sign_ins_over_rate_are_rejected(self):
+        client = APIClient()
+        credentials = {"username": "jane", "password": "secret"}
+
+        self.assertEqual(client.post("/auth/sign-in/", credentials).status_code, 200)
+        self.assertEqual(client.post("/auth/sign-in/", {**credentials, "password": "wrong"}).status_code, 401)
+
+        response = client.post("/auth/sign-in/", credentials)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
@@ -0,0 +1,83 @@
+from unittest import mock
+import django
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_microservice.settings import rest_microservice_settings
+from rest_framework_microservice.social_auth.providers import ProviderRegistry
+from rest_framework_microservice.tokens import RefreshToken
+from .test_providers import make_id_token, make_provider
+
+COOKIE_NAME = "refresh_cookie"
+
+
+class AsyncViewsSettingTests(SimpleTestCase):
+
+    @override_settings(REST_FRAMEWORK_MICROSERVICE={"ASYNC_VIEWS": True})
+    def test_async_views_require_django_4_2(self):
+        with mock.patch.object(django, "VERSION", (4, 1, 0, "final", 0)):
+            with self.assertRaises(ImproperlyConfigured):
+                rest_microservice_settings.ASYNC_VIEWS
+
+
+@override_settings(ROOT_URLCONF="tests.async_urls", REST_FRAMEWORK_MICROSERVICE={"ASYNC_VIEWS": True})
+class AsyncViewsTests(TransactionTestCase):
+    """Transaction test case, as passwords are checked by the password hashing threads."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="jane", email="jane@example.com", password="secret")
+
+    async def sign_in(self, password="secret"):
+        return await self.async_client.post("/auth/sign-in/", {"username": "jane", "password": password})
+
+    async def test_sign_in_sets_refresh_cookie(self):
+        response = await self.sign_in()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access_token", response.json())
+        self.assertTrue(response.cookies[COOKIE_NAME].value)
+        self.assertEqual((await self.sign_in(password="wrong")).status_code, 401)
+
+    async def test_refresh_and_log_off(self):
+        await self.sign_in()
+        cookie = self.async_client.cookies[COOKIE_NAME].value
+
+        response = await self.async_client.post("/auth/refresh/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access_token", response.json())
+
+        response = await self.async_client.post("/auth/logoff/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await BlacklistedToken.objects.acount(), 1)
+
+        self.assertEqual(response.cookies[COOKIE_NAME].value, "")
+        self.async_client.cookies[COOKIE_NAME] = cookie
+        self.assertEqual((await self.async_client.post("/auth/refresh/")).status_code, 401)
+
+    async def test_log_off_all_revokes_every_token_of_user(self):
+        await self.sign_in()
+        cookie = self.async_client.cookies[COOKIE_NAME].value
+        other_token = await sync_to_async(RefreshToken.for_user)(self.user)
+
+        self.assertEqual((await self.async_client.post("/auth/logoff-all/")).status_code, 200)
+        self.assertTrue(await BlacklistedToken.objects.filter(token__jti=other_token["jti"]).aexists())
+
+        self.async_client.cookies[COOKIE_NAME] = cookie
+        self.assertEqual((await self.async_client.post("/auth/logoff-all/")).status_code, 401)
+
+    async def test_social_exchange(self):
+        provider, key = make_provider()
+        with mock.patch("rest_framework_microservice.async_views.get_provider_registry",
+                        return_value=ProviderRegistry([provider])):
+            response = await self.async_client.post("/auth/social-exchange/", {
+                "id_token": make_id_token(key, email="jane@example.com", email_verified=True),
+                "access_token": "access", "refresh_token": "refresh"})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.cookies[COOKIE_NAME].value)
+            self.assertEqual(await get_user_model().objects.acount(), 1)
+
+            response = await self.async_client.post("/auth/social-exchange/", {
+                "id_token": "garbage", "access_token": "access", "refresh_token": "refresh"})
+            self.assertEqual(response.status_code, 401)
@@ -0,0 +1,55 @@
+import copy
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_microservice.authentication import CachedJWTTokenUserAuthentication
+from rest_framework_microservice.models import SlottedTokenUser
+from rest_framework_microservice.tokens import AccessToken
+
+
+@override_settings(REST_FRAMEWORK_MICROSERVICE={"CUSTOM_TOKEN_USER_ATTRIBUTES": ["email"]})
+class CachedJWTTokenUserAuthenticationTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="jane", email="jane@example.com")
+        token = AccessToken.for_user(self.user)
+        token["email"] = self.user.email
+        self.request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def authenticate(self):
+        return CachedJWTTokenUserAuthentication().authenticate(self.request)
+
+    def test_slotted_user_is_immutable_and_shared(self):
+        user, validated_token = self.authenticate()
+
+        self.assertIsInstance(user, SlottedTokenUser)
+        self.assertFalse(hasattr(user, "__dict__"))
+        self.assertEqual((user.pk, user.email, user.is_authenticated), (str(self.user.pk), "jane@example.com", True))
+        self.assertEqual(user, TokenUser(validated_token))
+        with self.assertRaises(AttributeError):
+            user.email = "john@example.com"
+
+        self.assertIs(self.authenticate()[0], user)
+        self.assertEqual(copy.copy(user).email, user.email)
+
+    def test_users_of_other_classes_are_made_for_each_request(self):
+        with mock.patch.object(api_settings, "TOKEN_USER_CLASS", type("OtherTokenUser", (TokenUser,), {})):
+            user, validated_token = self.authenticate()
+            user.email = "john@example.com"
+            validated_token["email"] = "john@example.com"
+
+            other_user, other_token = self.authenticate()
+            self.assertIsNot(other_user, user)
+            self.assertIs(other_user.token, other_token)
+            self.assertEqual(other_user.email, "jane@example.com")
+
+    def test_each_request_is_given_its_own_validated_token(self):
+        user, validated_token = self.authenticate()
+        validated_token["email"] = "john@example.com"
+
+        other_user, other_token = self.authenticate()
+        self.assertIsNot(other_token, validated_token)
+        self.assertEqual(other_token["email"], "jane@example.com")
+        self.assertEqual(user.token["email"], "jane@example.com")
@@ -0,0 +1,87 @@
+import time
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from rest_framework_microservice.cache import ExpiringLRUCache
+from rest_framework_microservice.social_auth.providers import ProviderRegistry, get_verified_token_cache
+from .test_providers import make_id_token, make_provider
+
+
+class ExpiringLRUCacheTests(SimpleTestCase):
+
+    def test_entries_expire_at_their_timestamp(self):
+        cache = ExpiringLRUCache(10)
+        cache.set("a", 1, expires_at=time.time() + 60)
+        cache.set("b", 2)
+
+        self.assertEqual(cache.get("a"), 1)
+        with mock.patch("rest_framework_microservice.cache.time.time", return_value=time.time() + 61):
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("a", "default"), "default")
+            self.assertEqual(cache.get("b"), 2)
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.stats(), {"hits": 2, "misses": 2, "evictions": 0, "size": 1, "maxsize": 10})
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ExpiringLRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+        # setting an existing entry makes it the most recently used
+        cache.set("a", 4)
+        cache.set("d", 5)
+        self.assertIsNone(cache.get("c"))
+        self.assertEqual(cache.get("a"), 4)
+
+    def test_cache_of_size_zero_holds_nothing(self):
+        cache = ExpiringLRUCache(0)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_entries_are_deleted_and_cleared(self):
+        cache = ExpiringLRUCache(10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+
+        cache.delete("a")
+        cache.delete("missing")
+        self.assertIsNone(cache.get("a"))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+@override_settings(REST_FRAMEWORK_MICROSERVICE={"ID_TOKEN_CACHE_SIZE": 10})
+class VerifiedTokenCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        provider, self.key = make_provider()
+        self.registry = ProviderRegistry([provider])
+        self.verify_token = mock.patch.object(provider, "verify_token", wraps=provider.verify_token).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_token_is_verified_once(self):
+        token = make_id_token(self.key)
+
+        claims = self.registry.decode_token(token)
+        claims["sub"] = "changed"
+        self.assertEqual(self.registry.decode_token(token)["idp_sub"], "1234")
+        self.assertNotEqual(self.registry.decode_token(token)["sub"], "changed")
+
+        self.verify_token.assert_called_once_with(token)
+        self.assertEqual(get_verified_token_cache().stats()["hits"], 2)
+
+    def test_token_is_verified_again_once_expired(self):
+        exp = int(time.time()) + 60
+        token = make_id_token(self.key, exp=exp)
+        self.registry.decode_token(token)
+
+        with mock.patch("rest_framework_microservice.cache.time.time", return_value=exp):
+            self.assertEqual(self.registry.decode_token(token)["idp_sub"], "1234")
+        self.assertEqual(self.verify_token.call_count, 2)
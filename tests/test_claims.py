@@ -0,0 +1,120 @@
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_microservice.claims import ClaimsBuilder, UserClaimsCache, get_claims_cache
+from rest_framework_microservice.settings import rest_microservice_settings
+from rest_framework_microservice.tokens import AccessToken, RefreshToken
+
+
+def get_group_names(user):
+    return sorted(group.name for group in user.groups.all())
+
+
+def get_group_count(user):
+    return len(user.groups.all())
+
+
+class ClaimsBuilderTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="jane", email="jane@example.com")
+        self.user.groups.add(Group.objects.create(name="b"), Group.objects.create(name="a"))
+        self.user = get_user_model().objects.get(pk=self.user.pk)
+
+    def test_user_attributes_and_getters_are_built(self):
+        builder = ClaimsBuilder(["email", "missing"], [
+            {"attr_name": "groups", "attr_getter": "tests.test_claims.get_group_names"},
+            {"attr_name": "username", "attr_getter": lambda user: user.username.upper()},
+        ])
+
+        self.assertEqual(builder.claim_names, ("email", "missing", "groups", "username"))
+        self.assertEqual(builder.build(self.user), {"email": "jane@example.com", "missing": None,
+                                                    "groups": ["a", "b"], "username": "JANE"})
+
+    def test_related_objects_are_prefetched_once_for_all_getters(self):
+        builder = ClaimsBuilder([], [
+            {"attr_name": "groups", "attr_getter": get_group_names, "prefetch_related": ["groups"]},
+            {"attr_name": "group_count", "attr_getter": get_group_count, "prefetch_related": ["groups"]},
+        ])
+        self.assertEqual(builder.prefetch_related, ("groups",))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(builder.build(self.user), {"groups": ["a", "b"], "group_count": 2})
+
+    def test_invalid_callable_attributes_are_rejected(self):
+        for attr in ({"attr_name": "groups"}, "groups"):
+            with self.subTest(attr=attr), self.assertRaises(ImproperlyConfigured):
+                ClaimsBuilder([], [attr])
+
+        with self.assertRaises(ImportError):
+            ClaimsBuilder([], [{"attr_name": "groups", "attr_getter": "tests.test_claims.missing"}])
+
+    @override_settings(REST_FRAMEWORK_MICROSERVICE={"CUSTOM_TOKEN_USER_ATTRIBUTES": ["email"]})
+    def test_builder_is_compiled_from_settings(self):
+        builder = rest_microservice_settings.claims_builder
+        self.assertIs(rest_microservice_settings.claims_builder, builder)
+        self.assertEqual(builder.claim_names, ("email",))
+
+
+class UserClaimsCacheTests(TestCase):
+
+    def test_claims_are_shared_by_processes(self):
+        claims_cache, other_process = UserClaimsCache(10, 30, cache_alias="default"), \
+            UserClaimsCache(10, 30, cache_alias="default")
+        claims_cache.set(1, {"email": "jane@example.com"})
+
+        self.assertEqual(other_process.get("1"), {"email": "jane@example.com"})
+        other_process.delete(1)
+        self.assertIsNone(other_process.get(1))
+        self.assertIsNone(UserClaimsCache(10, 30, cache_alias="default").get(1))
+
+    def test_local_claims_expire(self):
+        claims_cache = UserClaimsCache(10, 30)
+        claims_cache.set(1, {"email": "jane@example.com"})
+        self.assertEqual(claims_cache.get(1), {"email": "jane@example.com"})
+
+        with mock.patch("rest_framework_microservice.cache.time.time", return_value=claims_cache.local._data["1"][1]):
+            self.assertIsNone(claims_cache.get(1))
+
+
+@override_settings(REST_FRAMEWORK_MICROSERVICE={"CUSTOM_TOKEN_USER_ATTRIBUTES": ["email"], "CLAIMS_CACHE_SIZE": 10})
+class CachedClaimsRefreshTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="jane", email="jane@example.com")
+        self.client = APIClient()
+
+    def refresh(self):
+        self.client.cookies["refresh_cookie"] = signing.get_cookie_signer(salt="refresh_cookie" + "extra").sign(
+            str(RefreshToken.for_user(self.user)))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/auth/refresh/")
+        self.assertEqual(response.status_code, 200)
+        user_queries = [query for query in queries if get_user_model()._meta.db_table in query["sql"]]
+        return AccessToken(response.data["access_token"]), user_queries
+
+    def test_cached_claims_are_used_without_querying_user(self):
+        access, user_queries = self.refresh()
+        self.assertEqual(access["email"], "jane@example.com")
+        self.assertEqual(len(user_queries), 1)
+
+        access, user_queries = self.refresh()
+        self.assertEqual(access["email"], "jane@example.com")
+        self.assertEqual(user_queries, [])
+
+    def test_claims_are_invalidated_when_user_is_saved(self):
+        self.refresh()
+        self.user.email = "john@example.com"
+        self.user.save()
+
+        self.assertEqual(self.refresh()[0]["email"], "john@example.com")
+
+    def test_cache_is_disabled_by_default(self):
+        with override_settings(REST_FRAMEWORK_MICROSERVICE={}):
+            self.assertIsNone(get_claims_cache())
@@ -0,0 +1,147 @@
+import threading
+import time
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.http import HttpRequest
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_microservice.async_views import AsyncBlacklistRefreshToken, AsyncRefreshTokenUsingCookie
+from rest_framework_microservice.coalescing import RefreshCoalescer
+from rest_framework_microservice.tokens import RefreshToken
+
+COOKIE_NAME = "refresh_cookie"
+# overriding SIMPLE_JWT setting replaces simplejwt api_settings rather than updating the instance used by the package
+rotation = mock.patch.multiple(api_settings, ROTATE_REFRESH_TOKENS=True, BLACKLIST_AFTER_ROTATION=True)
+
+
+def sign_cookie(token):
+    return signing.get_cookie_signer(salt=COOKIE_NAME + "extra").sign(str(token))
+
+
+def unsign_cookie(response):
+    # the signature is timestamped, so cookies signed in different seconds differ
+    request = HttpRequest()
+    request.COOKIES[COOKIE_NAME] = response.cookies[COOKIE_NAME].value
+    return request.get_signed_cookie(COOKIE_NAME, salt="extra")
+
+
+class RefreshCoalescerTests(TestCase):
+
+    def test_local_results_expire_and_can_be_discarded(self):
+        coalescer = RefreshCoalescer(window=30)
+        coalescer.set("jti", {"access": "a"})
+        self.assertEqual(coalescer.get("jti"), {"access": "a"})
+
+        coalescer.delete_many(["jti"])
+        self.assertIsNone(coalescer.get("jti"))
+
+    def test_results_discarded_by_another_process_are_not_served(self):
+        coalescer, other_process = RefreshCoalescer(window=30, cache_alias="default"), \
+            RefreshCoalescer(window=30, cache_alias="default")
+        coalescer.set("jti", {"access": "a"})
+        self.assertEqual(other_process.get("jti"), {"access": "a"})
+
+        other_process.delete_many(["jti"])
+        self.assertIsNone(coalescer.get("jti"))
+
+    def test_lock_serializes_same_jti(self):
+        coalescer = RefreshCoalescer(window=30)
+        inside, overlaps = [], []
+
+        def refresh():
+            with coalescer.lock("jti"):
+                overlaps.append(bool(inside))
+                inside.append(True)
+                threading.Event().wait(0.05)
+                inside.pop()
+
+        threads = [threading.Thread(target=refresh) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(overlaps, [False] * 4)
+        self.assertEqual(coalescer._locks, {})
+
+
+@override_settings(REST_FRAMEWORK_MICROSERVICE={"REFRESH_COALESCING_WINDOW": 30})
+class CoalescedRefreshTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="jane")
+        self.token = RefreshToken.for_user(self.user)
+        self.cookie = sign_cookie(self.token)
+        self.client = APIClient()
+        self.client.cookies[COOKIE_NAME] = self.cookie
+
+    def refresh(self):
+        return self.client.post("/auth/refresh/")
+
+    def replay(self):
+        self.client.cookies[COOKIE_NAME] = self.cookie
+        return self.refresh()
+
+    @rotation
+    def test_refreshes_within_window_get_the_same_tokens(self):
+        first = self.refresh()
+        rotated_token = unsign_cookie(first)
+        second = self.replay()
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.data["access_token"], second.data["access_token"])
+        # the rotated token is set in cookie of every coalesced refresh
+        self.assertNotEqual(rotated_token, str(self.token))
+        self.assertEqual(unsign_cookie(second), rotated_token)
+        self.assertEqual(OutstandingToken.objects.count(), 2)
+
+    @rotation
+    def test_rotated_token_refreshes_after_window(self):
+        self.assertEqual(self.refresh().status_code, 200)
+
+        with mock.patch("rest_framework_microservice.cache.time.time", return_value=time.time() + 31):
+            response = self.refresh()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.replay().status_code, 401)
+
+    @rotation
+    def test_refresh_replayed_after_log_off_is_rejected(self):
+        self.assertEqual(self.refresh().status_code, 200)
+        self.assertEqual(self.client.post("/auth/logoff/").status_code, 200)
+
+        self.assertEqual(self.replay().status_code, 401)
+
+    def test_refresh_replayed_after_log_off_without_rotation_is_rejected(self):
+        self.assertEqual(self.refresh().status_code, 200)
+        self.assertEqual(self.client.post("/auth/logoff/").status_code, 200)
+
+        self.assertEqual(self.replay().status_code, 401)
+
+
+@rotation
+@override_settings(REST_FRAMEWORK_MICROSERVICE={"REFRESH_COALESCING_WINDOW": 30})
+class AsyncCoalescedRefreshTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="jane")
+        self.cookie = sign_cookie(RefreshToken.for_user(self.user))
+
+    def post(self, view):
+        request = AsyncRequestFactory().post("/auth/")
+        request.COOKIES[COOKIE_NAME] = self.cookie
+        return async_to_sync(view.as_view())(request)
+
+    def test_refresh_replayed_after_log_off_is_rejected(self):
+        first = self.post(AsyncRefreshTokenUsingCookie)
+        second = self.post(AsyncRefreshTokenUsingCookie)
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(unsign_cookie(first), unsign_cookie(second))
+
+        self.assertEqual(self.post(AsyncBlacklistRefreshToken).status_code, 200)
+        self.assertEqual(self.post(AsyncRefreshTokenUsingCookie).status_code, 401)
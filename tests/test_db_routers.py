@@ -0,0 +1,97 @@
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_microservice.db_routers import ReplicaRouter, areplica_reads, pin_user, pin_users, replica_reads
+
+REPLICAS = {"DB_REPLICAS": ["replica_a", "replica_b"]}
+
+
+@override_settings(REST_FRAMEWORK_MICROSERVICE=REPLICAS)
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.user_model = get_user_model()
+        self.addCleanup(cache.clear)
+
+    def db_for_read(self):
+        return self.router.db_for_read(self.user_model)
+
+    def test_only_reads_within_replica_reads_go_to_replicas(self):
+        self.assertIsNone(self.db_for_read())
+        with replica_reads(1):
+            self.assertIn(self.db_for_read(), REPLICAS["DB_REPLICAS"])
+        self.assertIsNone(self.db_for_read())
+
+    def test_reads_after_write_go_to_primary_until_block_exits(self):
+        with replica_reads():
+            self.assertIsNone(self.router.db_for_write(self.user_model))
+            self.assertIsNone(self.db_for_read())
+        self.assertIsNone(self.db_for_read())
+
+        with replica_reads():
+            self.assertIsNotNone(self.db_for_read())
+
+    def test_reads_of_pinned_users_go_to_primary(self):
+        pin_user(1)
+        pin_users([2, 3])
+
+        for user_ids in ((1,), (2,), (4, 3)):
+            with self.subTest(user_ids=user_ids), replica_reads(*user_ids):
+                self.assertIsNone(self.db_for_read())
+        with replica_reads(4, None):
+            self.assertIsNotNone(self.db_for_read())
+
+    def test_async_reads_of_pinned_users_go_to_primary(self):
+        async def db_for_read(*user_ids):
+            async with areplica_reads(*user_ids):
+                return self.db_for_read()
+
+        pin_user(1)
+        self.assertIsNone(async_to_sync(db_for_read)(1))
+        self.assertIn(async_to_sync(db_for_read)(2), REPLICAS["DB_REPLICAS"])
+
+    def test_nothing_is_routed_without_replicas(self):
+        with override_settings(REST_FRAMEWORK_MICROSERVICE={}):
+            pin_user(1)
+            with replica_reads(2):
+                self.assertIsNone(self.db_for_read())
+        with replica_reads(1):
+            self.assertIsNotNone(self.db_for_read())
+
+
+# the default database stands in for a replica, so that routed queries can run
+@override_settings(DATABASE_ROUTERS=["rest_framework_microservice.db_routers.ReplicaRouter"],
+                   REST_FRAMEWORK_MICROSERVICE={"DB_REPLICAS": ["default"]})
+class PinningTests(TestCase):
+
+    def setUp(self):
+        get_user_model().objects.create_user(username="jane", password="secret")
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+        self.reads = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def record_read(router, model, **hints):
+            db = db_for_read(router, model, **hints)
+            self.reads.append(db)
+            return db
+
+        mock.patch.object(ReplicaRouter, "db_for_read", record_read).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def refresh(self):
+        self.reads.clear()
+        self.assertEqual(self.client.post("/auth/refresh/").status_code, 200)
+        return self.reads
+
+    def test_users_are_pinned_to_primary_after_sign_in(self):
+        self.assertEqual(self.client.post("/auth/sign-in/", {"username": "jane", "password": "secret"}).status_code,
+                         200)
+
+        self.assertNotIn("default", self.refresh())
+        cache.clear()
+        self.assertIn("default", self.refresh())
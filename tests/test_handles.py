@@ -0,0 +1,79 @@
+import time
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_microservice.handles import CacheRefreshHandleStore, DatabaseRefreshHandleStore, \
+    get_refresh_handle_store
+from rest_framework_microservice.models import RefreshHandle
+from rest_framework_microservice.tokens import RefreshToken
+
+COOKIE_NAME = "refresh_cookie"
+STORES = ("rest_framework_microservice.handles.DatabaseRefreshHandleStore",
+          "rest_framework_microservice.handles.CacheRefreshHandleStore")
+
+
+class RefreshHandleStoreTests(TestCase):
+
+    def test_tokens_are_stored_under_random_handles(self):
+        for store in (DatabaseRefreshHandleStore(), CacheRefreshHandleStore()):
+            with self.subTest(store=type(store).__name__):
+                handle = store.save("token", time.time() + 60)
+                self.assertNotEqual(store.save("token", time.time() + 60), handle)
+                self.assertEqual(store.get(handle), "token")
+                self.assertIsNone(store.get("missing"))
+
+                store.delete(handle)
+                self.assertIsNone(store.get(handle))
+
+    def test_async_methods_store_tokens(self):
+        for store in (DatabaseRefreshHandleStore(), CacheRefreshHandleStore()):
+            with self.subTest(store=type(store).__name__):
+                handle = async_to_sync(store.asave)("token", time.time() + 60)
+                self.assertEqual(async_to_sync(store.aget)(handle), "token")
+
+                async_to_sync(store.adelete)(handle)
+                self.assertIsNone(async_to_sync(store.aget)(handle))
+
+    def test_expired_tokens_are_not_returned(self):
+        handle = DatabaseRefreshHandleStore().save("token", time.time() - 1)
+        self.assertIsNone(DatabaseRefreshHandleStore().get(handle))
+        self.assertTrue(RefreshHandle.objects.filter(handle=handle).exists())
+
+        self.assertIn(CacheRefreshHandleStore.get_timeout(time.time() + 60), (59, 60))
+        self.assertEqual(CacheRefreshHandleStore.get_timeout(time.time() - 1), 1)
+
+    def test_store_is_made_from_settings(self):
+        self.assertIsNone(get_refresh_handle_store())
+        with override_settings(REST_FRAMEWORK_MICROSERVICE={"REFRESH_HANDLE_STORE_CLASS": STORES[1]}):
+            self.assertIsInstance(get_refresh_handle_store(), CacheRefreshHandleStore)
+
+
+class RefreshHandleCookieTests(TestCase):
+
+    def setUp(self):
+        get_user_model().objects.create_user(username="jane", password="secret")
+        self.client = APIClient()
+
+    def test_cookie_contains_handle_of_stored_token(self):
+        for store_class in STORES:
+            with self.subTest(store=store_class), \
+                    override_settings(REST_FRAMEWORK_MICROSERVICE={"REFRESH_HANDLE_STORE_CLASS": store_class}):
+                response = self.client.post("/auth/sign-in/", {"username": "jane", "password": "secret"})
+                self.assertEqual(response.status_code, 200)
+                handle = response.cookies[COOKIE_NAME].value
+                self.assertLess(len(handle), 40)
+                self.assertEqual(RefreshToken(get_refresh_handle_store().get(handle))["token_type"], "refresh")
+
+                self.assertEqual(self.client.post("/auth/refresh/").status_code, 200)
+                self.assertEqual(self.client.post("/auth/logoff/").status_code, 200)
+                self.assertIsNone(get_refresh_handle_store().get(handle))
+
+                self.client.cookies[COOKIE_NAME] = handle
+                self.assertEqual(self.client.post("/auth/refresh/").status_code, 401)
+
+    @override_settings(REST_FRAMEWORK_MICROSERVICE={"REFRESH_HANDLE_STORE_CLASS": STORES[0]})
+    def test_unknown_handles_are_unauthorized(self):
+        for handle in ("unknown", ""):
+            self.client.cookies[COOKIE_NAME] = handle
+            self.assertEqual(self.client.post("/auth/refresh/").status_code, 401)
@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from django.test import SimpleTestCase
+from requests import HTTPError
+from rest_framework_microservice.social_auth.http import DocumentFetcher
+
+DOCUMENT = {"keys": [{"kid": "a"}]}
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 21 Oct 2015 07:28:00 GMT"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves `DOCUMENT` with the status and `Cache-Control` set on the server, recording the requests made."""
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        status = self.server.status
+        if status == 200 and (self.headers.get("If-None-Match") == ETAG
+                              or self.headers.get("If-Modified-Since") == LAST_MODIFIED):
+            status = 304
+
+        body = json.dumps(DOCUMENT).encode() if status == 200 else b""
+        self.send_response(status)
+        if self.server.cache_control:
+            self.send_header("Cache-Control", self.server.cache_control)
+        if self.server.validators:
+            for header, value in self.server.validators.items():
+                self.send_header(header, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DocumentFetcherTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/.well-known/jwks.json"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.serve(status=200, cache_control="max-age=60", validators={"ETag": ETAG})
+        self.fetcher = DocumentFetcher(timeout=(1, 1), pool_size=1)
+        self.addCleanup(self.fetcher.session.close)
+
+    def serve(self, status=None, cache_control=None, validators=None):
+        self.server.requests = []
+        if status is not None:
+            self.server.status = status
+        if cache_control is not None:
+            self.server.cache_control = cache_control
+        if validators is not None:
+            self.server.validators = validators
+
+    def expire(self):
+        """Move the clock of the fetcher past the lifetime of the documents it holds."""
+        patcher = mock.patch("rest_framework_microservice.social_auth.http.time.monotonic",
+                             return_value=time.monotonic() + 3600)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_document_is_fresh_for_max_age(self):
+        result = self.fetcher.fetch(self.url)
+        self.assertEqual(result.document, DOCUMENT)
+        self.assertEqual(result.max_age, 60)
+        self.assertFalse(result.not_modified)
+
+        self.serve()
+        result = self.fetcher.fetch(self.url)
+        self.assertEqual(result.document, DOCUMENT)
+        self.assertLessEqual(result.max_age, 60)
+        self.assertEqual(self.server.requests, [])
+
+    def test_stale_document_is_revalidated_with_etag(self):
+        self.fetcher.fetch(self.url)
+        self.expire()
+        self.serve()
+
+        result = self.fetcher.fetch(self.url)
+        self.assertTrue(result.not_modified)
+        self.assertEqual(result.document, DOCUMENT)
+        self.assertEqual(result.max_age, 60)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.server.requests[0]["If-None-Match"], ETAG)
+
+    def test_stale_document_is_revalidated_with_last_modified(self):
+        self.serve(validators={"Last-Modified": LAST_MODIFIED})
+        self.fetcher.fetch(self.url)
+        self.expire()
+        self.serve()
+
+        result = self.fetcher.fetch(self.url)
+        self.assertTrue(result.not_modified)
+        self.assertEqual(self.server.requests[0]["If-Modified-Since"], LAST_MODIFIED)
+        self.assertNotIn("If-None-Match", self.server.requests[0])
+
+    def test_forced_fetch_revalidates_fresh_document(self):
+        self.fetcher.fetch(self.url)
+        self.serve()
+
+        self.assertTrue(self.fetcher.fetch(self.url, force=True).not_modified)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_no_cache_and_no_store_documents_are_revalidated_on_each_fetch(self):
+        for cache_control in ("no-cache", "no-store", "max-age=60, no-cache"):
+            with self.subTest(cache_control=cache_control):
+                self.fetcher.clear()
+                self.serve(cache_control=cache_control)
+
+                self.assertEqual(self.fetcher.fetch(self.url).max_age, 0)
+                self.assertEqual(self.fetcher.fetch(self.url).document, DOCUMENT)
+                self.assertEqual(len(self.server.requests), 2)
+
+    def test_stale_document_is_served_when_upstream_errors(self):
+        self.fetcher.fetch(self.url)
+        self.expire()
+        self.serve(status=503)
+
+        result = self.fetcher.fetch(self.url)
+        self.assertEqual(result.document, DOCUMENT)
+        self.assertEqual(result.max_age, 0)
+        self.assertFalse(result.not_modified)
+        self.assertEqual(len(self.server.requests), 1)
+
+        # the document is revalidated again on the next fetch
+        self.serve(status=200)
+        self.assertTrue(self.fetcher.fetch(self.url).not_modified)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stale_document_is_served_when_upstream_is_unreachable(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        server.status, server.cache_control, server.validators, server.requests = 200, "max-age=60", {}, []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/.well-known/jwks.json"
+        self.fetcher.fetch(url)
+        server.shutdown()
+        server.server_close()
+        self.expire()
+
+        self.assertEqual(self.fetcher.fetch(url).document, DOCUMENT)
+
+    def test_errors_are_raised_without_document(self):
+        self.serve(status=503)
+        with self.assertRaises(HTTPError):
+            self.fetcher.fetch(self.url)
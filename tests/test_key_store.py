@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.test import SimpleTestCase
+from jwt.algorithms import RSAAlgorithm
+from rest_framework_microservice.social_auth.key_store import JWKSKeyStore
+
+
+def make_jwk(kid):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return json.dumps({**json.loads(RSAAlgorithm.to_jwk(key.public_key())), "kid": kid, "alg": "RS256"})
+
+
+class FakeJWKS:
+    def __init__(self, *kids, delay=0):
+        self.jwks = {kid: make_jwk(kid) for kid in kids}
+        self.delay = delay
+        self.calls = []
+        self.error = None
+
+    def __call__(self, force=False):
+        self.calls.append(force)
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return dict(self.jwks)
+
+
+class JWKSKeyStoreTests(SimpleTestCase):
+
+    def test_cold_store_fetches_once_for_concurrent_callers(self):
+        jwks = FakeJWKS("a", delay=0.2)
+        store = JWKSKeyStore(jwks)
+        keys = []
+
+        threads = [threading.Thread(target=lambda: keys.append(store.get_key("a"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(jwks.calls, [False])
+        self.assertEqual(len(keys), 8)
+        self.assertTrue(all(key is keys[0] and key is not None for key in keys))
+
+    def test_unknown_kid_refetches_once_per_interval(self):
+        jwks = FakeJWKS("a")
+        store = JWKSKeyStore(jwks, min_refetch_interval=60)
+        store.get_key("a")
+
+        self.assertIsNone(store.get_key("b"))
+        self.assertIsNone(store.get_key("b"))
+        self.assertEqual(jwks.calls, [False])
+
+        store._fetched_at -= 60
+        jwks.jwks["b"] = make_jwk("b")
+        self.assertIsNotNone(store.get_key("b"))
+        self.assertEqual(jwks.calls, [False, True])
+
+    def test_keys_are_served_when_refresh_fails(self):
+        jwks = FakeJWKS("a")
+        store = JWKSKeyStore(jwks, timeout=10, refresh_ahead=0, min_refetch_interval=5)
+        key = store.get_key("a")
+
+        jwks.error = ConnectionError()
+        store._expires_at = 0.0
+        with self.assertLogs("rest_framework_microservice.social_auth.key_store", "ERROR"):
+            self.assertIs(store.get_key("a"), key)
+        # the failed fetch is only retried after the refetch interval
+        self.assertIs(store.get_key("a"), key)
+        self.assertEqual(len(jwks.calls), 2)
+
+    def test_cold_store_raises_when_fetch_fails(self):
+        jwks = FakeJWKS("a")
+        jwks.error = ConnectionError()
+
+        with self.assertRaises(ConnectionError):
+            JWKSKeyStore(jwks).get_key("a")
+
+    def test_preloaded_keys_are_refreshed_in_background(self):
+        jwks = FakeJWKS("a")
+        store = JWKSKeyStore(jwks, refresh_ahead=300)
+        store.preload({"a": jwks.jwks["a"]})
+
+        self.assertIsNotNone(store.get_key("a"))
+        for _ in range(50):
+            if store._fetched_at is not None:
+                break
+            time.sleep(0.01)
+        self.assertEqual(jwks.calls, [False])
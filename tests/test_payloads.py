@@ -0,0 +1,100 @@
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from rest_framework_microservice.payloads import get_user_payload, get_user_payload_cache, invalidate_user_payload, \
+    is_user_needed
+from rest_framework_microservice.tokens import RefreshToken
+
+
+class UserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = get_user_model()
+        fields = ("id", "username", "email")
+
+
+PAYLOAD_CACHE = {"USER_SERIALIZER_CLASS": "tests.test_payloads.UserSerializer", "USER_PAYLOAD_CACHE_SIZE": 10,
+                 "CUSTOM_TOKEN_USER_ATTRIBUTES": ["email"], "CLAIMS_CACHE_SIZE": 10}
+
+
+@override_settings(REST_FRAMEWORK_MICROSERVICE=PAYLOAD_CACHE)
+class UserPayloadCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="jane", email="jane@example.com", password="secret")
+        self.to_representation = mock.patch.object(UserSerializer, "to_representation", autospec=True,
+                                                   side_effect=serializers.ModelSerializer.to_representation).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_user_is_serialized_once(self):
+        payload = {"id": self.user.pk, "username": "jane", "email": "jane@example.com"}
+        self.assertTrue(is_user_needed(self.user.pk))
+
+        self.assertEqual(get_user_payload(self.user), payload)
+        self.assertFalse(is_user_needed(self.user.pk))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_payload(user_id=self.user.pk), payload)
+        self.assertEqual(self.to_representation.call_count, 1)
+
+    def test_payload_is_invalidated_when_its_fields_are_saved(self):
+        get_user_payload(self.user)
+
+        self.user.save(update_fields=["last_login"])
+        self.assertFalse(is_user_needed(self.user.pk))
+
+        self.user.email = "john@example.com"
+        self.user.save(update_fields=["email"])
+        self.assertEqual(get_user_payload(self.user)["email"], "john@example.com")
+
+        self.user.username = "john"
+        self.user.save()
+        self.assertEqual(get_user_payload(self.user)["username"], "john")
+        self.assertEqual(self.to_representation.call_count, 3)
+
+    def test_payload_is_invalidated_when_user_is_deleted_or_explicitly(self):
+        get_user_payload(self.user)
+        invalidate_user_payload(self.user.pk)
+        self.assertTrue(is_user_needed(self.user.pk))
+
+        get_user_payload(self.user)
+        user_id = self.user.pk
+        self.user.delete()
+        self.assertTrue(is_user_needed(user_id))
+
+    def test_refreshes_do_not_query_user_once_cached(self):
+        client = APIClient()
+        self.assertEqual(client.post("/auth/sign-in/", {"username": "jane", "password": "secret"}).status_code, 200)
+
+        client.cookies["refresh_cookie"] = signing.get_cookie_signer(salt="refresh_cookie" + "extra").sign(
+            str(RefreshToken.for_user(self.user)))
+        client.post("/auth/refresh/")
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post("/auth/refresh/")
+
+        self.assertEqual(response.data["user"]["email"], "jane@example.com")
+        self.assertFalse(any(get_user_model()._meta.db_table in query["sql"] for query in queries))
+        self.assertEqual(self.to_representation.call_count, 1)
+
+    def test_shared_payloads_are_versioned(self):
+        shared = {**PAYLOAD_CACHE, "USER_PAYLOAD_CACHE_ALIAS": "default"}
+        with override_settings(REST_FRAMEWORK_MICROSERVICE=shared):
+            get_user_payload(self.user)
+            key = get_user_payload_cache().make_key(self.user.pk)
+        with override_settings(REST_FRAMEWORK_MICROSERVICE={**shared, "USER_PAYLOAD_CACHE_VERSION": 2}):
+            self.assertNotEqual(get_user_payload_cache().make_key(self.user.pk), key)
+            self.assertTrue(is_user_needed(self.user.pk))
+        with override_settings(REST_FRAMEWORK_MICROSERVICE=shared):
+            self.assertFalse(is_user_needed(self.user.pk))
+            invalidate_user_payload(self.user)
+
+    def test_cache_is_disabled_by_default(self):
+        serializer_only = {"USER_SERIALIZER_CLASS": PAYLOAD_CACHE["USER_SERIALIZER_CLASS"]}
+        with override_settings(REST_FRAMEWORK_MICROSERVICE=serializer_only):
+            self.assertIsNone(get_user_payload_cache())
+            get_user_payload(self.user)
+            get_user_payload(self.user)
+        self.assertEqual(self.to_representation.call_count, 2)
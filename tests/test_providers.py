@@ -0,0 +1,86 @@
+import json
+import time
+from unittest import mock
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.test import TestCase
+from jwt import DecodeError
+from jwt.algorithms import RSAAlgorithm
+from rest_framework.test import APIClient
+from rest_framework_microservice.social_auth import aws_cognito
+from rest_framework_microservice.social_auth.providers import CognitoProvider, OIDCProvider, ProviderRegistry
+
+COGNITO_ISSUER = "https://cognito-idp.us-west-2.amazonaws.com/us-west-2_abcdefg"
+ISSUER = "https://idp.example.com"
+
+
+def make_provider(issuer=ISSUER, kid="a"):
+    """OIDC provider holding the public key of the returned private key, so that no JWKS is fetched."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    provider = OIDCProvider(issuer, "client")
+    provider.get_key_store().preload({kid: RSAAlgorithm.to_jwk(key.public_key())})
+    return provider, key
+
+
+def make_id_token(key, kid="a", algorithm="RS256", **claims):
+    claims = {"iss": ISSUER, "aud": "client", "sub": "1234", "exp": int(time.time()) + 300, **claims}
+    return jwt.encode(claims, key, algorithm=algorithm, headers={"kid": kid})
+
+
+class ProviderRegistryTests(TestCase):
+
+    def setUp(self):
+        self.provider, self.key = make_provider()
+        self.registry = ProviderRegistry([self.provider])
+
+    def test_token_is_verified_by_its_provider(self):
+        claims = self.registry.decode_token(make_id_token(self.key))
+
+        self.assertEqual(claims["idp_sub"], "1234")
+        self.assertNotEqual(claims["sub"], "1234")
+
+    def test_email_is_verified_only_when_provider_says_so(self):
+        for email_verified, verified in ((None, False), ("true", False), (True, True)):
+            claims = self.registry.decode_token(make_id_token(self.key, email_verified=email_verified))
+            self.assertIs(claims["email_verified"], verified)
+
+        # user pool emails are trusted unless marked as not verified
+        self.assertNotIn("email_verified", CognitoProvider("us-west-2", "pool", "client").get_claims({"sub": "1234"}))
+
+    def test_tokens_of_unknown_issuers_are_rejected(self):
+        with self.assertRaises(DecodeError):
+            self.registry.decode_token(make_id_token(self.key, iss="https://other.example.com"))
+
+    def test_symmetric_tokens_are_rejected(self):
+        with self.assertRaises(DecodeError):
+            self.registry.decode_token(make_id_token("secret" * 8, algorithm="HS256"))
+
+
+class DeprecatedCognitoHelpersTests(TestCase):
+
+    def test_decode_token_uses_provider_registry(self):
+        provider, key = make_provider()
+        with mock.patch("rest_framework_microservice.social_auth.aws_cognito.get_provider_registry",
+                        return_value=ProviderRegistry([provider])):
+            with self.assertWarns(DeprecationWarning):
+                claims = aws_cognito.decode_token(make_id_token(key))
+
+        self.assertEqual(claims["idp_sub"], "1234")
+
+
+class SocialExchangeTests(TestCase):
+
+    def exchange(self, id_token):
+        return APIClient().post("/auth/social-exchange/", {"id_token": id_token, "access_token": "access",
+                                                           "refresh_token": "refresh"})
+
+    def test_undecodable_token_is_unauthorized(self):
+        self.assertEqual(self.exchange("garbage").status_code, 401)
+
+    def test_token_of_unknown_issuer_is_unauthorized(self):
+        _, key = make_provider()
+        self.assertEqual(self.exchange(make_id_token(key)).status_code, 401)
+
+    def test_symmetric_token_of_known_issuer_is_unauthorized(self):
+        id_token = make_id_token("secret" * 8, algorithm="HS256", iss=COGNITO_ISSUER, aud="abcdefg")
+        self.assertEqual(self.exchange(id_token).status_code, 401)
@@ -0,0 +1,178 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import uuid
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TransactionTestCase, override_settings
+from rest_framework_microservice.bulk_provisioning import provision_idp_users
+from rest_framework_microservice.models import Idp
+from rest_framework_microservice.provisioning import UuidUserProvisioner
+
+IDPS = [
+    {"PROVIDER": "aws", "REGION": "us-west-2", "USER_POOL": "us-west-2_abcdefg", "CLIENT_ID": "abcdefg"},
+    {"PROVIDER": "google", "CLIENT_ID": "1234-abcd.apps.googleusercontent.com"},
+]
+
+
+def make_id_token(email="jane@example.com", sub=None):
+    return {"sub": sub or str(uuid.uuid4()), "email": email, "email_verified": True, "given_name": "Jane",
+            "family_name": "Doe"}
+
+
+class UuidUserProvisionerTests(TransactionTestCase):
+    """
+    Transaction test cases, so that the counts include the BEGIN and COMMIT of the provisioning transaction rather
+    than savepoints of the test case transaction.
+    """
+
+    def setUp(self):
+        self.provisioner = UuidUserProvisioner()
+
+    def test_new_user(self):
+        id_token = make_id_token()
+
+        # SELECT by uuid, BEGIN, get_or_create SELECT, SAVEPOINT, INSERT user, RELEASE, INSERT idp, COMMIT
+        with self.assertNumQueries(8):
+            user = self.provisioner.provision(id_token)
+
+        self.assertEqual(user.email, id_token["email"])
+        self.assertIsNotNone(user.last_login)
+        self.assertEqual(str(user.idp.uuid), id_token["sub"])
+
+    def test_returning_user(self):
+        id_token = make_id_token()
+        user = self.provisioner.provision(id_token)
+        last_login = user.last_login
+
+        # SELECT by uuid, UPDATE last login
+        with self.assertNumQueries(2):
+            returning = self.provisioner.provision(id_token)
+
+        self.assertEqual(returning.pk, user.pk)
+        self.assertGreater(returning.last_login, last_login)
+        self.assertEqual(Idp.objects.count(), 1)
+
+    def test_email_linked_user(self):
+        user = get_user_model().objects.create(username="jane", email="jane@example.com")
+        id_token = make_id_token()
+
+        # SELECT by uuid, BEGIN, SELECT by email, UPDATE last login, upsert idp, COMMIT
+        with self.assertNumQueries(6):
+            linked = self.provisioner.provision(id_token)
+
+        self.assertEqual(linked.pk, user.pk)
+        self.assertEqual(str(Idp.objects.get(user=user).uuid), id_token["sub"])
+
+        with self.assertNumQueries(2):
+            self.provisioner.provision(id_token)
+
+    def test_user_whose_uuid_changed_is_relinked(self):
+        user = self.provisioner.provision(make_id_token())
+        id_token = make_id_token()
+
+        self.assertEqual(self.provisioner.provision(id_token).pk, user.pk)
+        self.assertEqual(str(Idp.objects.get(user=user).uuid), id_token["sub"])
+
+    @override_settings(REST_FRAMEWORK_MICROSERVICE={"IDPS": IDPS})
+    def test_user_signing_in_with_another_provider_is_not_relinked(self):
+        id_token = make_id_token()
+        user = self.provisioner.provision(id_token)
+        other_provider_id_token = make_id_token()
+
+        for _ in range(2):
+            self.assertEqual(self.provisioner.provision(other_provider_id_token).pk, user.pk)
+            self.assertEqual(str(Idp.objects.get(user=user).uuid), id_token["sub"])
+
+        # SELECT by uuid, UPDATE last login
+        with self.assertNumQueries(2):
+            self.provisioner.provision(id_token)
+
+
+class ProvisionIdpUsersTests(TransactionTestCase):
+
+    def test_users_are_created_by_batches_and_left_unchanged_when_run_again(self):
+        id_tokens = [make_id_token(email=f"user{i}@example.com") for i in range(5)]
+        progress = []
+
+        counts = provision_idp_users(id_tokens, batch_size=2, progress=lambda read, counts: progress.append(read))
+
+        self.assertEqual(counts, {"created": 5, "linked": 0, "updated": 0, "unchanged": 0, "skipped": 0})
+        self.assertEqual(progress, [2, 4, 5])
+        self.assertEqual(sorted(str(uuid) for uuid in Idp.objects.values_list("uuid", flat=True)),
+                         sorted(id_token["sub"] for id_token in id_tokens))
+        self.assertEqual(provision_idp_users(iter(id_tokens), batch_size=2)["unchanged"], 5)
+
+    def test_names_of_existing_users_are_updated(self):
+        id_token = make_id_token()
+        user = UuidUserProvisioner().provision(id_token)
+
+        counts = provision_idp_users([{**id_token, "given_name": "Janet"}])
+
+        self.assertEqual(counts["updated"], 1)
+        user.refresh_from_db()
+        self.assertEqual((user.first_name, user.last_name), ("Janet", "Doe"))
+
+    def test_invalid_and_conflicting_users_are_skipped(self):
+        get_user_model().objects.create(username="taken@example.com", email="other@example.com")
+        repeated = make_id_token(email="repeated@example.com")
+        id_tokens = [make_id_token(sub="not-a-uuid"), {**make_id_token(), "email": ""},
+                     make_id_token(email="taken@example.com"), {**repeated, "given_name": "First"}, repeated,
+                     make_id_token(email="repeated@example.com")]
+
+        counts = provision_idp_users(id_tokens)
+
+        self.assertEqual((counts["created"], counts["skipped"]), (1, 4))
+        # the last row of a user wins, and another user with the same email is skipped
+        self.assertEqual(get_user_model().objects.get(idp__uuid=repeated["sub"]).first_name, "Jane")
+
+    def test_command_reads_csv_exports(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "users.csv")
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=make_id_token().keys())
+                writer.writeheader()
+                writer.writerows([make_id_token(email="jane@example.com"), make_id_token(email="john@example.com")])
+
+            stdout = io.StringIO()
+            call_command("provision_idp_users", path, "--batch-size", "1", stdout=stdout)
+
+        self.assertIn("Read 2 users", stdout.getvalue())
+        self.assertIn("Provisioned users: 2 created", stdout.getvalue())
+        self.assertEqual(Idp.objects.count(), 2)
+
+    def test_command_errors(self):
+        for args in (["missing.jsonl"], ["-", "--issuer", "https://other.example.com"]):
+            with self.subTest(args=args), mock.patch("sys.stdin", io.StringIO()), self.assertRaises(CommandError):
+                call_command("provision_idp_users", *args, stdout=io.StringIO())
+
+    def test_users_whose_uuid_changed_are_relinked(self):
+        linked = UuidUserProvisioner().provision(make_id_token())
+        id_tokens = [make_id_token()]
+
+        self.assertEqual(provision_idp_users(id_tokens)["linked"], 1)
+        self.assertEqual(str(Idp.objects.get(user=linked).uuid), id_tokens[0]["sub"])
+
+    @override_settings(REST_FRAMEWORK_MICROSERVICE={"IDPS": IDPS})
+    def test_users_linked_with_another_provider_are_not_relinked(self):
+        linked = UuidUserProvisioner().provision(make_id_token())
+        get_user_model().objects.create(username="john", email="john@example.com")
+        id_tokens = [make_id_token(), make_id_token(email="john@example.com")]
+
+        counts = provision_idp_users(id_tokens)
+
+        self.assertEqual((counts["linked"], counts["updated"] + counts["unchanged"]), (1, 1))
+        self.assertNotEqual(str(Idp.objects.get(user=linked).uuid), id_tokens[0]["sub"])
+        self.assertEqual(str(Idp.objects.get(user__username="john").uuid), id_tokens[1]["sub"])
+
+    def test_command_leaves_standard_input_open(self):
+        stdin = io.StringIO(json.dumps(make_id_token()) + "\n")
+
+        with mock.patch("sys.stdin", stdin):
+            call_command("provision_idp_users", "-", stdout=io.StringIO())
+
+        self.assertFalse(stdin.closed)
+        self.assertEqual(Idp.objects.count(), 1)
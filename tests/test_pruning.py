@@ -0,0 +1,92 @@
+import uuid
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_microservice.models import RefreshHandle
+from rest_framework_microservice.pruning import prune_expired_refresh_handles, prune_expired_tokens
+
+
+def outstanding_tokens(count, expires_in):
+    tokens = OutstandingToken.objects.bulk_create([
+        OutstandingToken(jti=uuid.uuid4().hex, token="token", expires_at=timezone.now() + expires_in)
+        for _ in range(count)])
+    return sorted(OutstandingToken.objects.filter(jti__in=[token.jti for token in tokens]), key=lambda t: t.id)
+
+
+def refresh_handles(count, expires_in):
+    RefreshHandle.objects.bulk_create([
+        RefreshHandle(handle=uuid.uuid4().hex, token="token", expires_at=timezone.now() + expires_in)
+        for _ in range(count)])
+
+
+class PruneExpiredTokensTests(TestCase):
+
+    def test_only_expired_tokens_and_their_blacklist_entries_are_deleted(self):
+        expired = outstanding_tokens(5, -timedelta(minutes=1))
+        valid = outstanding_tokens(3, timedelta(days=1))
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in expired[:2] + valid[:1]])
+        batches = []
+
+        deleted, last_id = prune_expired_tokens(batch_size=2, sleep=0, progress=lambda *args: batches.append(args))
+
+        self.assertEqual(deleted, 5)
+        self.assertEqual(last_id, expired[-1].id)
+        self.assertEqual(batches, [(2, expired[1].id), (4, expired[3].id), (5, expired[4].id)])
+        self.assertQuerySetEqual(OutstandingToken.objects.order_by("id"), valid)
+        self.assertEqual(list(BlacklistedToken.objects.values_list("token", flat=True)), [valid[0].id])
+
+    def test_run_is_resumed_from_start_id(self):
+        expired = outstanding_tokens(6, -timedelta(minutes=1))
+
+        deleted, last_id = prune_expired_tokens(batch_size=2, sleep=0, max_batches=2)
+        self.assertEqual((deleted, last_id), (4, expired[3].id))
+
+        deleted, last_id = prune_expired_tokens(batch_size=2, sleep=0, start_id=last_id)
+        self.assertEqual((deleted, last_id), (2, expired[5].id))
+        self.assertFalse(OutstandingToken.objects.exists())
+
+    def test_expired_refresh_handles_are_deleted(self):
+        refresh_handles(5, -timedelta(minutes=1))
+        refresh_handles(2, timedelta(days=1))
+
+        self.assertEqual(prune_expired_refresh_handles(batch_size=2, sleep=0), 5)
+        self.assertEqual(RefreshHandle.objects.count(), 2)
+
+
+class PruneTokensCommandTests(TestCase):
+
+    def prune_tokens(self, *args):
+        stdout = StringIO()
+        call_command("prune_tokens", "--sleep", "0", *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_expired_tokens_and_refresh_handles_are_deleted(self):
+        outstanding_tokens(3, -timedelta(minutes=1))
+        refresh_handles(2, -timedelta(minutes=1))
+
+        output = self.prune_tokens("--batch-size", "2")
+
+        self.assertIn("Deleted 3 expired tokens.", output)
+        self.assertIn("Deleted 2 expired refresh handles.", output)
+        self.assertNotIn("--start-id", output)
+        self.assertFalse(OutstandingToken.objects.exists())
+        self.assertFalse(RefreshHandle.objects.exists())
+
+    def test_resume_id_is_printed_when_stopped_by_max_batches(self):
+        expired = outstanding_tokens(5, -timedelta(minutes=1))
+
+        output = self.prune_tokens("--batch-size", "2", "--max-batches", "2")
+        self.assertIn(f"resume with --start-id {expired[3].id}", output)
+
+        output = self.prune_tokens("--batch-size", "2", "--max-batches", "2", "--start-id", str(expired[3].id))
+        self.assertIn("Deleted 1 expired tokens.", output)
+        self.assertNotIn("--start-id", output)
+
+    def test_resume_id_is_not_printed_when_max_batches_deleted_all_tokens(self):
+        outstanding_tokens(4, -timedelta(minutes=1))
+        outstanding_tokens(1, timedelta(days=1))
+
+        self.assertNotIn("--start-id", self.prune_tokens("--batch-size", "2", "--max-batches", "2"))
@@ -0,0 +1,59 @@
+import datetime
+import json
+import uuid
+from decimal import Decimal
+from unittest import mock, skipIf
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_microservice import renderers
+from rest_framework_microservice.renderers import render_json
+
+DATA = {"user": {"id": uuid.UUID(int=1), "joined": datetime.date(2024, 1, 2), "balance": Decimal("1.50"),
+                 "name": "Zoë"}, "expires": 1700000000}
+RENDERED = {"user": {"id": "00000000-0000-0000-0000-000000000001", "joined": "2024-01-02", "balance": 1.5,
+                     "name": "Zoë"}, "expires": 1700000000}
+
+
+class RenderJSONTests(SimpleTestCase):
+
+    @skipIf(renderers.orjson is None, "orjson is not installed")
+    def test_data_is_rendered_with_orjson(self):
+        with mock.patch.object(renderers.orjson, "dumps", wraps=renderers.orjson.dumps) as dumps:
+            rendered = render_json(DATA)
+
+        dumps.assert_called_once()
+        self.assertEqual(json.loads(rendered), RENDERED)
+        self.assertNotIn(b" ", rendered)
+
+    def test_data_is_rendered_without_orjson(self):
+        with mock.patch.object(renderers, "orjson", None):
+            rendered = render_json(DATA)
+
+        self.assertEqual(json.loads(rendered), RENDERED)
+        self.assertIn("Zoë".encode(), rendered)
+        self.assertNotIn(b" ", rendered)
+
+
+class FastJSONRenderingTests(TestCase):
+
+    def setUp(self):
+        get_user_model().objects.create_user(username="jane", password="secret")
+
+    def sign_in(self, **headers):
+        return APIClient().post("/auth/sign-in/", {"username": "jane", "password": "secret"}, **headers)
+
+    @override_settings(REST_FRAMEWORK_MICROSERVICE={"FAST_JSON_RENDERER": True})
+    def test_responses_are_compact_json_regardless_of_accept_header(self):
+        for orjson in (renderers.orjson, None):
+            with self.subTest(orjson=orjson is not None), mock.patch.object(renderers, "orjson", orjson):
+                response = self.sign_in(HTTP_ACCEPT="application/json; indent=4")
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response["Content-Type"], "application/json")
+                self.assertNotIn(b" ", response.content)
+                self.assertIn("access_token", json.loads(response.content))
+
+    def test_content_is_negotiated_when_disabled(self):
+        response = self.sign_in(HTTP_ACCEPT="application/json; indent=4")
+        self.assertIn(b"\n    ", response.content)
@@ -0,0 +1,170 @@
+import time
+import uuid
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_microservice.revocation import BloomFilter, RevokedTokenFilter, get_revoked_jtis, \
+    get_revoked_token_filter, revoke_user_tokens
+from rest_framework_microservice.tokens import RefreshToken
+
+
+def blacklist(count, expires_in=timedelta(days=1)):
+    jtis = [uuid.uuid4().hex for _ in range(count)]
+    tokens = OutstandingToken.objects.bulk_create([
+        OutstandingToken(jti=jti, token=jti, expires_at=timezone.now() + expires_in) for jti in jtis])
+    BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in tokens])
+    return jtis
+
+
+class BloomFilterTests(TestCase):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        items = [uuid.uuid4().hex for _ in range(1000)]
+        for item in items:
+            bloom.add(item)
+
+        self.assertTrue(all(item in bloom for item in items))
+        false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class RevokedTokenFilterTests(TestCase):
+
+    def test_sync_adds_blacklisted_jtis(self):
+        jtis = blacklist(3)
+        revoked_token_filter = RevokedTokenFilter(capacity=100)
+
+        revoked_token_filter.sync()
+        self.assertTrue(all(revoked_token_filter.might_be_revoked(jti) for jti in jtis))
+
+        jtis += blacklist(2)
+        revoked_token_filter.sync(force=True)
+        self.assertTrue(all(revoked_token_filter.might_be_revoked(jti) for jti in jtis))
+        self.assertEqual(revoked_token_filter.syncs, 2)
+
+    def test_expired_tokens_are_not_loaded(self):
+        expired = blacklist(3, expires_in=-timedelta(minutes=1))
+        revoked_token_filter = RevokedTokenFilter(capacity=100)
+
+        revoked_token_filter.sync()
+
+        self.assertEqual(len(revoked_token_filter.bloom), 0)
+        self.assertFalse(any(revoked_token_filter.might_be_revoked(jti) for jti in expired))
+
+    def test_filter_over_capacity_is_resized_and_not_rebuilt_on_every_sync(self):
+        blacklist(20)
+        revoked_token_filter = RevokedTokenFilter(capacity=5)
+
+        revoked_token_filter.sync()
+        bloom = revoked_token_filter.bloom
+        self.assertEqual(bloom.capacity, 40)
+
+        for _ in range(3):
+            revoked_token_filter.sync(force=True)
+        self.assertIs(revoked_token_filter.bloom, bloom)
+
+        # the filter is rebuilt once the blacklist outgrows it
+        blacklist(30)
+        revoked_token_filter.sync(force=True)
+        revoked_token_filter.sync(force=True)
+        self.assertIsNot(revoked_token_filter.bloom, bloom)
+        self.assertEqual(revoked_token_filter.bloom.capacity, 100)
+
+    @override_settings(REST_FRAMEWORK_MICROSERVICE={"REVOCATION_FILTER": True})
+    def test_definitely_not_revoked_tokens_do_not_query(self):
+        revoked = blacklist(3)
+        get_revoked_jtis([])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_revoked_jtis([uuid.uuid4().hex for _ in range(10)]), set())
+        with self.assertNumQueries(1):
+            self.assertEqual(get_revoked_jtis(revoked), set(revoked))
+
+
+@override_settings(REST_FRAMEWORK_MICROSERVICE={"REVOCATION_FILTER": True, "REVOCATION_FILTER_SYNC_INTERVAL": 1})
+class RevokedTokenFilterBackgroundSyncTests(TransactionTestCase):
+
+    def test_stale_filter_is_synced_in_background(self):
+        get_revoked_jtis([])
+        revoked_token_filter = get_revoked_token_filter()
+        jtis = blacklist(2)
+        revoked_token_filter.last_synced_at -= 1
+
+        with self.assertNumQueries(0):
+            get_revoked_jtis([])
+
+        deadline = time.monotonic() + 5
+        while revoked_token_filter.syncs < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(all(revoked_token_filter.might_be_revoked(jti) for jti in jtis))
+
+
+class RevokeUserTokensTests(TestCase):
+
+    def setUp(self):
+        self.user, self.other_user = (get_user_model().objects.create(username=username)
+                                      for username in ("jane", "john"))
+
+    def user_blacklisted_jtis(self, user):
+        return set(BlacklistedToken.objects.filter(token__user=user).values_list("token__jti", flat=True))
+
+    @override_settings(REST_FRAMEWORK_MICROSERVICE={"REVOCATION_FILTER": True})
+    def test_unexpired_tokens_of_user_are_blacklisted(self):
+        tokens = [RefreshToken.for_user(self.user) for _ in range(3)]
+        tokens[0].blacklist()
+        OutstandingToken.objects.filter(jti=tokens[1]["jti"]).update(expires_at=timezone.now() - timedelta(minutes=1))
+        other_token = RefreshToken.for_user(self.other_user)
+        get_revoked_jtis([])
+
+        self.assertEqual(revoke_user_tokens(self.user), 1)
+
+        self.assertEqual(self.user_blacklisted_jtis(self.user), {tokens[0]["jti"], tokens[2]["jti"]})
+        self.assertEqual(self.user_blacklisted_jtis(self.other_user), set())
+        self.assertTrue(get_revoked_token_filter().might_be_revoked(tokens[2]["jti"]))
+        self.assertFalse(get_revoked_token_filter().might_be_revoked(other_token["jti"]))
+
+    def test_users_can_be_given_as_queryset_or_id(self):
+        jtis = [RefreshToken.for_user(user)["jti"] for user in (self.user, self.other_user)]
+
+        self.assertEqual(revoke_user_tokens(get_user_model().objects.filter(pk=self.user.pk)), 1)
+        self.assertEqual(revoke_user_tokens(self.other_user.pk), 1)
+        self.assertEqual(revoke_user_tokens(self.user), 0)
+        self.assertEqual(set(BlacklistedToken.objects.values_list("token__jti", flat=True)), set(jtis))
+
+
+class RevokeAllRefreshTokensTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="jane")
+        self.token = RefreshToken.for_user(self.user)
+        self.client = APIClient()
+        self.client.cookies["refresh_cookie"] = signing.get_cookie_signer(salt="refresh_cookieextra").sign(
+            str(self.token))
+
+    def test_tokens_of_user_are_revoked(self):
+        other_token = RefreshToken.for_user(self.user)
+
+        response = self.client.post("/auth/logoff-all/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies["refresh_cookie"].value, "")
+        self.assertEqual(set(BlacklistedToken.objects.values_list("token__jti", flat=True)),
+                         {self.token["jti"], other_token["jti"]})
+
+    def test_blacklisted_token_is_unauthorized(self):
+        self.token.blacklist()
+
+        response = self.client.post("/auth/logoff-all/")
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.cookies["refresh_cookie"].value, "")
+
+    def test_malformed_token_is_unauthorized(self):
+        self.client.cookies["refresh_cookie"] = signing.get_cookie_signer(salt="refresh_cookieextra").sign("garbage")
+
+        self.assertEqual(self.client.post("/auth/logoff-all/").status_code, 401)
@@ -0,0 +1,99 @@
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_microservice.signing import KeyRingTokenBackend, SigningKey, get_jwks
+from rest_framework_microservice.tokens import AccessToken
+
+
+def private_pem(key):
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption()).decode()
+
+
+def public_pem(key):
+    return key.public_key().public_bytes(serialization.Encoding.PEM,
+                                         serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+
+
+OLD_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+NEW_KEY = ed25519.Ed25519PrivateKey.generate()
+OLD = {"KID": "old", "ALGORITHM": "RS256", "PRIVATE_KEY": private_pem(OLD_KEY)}
+NEW = {"KID": "new", "ALGORITHM": "EdDSA", "PRIVATE_KEY": private_pem(NEW_KEY)}
+RETIRED = {"KID": "old", "ALGORITHM": "RS256", "PUBLIC_KEY": public_pem(OLD_KEY)}
+
+
+def signing_keys(*keys):
+    return override_settings(REST_FRAMEWORK_MICROSERVICE={"SIGNING_KEYS": list(keys), "SIGNING_JWKS_MAX_AGE": 600})
+
+
+def issue_token():
+    token = AccessToken()
+    token["user_id"] = 1
+    return str(token)
+
+
+class KeyRingTokenBackendTests(TestCase):
+
+    def test_tokens_are_signed_by_first_private_key_with_its_kid(self):
+        with signing_keys(RETIRED, NEW, OLD):
+            token = issue_token()
+
+            self.assertEqual(jwt.get_unverified_header(token), {"alg": "EdDSA", "kid": "new", "typ": "JWT"})
+            self.assertEqual(AccessToken(token)["user_id"], 1)
+
+    def test_tokens_of_retired_key_are_verified_until_it_is_removed(self):
+        with signing_keys(OLD, NEW):
+            old_token = issue_token()
+            self.assertEqual(jwt.get_unverified_header(old_token)["kid"], "old")
+
+        with signing_keys(NEW, RETIRED):
+            self.assertEqual(AccessToken(old_token)["user_id"], 1)
+            self.assertEqual(jwt.get_unverified_header(issue_token())["kid"], "new")
+
+        with signing_keys(NEW):
+            with self.assertRaises(TokenError):
+                AccessToken(old_token)
+
+    def test_tokens_with_unknown_or_mismatched_kid_are_rejected(self):
+        with signing_keys(NEW, RETIRED):
+            payload = {"user_id": 1, "token_type": "access", "jti": "a"}
+            for headers in ({"kid": "new"}, {"kid": "other"}, {}):
+                token = jwt.encode(payload, OLD_KEY, algorithm="RS256", headers=headers)
+                with self.subTest(token=token), self.assertRaises(TokenError):
+                    AccessToken(token)
+
+    def test_invalid_keys_are_rejected(self):
+        for key in ({"KID": "a", "ALGORITHM": "HS256", "PRIVATE_KEY": "secret"}, {"KID": "a", "ALGORITHM": "RS256"},
+                    {"ALGORITHM": "RS256", "PRIVATE_KEY": OLD["PRIVATE_KEY"]}):
+            with self.subTest(key=key), self.assertRaises(ImproperlyConfigured):
+                SigningKey.from_setting(key)
+
+        with self.assertRaises(ImproperlyConfigured):
+            KeyRingTokenBackend([SigningKey.from_setting(RETIRED)])
+
+
+class JWKSViewTests(TestCase):
+
+    def test_public_keys_are_published(self):
+        with signing_keys(NEW, RETIRED):
+            token = issue_token()
+            response = APIClient().get("/auth/.well-known/jwks.json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "public, max-age=600")
+        jwks = response.json()
+        self.assertEqual([(key["kid"], key["alg"], key["use"]) for key in jwks["keys"]],
+                         [("new", "EdDSA", "sig"), ("old", "RS256", "sig")])
+        self.assertTrue(all("d" not in key for key in jwks["keys"]))
+
+        # other services can verify tokens with the published keys
+        public_key = jwt.PyJWKSet.from_dict(jwks)[jwt.get_unverified_header(token)["kid"]].key
+        self.assertEqual(jwt.decode(token, public_key, algorithms=["EdDSA"])["user_id"], 1)
+
+    def test_no_keys_are_published_without_signing_keys(self):
+        with override_settings(REST_FRAMEWORK_MICROSERVICE={}):
+            self.assertEqual(get_jwks(), {"keys": []})
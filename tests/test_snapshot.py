@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+from jwt.algorithms import RSAAlgorithm
+from rest_framework_microservice.social_auth.providers import OIDCProvider, ProviderRegistry
+from rest_framework_microservice.social_auth.snapshot import load_jwks_snapshot, warm_up_key_stores
+from .test_providers import ISSUER, make_id_token, make_provider
+
+REGISTRY = "rest_framework_microservice.social_auth.snapshot.get_provider_registry"
+
+
+class JWKSSnapshotTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "jwks.json")
+
+        provider, self.key = make_provider()
+        jwk = json.dumps({**json.loads(RSAAlgorithm.to_jwk(self.key.public_key())), "kid": "a"})
+        mock.patch.object(provider, "fetch_keys", return_value={"a": jwk}).start()
+        self.addCleanup(mock.patch.stopall)
+        self.registry = ProviderRegistry([provider])
+
+    def snapshot_jwks(self, *args):
+        stdout = StringIO()
+        with mock.patch(REGISTRY, return_value=self.registry):
+            call_command("snapshot_jwks", *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_snapshot_keys_verify_tokens_without_fetching_keys(self):
+        self.assertIn(f"Wrote 1 keys to {self.path}.", self.snapshot_jwks("--path", self.path))
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ["jwks.json"])
+
+        provider = OIDCProvider(ISSUER, "client")
+        fetch_keys = mock.patch.object(provider, "fetch_keys", side_effect=AssertionError("keys fetched")).start()
+        with mock.patch(REGISTRY, return_value=ProviderRegistry([provider])):
+            self.assertEqual(load_jwks_snapshot(self.path), 1)
+
+        with mock.patch.object(provider.get_key_store(), "_start_background_refresh"):
+            claims = ProviderRegistry([provider]).decode_token(make_id_token(self.key, sub="snapshot"))
+        self.assertEqual(claims["idp_sub"], "snapshot")
+        fetch_keys.assert_not_called()
+
+    def test_keys_of_unknown_issuers_are_ignored(self):
+        self.snapshot_jwks("--path", self.path)
+
+        with mock.patch(REGISTRY, return_value=ProviderRegistry([OIDCProvider("https://other.example.com", "c")])):
+            self.assertEqual(load_jwks_snapshot(self.path), 0)
+
+    def test_unreadable_snapshot_is_logged(self):
+        with open(self.path, "w") as f:
+            f.write("{")
+
+        for path in (self.path, self.path + ".missing"):
+            with self.subTest(path=path), self.assertLogs("rest_framework_microservice.social_auth.snapshot",
+                                                          "WARNING"):
+                self.assertEqual(load_jwks_snapshot(path), 0)
+
+    def test_command_requires_path(self):
+        with self.assertRaises(CommandError):
+            self.snapshot_jwks()
+
+    def test_key_stores_are_warmed_up_in_background(self):
+        provider = OIDCProvider(ISSUER, "client")
+        fetched = threading.Event()
+        mock.patch.object(provider, "fetch_keys", side_effect=lambda force=False: fetched.set() or {}).start()
+
+        with mock.patch(REGISTRY, return_value=ProviderRegistry([provider])):
+            warm_up_key_stores()
+
+        self.assertTrue(fetched.wait(5))
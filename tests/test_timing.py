@@ -0,0 +1,63 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_microservice.timing import InMemoryMetrics, get_metrics
+
+
+def parse_server_timing(header):
+    return {name: float(duration.partition("=")[2])
+            for name, _, duration in (metric.partition(";") for metric in header.split(", "))}
+
+
+class InMemoryMetricsTests(TestCase):
+
+    def test_timings_are_aggregated_by_name(self):
+        metrics = InMemoryMetrics()
+        metrics.timing("TokenLogIn.total", 0.25)
+        metrics.timing("TokenLogIn.total", 0.75)
+
+        self.assertEqual(metrics.snapshot(), {"TokenLogIn.total": {"count": 2, "total": 1.0, "max": 0.75,
+                                                                   "mean": 0.5}})
+
+
+class ServerTimingTests(TestCase):
+
+    def setUp(self):
+        get_user_model().objects.create_user(username="jane", password="secret")
+
+    def sign_in(self):
+        response = APIClient().post("/auth/sign-in/", {"username": "jane", "password": "secret"})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    @override_settings(REST_FRAMEWORK_MICROSERVICE={"TIMING": True})
+    def test_stages_are_reported_in_header_and_metrics(self):
+        timings = parse_server_timing(self.sign_in()["Server-Timing"])
+
+        self.assertLessEqual({"token_issue", "cookie", "total"}, set(timings))
+        self.assertGreaterEqual(timings["total"], timings["token_issue"])
+        self.assertEqual(get_metrics().snapshot()["TokenLogIn.total"]["count"], 1)
+        self.assertIn("TokenLogIn.cookie", get_metrics().snapshot())
+
+    @override_settings(REST_FRAMEWORK_MICROSERVICE={"TIMING": True, "SERVER_TIMING_HEADER": False})
+    def test_header_can_be_disabled_keeping_metrics(self):
+        self.assertNotIn("Server-Timing", self.sign_in())
+        self.assertEqual(get_metrics().snapshot()["TokenLogIn.total"]["count"], 1)
+
+    @override_settings(REST_FRAMEWORK_MICROSERVICE={"TIMING": False})
+    def test_nothing_is_timed_when_disabled(self):
+        self.assertNotIn("Server-Timing", self.sign_in())
+        self.assertEqual(get_metrics().snapshot(), {})
+
+
+@override_settings(ROOT_URLCONF="tests.async_urls", REST_FRAMEWORK_MICROSERVICE={"ASYNC_VIEWS": True, "TIMING": True})
+class AsyncServerTimingTests(TransactionTestCase):
+
+    async def test_stages_of_async_views_are_reported(self):
+        await sync_to_async(get_user_model().objects.create_user)(username="jane", password="secret")
+        response = await self.async_client.post("/auth/sign-in/", {"username": "jane", "password": "secret"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual({"token_issue", "total"}, set(parse_server_timing(response["Server-Timing"])))
+        self.assertEqual(get_metrics().snapshot()["AsyncTokenLogIn.total"]["count"], 1)
@@ -0,0 +1,59 @@
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_microservice.tokens import RefreshToken
+
+
+@mock.patch.object(api_settings, "BLACKLIST_AFTER_ROTATION", True)
+class BatchTokenVerifyTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="jane")
+
+    def verify(self, tokens):
+        return APIClient().post("/auth/verify-batch/", {"tokens": tokens}, format="json")
+
+    def test_results_are_returned_in_order(self):
+        valid, blacklisted, expired = (RefreshToken.for_user(self.user) for _ in range(3))
+        blacklisted.blacklist()
+        expired.set_exp(lifetime=-timedelta(minutes=1))
+
+        response = self.verify([str(valid), str(blacklisted), "garbage", str(expired)])
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"]
+        self.assertEqual([result["status"] for result in results], ["valid", "blacklisted", "invalid", "expired"])
+        self.assertEqual([result["valid"] for result in results], [True, False, False, False])
+        self.assertEqual(results[0]["claims"]["jti"], valid["jti"])
+        self.assertTrue(all("claims" not in result for result in results[1:]))
+
+    def test_blacklist_is_checked_with_single_query(self):
+        tokens = [str(RefreshToken.for_user(self.user)) for _ in range(5)]
+
+        with self.assertNumQueries(1):
+            response = self.verify(tokens)
+        self.assertEqual([result["status"] for result in response.data["results"]], ["valid"] * 5)
+
+    def test_duplicate_tokens_are_verified_once(self):
+        token = str(RefreshToken.for_user(self.user))
+
+        with mock.patch("rest_framework_microservice.serializers.UntypedToken", wraps=RefreshToken) as untyped_token:
+            response = self.verify([token, "garbage", token])
+
+        self.assertEqual([result["status"] for result in response.data["results"]], ["valid", "invalid", "valid"])
+        self.assertEqual(untyped_token.call_count, 2)
+
+    @override_settings(REST_FRAMEWORK_MICROSERVICE={"VERIFY_BATCH_MAX_SIZE": 2})
+    def test_batches_over_max_size_are_rejected(self):
+        token = str(RefreshToken.for_user(self.user))
+
+        self.assertEqual(self.verify([token] * 2).status_code, 200)
+        response = self.verify([token] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("tokens", response.data)
+
+    def test_empty_batches_are_rejected(self):
+        self.assertEqual(self.verify([]).status_code, 400)
@@ -0,0 +1,116 @@
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_microservice.tokens import RefreshToken
+from rest_framework_microservice import write_behind
+from rest_framework_microservice.write_behind import WriteBehindQueue, blacklist_token, get_write_behind_queue, \
+    record_outstanding_token
+
+
+def make_rotated_token(user):
+    """Refresh token which is not recorded as outstanding, like a token minted by rotation."""
+    token = RefreshToken()
+    token["user_id"] = user.pk
+    return token
+
+
+class WriteBehindQueueTests(TestCase):
+
+    def setUp(self):
+        self.users = [get_user_model().objects.create(username=f"user{i}") for i in range(2)]
+        self.queue = WriteBehindQueue(max_batch_size=100, flush_interval=60)
+
+    def tearDown(self):
+        self.queue._stopped.set()
+        self.queue._wake_up.set()
+
+    def test_last_logins_are_coalesced_and_written_in_bulk(self):
+        now = timezone.now()
+        for user in self.users:
+            self.queue.add_last_login(user.pk, now - timedelta(minutes=1))
+            self.queue.add_last_login(user.pk, now)
+        self.assertEqual(len(self.queue), 2)
+
+        with self.assertNumQueries(1):
+            self.queue.flush()
+
+        self.assertEqual(len(self.queue), 0)
+        self.assertEqual(set(get_user_model().objects.values_list("last_login", flat=True)), {now})
+
+    def test_blacklisted_tokens_are_recorded_and_blacklisted(self):
+        tokens = [make_rotated_token(user) for user in self.users]
+        for token in tokens:
+            self.queue.add_blacklisted_token(token)
+
+        self.queue.flush()
+
+        self.assertEqual(set(BlacklistedToken.objects.values_list("token__jti", "token__user")),
+                         {(token["jti"], token["user_id"]) for token in tokens})
+
+    def test_outstanding_tokens_are_recorded(self):
+        token = make_rotated_token(self.users[0])
+        self.queue.add_outstanding_token(token)
+        self.assertFalse(OutstandingToken.objects.exists())
+
+        self.queue.flush()
+
+        outstanding = OutstandingToken.objects.get()
+        self.assertEqual((outstanding.jti, outstanding.user_id), (token["jti"], self.users[0].pk))
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+    def test_synchronous_queue_writes_immediately(self):
+        queue = WriteBehindQueue(synchronous=True)
+        now = timezone.now()
+
+        queue.add_last_login(self.users[0].pk, now)
+
+        self.assertEqual(len(queue), 0)
+        self.assertIsNone(queue._thread)
+        self.users[0].refresh_from_db()
+        self.assertEqual(self.users[0].last_login, now)
+
+    @override_settings(REST_FRAMEWORK_MICROSERVICE={"WRITE_BEHIND": True, "WRITE_BEHIND_FLUSH_INTERVAL": 60})
+    def test_blacklisted_token_is_rejected_once_flushed(self):
+        token = make_rotated_token(self.users[0])
+        blacklist_token(token)
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+        get_write_behind_queue().flush()
+        with self.assertRaises(TokenError):
+            RefreshToken(str(token)).check_blacklist()
+
+    def test_outstanding_token_is_written_without_queue(self):
+        token = make_rotated_token(self.users[0])
+
+        with self.assertNumQueries(1):
+            record_outstanding_token(token)
+
+        self.assertTrue(OutstandingToken.objects.filter(jti=token["jti"]).exists())
+        self.assertIsNone(write_behind._queue)
+
+
+class WriteBehindFlushTests(TransactionTestCase):
+
+    def test_full_batch_is_flushed_by_background_thread(self):
+        users = [get_user_model().objects.create(username=f"user{i}") for i in range(2)]
+        queue = WriteBehindQueue(max_batch_size=2, flush_interval=60)
+        now = timezone.now()
+
+        try:
+            for user in users:
+                queue.add_last_login(user.pk, now)
+
+            # the database is not queried while the background thread writes, as SQLite would lock the table
+            deadline = time.monotonic() + 5
+            while len(queue) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(queue), 0)
+        finally:
+            # waits for the flush of the background thread
+            queue.stop()
+
+        self.assertEqual(get_user_model().objects.filter(last_login=now).count(), 2)
@@ -0,0 +1,5 @@
+from django.urls import include, path
+
+urlpatterns = [
+    path("auth/", include("rest_framework_microservice.urls")),
+]